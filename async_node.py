@@ -0,0 +1,376 @@
+"""An asyncio based node which serves the same routes and JSON responses as
+node.py as an ASGI application (both nodes use the request handlers of
+utility.node_api).
+
+Request handlers never block the event loop: everything touching the
+blockchain (signature checks, disk writes, peer requests and resolving)
+runs on a thread pool, and proofs of work are searched by background
+mining jobs (on worker processes with -w). So the node keeps answering
+broadcasts while it's mining.
+
+Run it with an ASGI server, e.g. uvicorn:
+
+    python async_node.py -p 3000
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import json
+import os
+import re
+from urllib.parse import parse_qs, unquote
+
+from wallet import Wallet
+from utility import codec, node_api
+
+mining_jobs = OrderedDict()
+# The further Blockchain arguments set by the command line options (see
+# node_api.blockchain_options)
+blockchain_options = {}
+# The number of encoded blocks sent per chunk of a streamed chain
+STREAM_BATCH_SIZE = 200
+# The threads running the blocking blockchain calls
+executor = ThreadPoolExecutor(64)
+routes = []
+
+
+def route(path, methods):
+    """Registers a request handler for a path (with <name> placeholders)
+    and the given methods. """
+    pattern = re.compile('^{}$'.format(
+        re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', path)))
+
+    def register(handler):
+        routes.append((pattern, methods, handler))
+        return handler
+    return register
+
+
+class Request:
+    """The parts of an HTTP request the handlers need.
+
+    Attributes:
+        :method: The HTTP method.
+        :mimetype: The media type of the body (without parameters).
+        :body: The raw request body.
+        :query (private): The parsed query string.
+        :headers (private): The headers by lower case name.
+    """
+
+    def __init__(self, method, query_string, body, headers=()):
+        self.method = method
+        self.body = body
+        self.__query = parse_qs(query_string.decode('latin-1'))
+        self.__headers = {name.decode('latin-1').lower():
+                          value.decode('latin-1')
+                          for name, value in headers}
+        self.mimetype = self.__headers.get(
+            'content-type', '').split(';')[0].strip().lower()
+
+    def arg(self, name, default=None, type=str):
+        """Returns a query argument converted to the given type (or the
+        default if it's missing or can't be converted), like Flask's
+        request.args.get. """
+        try:
+            return type(self.__query[name][0])
+        except (KeyError, ValueError):
+            return default
+
+    def get_data(self):
+        """Returns the raw body, like Flask's request.get_data. """
+        return self.body
+
+    def get_json(self):
+        """Returns the decoded JSON body or None. """
+        try:
+            return json.loads(self.body.decode('utf8'))
+        except ValueError:
+            return None
+
+    def best_match(self, mimetypes):
+        """Returns the media type the Accept header prefers among the given
+        ones (the first one on a tie), like Flask's
+        request.accept_mimetypes.best_match. """
+        qualities = {}
+        for entry in self.__headers.get('accept', '*/*').split(','):
+            parts = entry.split(';')
+            quality = 1.0
+            for parameter in parts[1:]:
+                name, _, value = parameter.partition('=')
+                if name.strip() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            qualities[parts[0].strip().lower()] = quality
+
+        def quality_of(mimetype):
+            for candidate in (mimetype, mimetype.split('/')[0] + '/*',
+                              '*/*'):
+                if candidate in qualities:
+                    return qualities[candidate]
+            return 0.0
+        best = max(mimetypes, key=quality_of)
+        return best if quality_of(best) > 0 else None
+
+
+async def offload(function, *args, **kwargs):
+    """Runs a blocking call on the thread pool and returns its result. """
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, partial(function, *args, **kwargs))
+
+
+def new_blockchain(jobs=()):
+    """Creates the blockchain of this node for the current wallet.
+
+    Arguments:
+        :jobs: The mining jobs which are stopped first (a copy, the job
+        history is only changed on the event loop).
+    """
+    return node_api.new_blockchain(blockchain, wallet.public_key, port,
+                                   blockchain_options, jobs)
+
+
+def read_ui(name):
+    """Returns the content of a page of the UI. """
+    with open(os.path.join('ui', name), mode='rb') as f:
+        return f.read()
+
+
+@route('/', methods=['GET'])
+async def get_node_ui(request):
+    return await offload(read_ui, 'node.html'), 200
+
+
+@route('/network', methods=['GET'])
+async def get_network_ui(request):
+    return await offload(read_ui, 'network.html'), 200
+
+
+@route('/wallet', methods=['POST'])
+async def create_keys(request):
+    global blockchain
+    await offload(wallet.create_keys)
+    saved = await offload(wallet.save_keys)
+    if saved:
+        blockchain = await offload(new_blockchain,
+                                   list(mining_jobs.values()))
+    return await offload(node_api.wallet_keys, wallet, blockchain, saved,
+                         'Error in saving the keys.')
+
+
+@route('/wallet', methods=['GET'])
+async def load_keys(request):
+    global blockchain
+    loaded = await offload(wallet.load_keys)
+    if loaded:
+        blockchain = await offload(new_blockchain,
+                                   list(mining_jobs.values()))
+    return await offload(node_api.wallet_keys, wallet, blockchain, loaded,
+                         'Error in loading keys.')
+
+
+@route('/balance', methods=['GET'])
+async def get_balance(request):
+    return await offload(node_api.get_balance, wallet, blockchain)
+
+
+@route('/broadcast-transaction', methods=['POST'])
+async def broadcast_transaction(request):
+    return await offload(node_api.broadcast_transaction, blockchain, request)
+
+
+@route('/broadcast-block', methods=['POST'])
+async def broadcast_block(request):
+    return await offload(node_api.broadcast_block, blockchain, request)
+
+
+@route('/transaction', methods=['POST'])
+async def add_transaction(request):
+    return await offload(node_api.add_transaction, wallet, blockchain,
+                         request.get_json())
+
+
+@route('/transactions/batch', methods=['POST'])
+async def add_transactions(request):
+    return await offload(node_api.add_transactions, wallet, blockchain,
+                         request.get_json())
+
+
+@route('/broadcast-transactions', methods=['POST'])
+async def broadcast_transactions(request):
+    return await offload(node_api.broadcast_transactions, blockchain,
+                         request)
+
+
+@route('/mine', methods=['POST'])
+async def mine(request):
+    # Runs on the event loop, which is the only one changing the jobs
+    return node_api.mine(wallet, blockchain, mining_jobs)
+
+
+@route('/mine/<job_id>', methods=['GET'])
+async def get_mining_job(request, job_id):
+    return await offload(node_api.get_mining_job, blockchain,
+                         mining_jobs.get(job_id))
+
+
+@route('/resolve-conflicts', methods=['POST'])
+async def resolve_conflicts(request):
+    return await offload(node_api.resolve_conflicts, blockchain)
+
+
+@route('/transactions', methods=['GET'])
+async def get_open_transaction(request):
+    return await offload(node_api.get_open_transactions, blockchain)
+
+
+@route('/chain', methods=['GET'])
+async def get_chain(request):
+    return await offload(node_api.get_chain, blockchain,
+                         request.arg('start', 0, type=int),
+                         request.arg('limit', type=int))
+
+
+@route('/chain/height', methods=['GET'])
+async def get_chain_height(request):
+    return await offload(node_api.get_chain_height, blockchain)
+
+
+@route('/chain/headers', methods=['GET'])
+async def get_chain_headers(request):
+    return await offload(node_api.get_chain_headers, blockchain,
+                         request.arg('start', 0, type=int),
+                         request.arg('limit', type=int))
+
+
+@route('/chain/blocks', methods=['GET'])
+async def get_chain_blocks(request):
+    # Peers asking for the binary encoding get it, everyone else JSON
+    binary = request.best_match(
+        ['application/json', codec.CONTENT_TYPE]) == codec.CONTENT_TYPE
+    return await offload(node_api.get_chain_blocks, blockchain,
+                         request.arg('start', 0, type=int),
+                         request.arg('end', type=int), binary)
+
+
+@route('/snapshot', methods=['GET'])
+async def get_snapshot(request):
+    return await offload(node_api.get_snapshot, blockchain)
+
+
+@route('/node', methods=['POST'])
+async def add_node(request):
+    return await offload(node_api.add_node, blockchain, request.get_json())
+
+
+@route('/node/<node_url>', methods=['DELETE'])
+async def remove_node(request, node_url):
+    return await offload(node_api.remove_node, blockchain, node_url)
+
+
+@route('/nodes', methods=['GET'])
+async def get_nodes(request):
+    return await offload(node_api.get_nodes, blockchain)
+
+
+@route('/nodes/stats', methods=['GET'])
+async def get_node_stats(request):
+    return await offload(node_api.get_node_stats, blockchain)
+
+
+async def app(scope, receive, send):
+    """The ASGI entry point: dispatches HTTP requests to the handlers. """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    request = Request(scope['method'], scope.get('query_string', b''), body,
+                      scope.get('headers', ()))
+    path = unquote(scope['path'])
+    allowed = False
+    for pattern, methods, handler in routes:
+        match = pattern.match(path)
+        if match is None:
+            continue
+        if request.method not in methods:
+            allowed = True
+            continue
+        result = await handler(request, **match.groupdict())
+        await respond(send, *result)
+        return
+    if allowed:
+        await respond(send, {'message': 'Method not allowed.'}, 405)
+    else:
+        await respond(send, {'message': 'Not found.'}, 404)
+
+
+async def respond(send, response, status, headers=None):
+    """Sends a handler's response: bytes are sent as HTML (unless the
+    headers set another Content-Type), generators of JSON chunks are
+    streamed and everything else is encoded as JSON. """
+    headers = dict(headers or {})
+    content_type = 'application/json'
+    if isinstance(response, bytes):
+        content_type = 'text/html; charset=utf-8'
+    content_type = headers.pop('Content-Type', content_type)
+    raw_headers = [(b'content-type', content_type.encode()),
+                   (b'access-control-allow-origin', b'*')]
+    for name, value in headers.items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': raw_headers})
+    if isinstance(response, bytes):
+        body = response
+    elif hasattr(response, '__next__'):
+        # Reading and encoding the blocks may touch the disk, so every
+        # batch of chunks is built on the thread pool
+        while True:
+            chunk = await offload(
+                lambda: ''.join(islice(response, STREAM_BATCH_SIZE)))
+            if not chunk:
+                break
+            await send({'type': 'http.response.body',
+                        'body': chunk.encode('utf8'), 'more_body': True})
+        body = b''
+    else:
+        body = json.dumps(response).encode('utf8')
+    await send({'type': 'http.response.body', 'body': body})
+
+
+if __name__ == '__main__':
+    parser = node_api.argument_parser()
+    parser.add_argument('--threads', type=int, default=64,
+                        help='number of threads running blockchain calls')
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError:
+        print('The async node needs an ASGI server: pip install uvicorn')
+        raise SystemExit(1)
+    port = args.port
+    blockchain_options = node_api.blockchain_options(args)
+    executor = ThreadPoolExecutor(args.threads)
+    wallet = Wallet(port)
+    blockchain = None
+    blockchain = new_blockchain()
+    node_api.bootstrap(blockchain, args)
+    try:
+        uvicorn.run(app, host='0.0.0.0', port=port, log_level='warning')
+    finally:
+        # Write the outstanding changes before the node stops
+        blockchain.close()
@@ -0,0 +1,89 @@
+"""Measures what the address registry saves on disk and in memory.
+
+Run from the project root:
+
+    python -m benchmarks.addresses [--blocks 2000] [--block-size 50]
+
+A synthetic chain where 10 addresses (1024 bit RSA keys) send each other
+coins is encoded with and without the registry. The encoded size, the
+memory of the decoded blocks and the time to book them on a Ledger are
+printed for both.
+"""
+from argparse import ArgumentParser
+import os
+import tempfile
+import time
+import tracemalloc
+
+from block import Block
+from utility import codec
+from utility.addresses import AddressRegistry
+from utility.ledger import Ledger
+from wallet import Wallet
+
+
+def synthetic_blocks(addresses, count, block_size):
+    """Returns blocks (as dictionaries) with transactions between the given
+    addresses. """
+    blocks = []
+    for index in range(count):
+        blocks.append({
+            'index': index,
+            'previous_hash': '{:064x}'.format(index),
+            'timestamp': 1500000000.0 + index,
+            'transactions': [{
+                'sender': addresses[(index + offset) % len(addresses)],
+                'recipient': addresses[(index + offset + 1) %
+                                       len(addresses)],
+                'amount': 1,
+                'signature': '{:0256x}'.format(index * block_size + offset)
+            } for offset in range(block_size)],
+            'proof': index
+        })
+    return blocks
+
+
+def measure(payloads, registry):
+    """Decodes the payloads and returns the traced memory of the blocks and
+    the seconds to book them on a ledger. """
+    tracemalloc.start()
+    chain = [Block.from_dict(codec.decode_block(payload, registry))
+             for payload in payloads]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    ledger = Ledger()
+    start = time.perf_counter()
+    for block in chain:
+        ledger.apply_block(block)
+    return size, time.perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=2000)
+    parser.add_argument('--block-size', type=int, default=50)
+    args = parser.parse_args()
+    addresses = []
+    for index in range(10):
+        wallet = Wallet(index)
+        wallet.create_keys()
+        addresses.append(wallet.public_key)
+    blocks = synthetic_blocks(addresses, args.blocks, args.block_size)
+    with tempfile.TemporaryDirectory() as directory:
+        registry = AddressRegistry(os.path.join(directory, 'addresses'))
+        variants = [('keys', None), ('ids', registry)]
+        print('{:<6} {:>12} {:>12} {:>12}'.format(
+            'format', 'disk MiB', 'memory MiB', 'ledger ms'))
+        for name, variant_registry in variants:
+            payloads = [codec.encode_block(block, variant_registry)
+                        for block in blocks]
+            if variant_registry is not None:
+                variant_registry.write()
+            disk = sum(len(payload) for payload in payloads)
+            size, elapsed = measure(payloads, variant_registry)
+            print('{:<6} {:>12.1f} {:>12.1f} {:>12.1f}'.format(
+                name, disk / 2 ** 20, size / 2 ** 20, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
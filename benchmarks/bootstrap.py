@@ -0,0 +1,111 @@
+"""Measures how long a fresh node takes to catch up with a peer, with and
+without bootstrapping from a snapshot.
+
+Run from the project root:
+
+    python -m benchmarks.bootstrap [--blocks 20000] [--tail 100]
+
+A peer node with a long chain is served through the Flask app's test
+client. The full sync resolves the whole chain from the peer, the bootstrap
+loads a snapshot taken --tail blocks before the peer's tip and only
+resolves the blocks after it. Both times include creating the node.
+"""
+from argparse import ArgumentParser
+import json
+import os
+import tempfile
+import time
+
+from block import Block
+from blockchain import Blockchain
+from transaction import Transaction
+from utility.broadcast import Broadcaster
+from utility.snapshot import read_snapshot
+from utility.verification import Verification
+import node
+
+
+class ClientBroadcaster(Broadcaster):
+    """Sends the sync requests to the node app's test client. """
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def get(self, peer, path, binary=False):
+        headers = {'Accept': 'application/x-pchain'} if binary else {}
+        return ClientResponse(self.client.get(path, headers=headers))
+
+
+class ClientResponse:
+    """Gives a test client response the interface of a requests one. """
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.data
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def mine(blockchain, count, recipient):
+    """Appends blocks with a mining reward each (the proofs are searched
+    here, the blockchain checks them). """
+    for _ in range(count):
+        last_block = blockchain.chain.tip
+        proof = 0
+        while not Verification.valid_proof([], last_block.hash, proof):
+            proof += 1
+        block = Block(last_block.index + 1, last_block.hash,
+                      [Transaction('MINING', recipient, '', 10)], proof)
+        assert blockchain.add_block(block.to_dict())
+
+
+def catch_up(node_id, client, snapshot_path=None):
+    """Creates a fresh node, optionally bootstraps it and resolves the peer's
+    chain. Returns the seconds it took and the node's height. """
+    start = time.perf_counter()
+    blockchain = Blockchain(None, node_id, broadcaster=ClientBroadcaster(
+        client))
+    if snapshot_path is not None:
+        assert blockchain.bootstrap(read_snapshot(snapshot_path))
+    blockchain.add_peer_node('peer')
+    assert blockchain.resolve()
+    elapsed = time.perf_counter() - start
+    height = blockchain.get_height()
+    blockchain.close()
+    return elapsed, height
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=20000)
+    parser.add_argument('--tail', type=int, default=100)
+    args = parser.parse_args()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            peer = Blockchain(None, 'peer', durability='async')
+            recipient = 'ab' * 162
+            mine(peer, args.blocks - args.tail - 1, recipient)
+            with open('snapshot.json', mode='w') as f:
+                f.write(json.dumps(peer.get_snapshot()))
+            mine(peer, args.tail, recipient)
+            peer.flush()
+            node.blockchain = peer
+            client = node.app.test_client()
+            full = catch_up('full', client)
+            bootstrapped = catch_up('bootstrap', client, 'snapshot.json')
+            peer.close()
+        finally:
+            os.chdir(cwd)
+    print('{:<10} {:>9} {:>10}'.format('sync', 'blocks', 'seconds'))
+    print('{:<10} {:>9} {:>10.3f}'.format('full', full[1], full[0]))
+    print('{:<10} {:>9} {:>10.3f}'.format(
+        'bootstrap', bootstrapped[1], bootstrapped[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Measures the broadcast latency for a growing number of peer nodes.
+
+Run from the project root:
+
+    python -m benchmarks.broadcast [--peers 1 2 4 8 16] [--delay 0.05]
+                                   [--timeout 0.5]
+
+Every peer is a local stand-in Flask app which answers /broadcast-block
+after a fixed delay. The sequential requests.post loop (the old code path)
+takes the sum of all round-trips, the Broadcaster only the slowest one.
+Afterwards a stand-in peer which accepts connections but never answers is
+added, and the broadcast has to return within the timeout. The script
+fails if the parallel latency grows with the number of peers or the hung
+peer blocks the broadcast.
+"""
+from argparse import ArgumentParser
+import socket
+from threading import Thread
+import time
+
+from flask import Flask, jsonify
+import requests
+from werkzeug.serving import make_server
+
+from utility.broadcast import Broadcaster
+
+
+def start_peer(delay):
+    """Starts a stand-in peer node and returns its host. """
+    app = Flask(__name__)
+
+    @app.route('/broadcast-block', methods=['POST'])
+    def broadcast_block():
+        time.sleep(delay)
+        return jsonify({'message': 'Block added'}), 201
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return '127.0.0.1:{}'.format(server.server_port)
+
+
+def start_hung_peer():
+    """Starts a stand-in peer which accepts connections (through the listen
+    backlog) but never answers. Returns its socket and host. """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(64)
+    return server, '127.0.0.1:{}'.format(server.getsockname()[1])
+
+
+def sequential_broadcast(nodes, path, payload):
+    statuses = {}
+    for node in nodes:
+        url = 'http://{}{}'.format(node, path)
+        statuses[node] = requests.post(url, json=payload).status_code
+    return statuses
+
+
+def measure(broadcast, nodes, rounds=5):
+    payload = {'block': {'index': 1, 'transactions': []}}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        statuses = broadcast(nodes, '/broadcast-block', payload)
+        assert all(status == 201 for status in statuses.values())
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--peers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    parser.add_argument('--delay', type=float, default=0.05)
+    parser.add_argument('--timeout', type=float, default=0.5)
+    args = parser.parse_args()
+    nodes = [start_peer(args.delay) for _ in range(max(args.peers))]
+    broadcaster = Broadcaster()
+    print('{:>6} {:>15} {:>15}'.format('peers', 'sequential ms',
+                                       'parallel ms'))
+    parallel = []
+    for count in args.peers:
+        parallel.append(measure(broadcaster.broadcast, nodes[:count]))
+        print('{:>6} {:>15.1f} {:>15.1f}'.format(
+            count, measure(sequential_broadcast, nodes[:count]),
+            parallel[-1]))
+    # Every broadcast waits for one round-trip, whatever the number of peers
+    assert max(parallel) < 3 * args.delay * 1000, \
+        'parallel latency grows with the number of peers'
+    hung_server, hung_node = start_hung_peer()
+    broadcaster = Broadcaster(timeout=(args.timeout, args.timeout))
+    start = time.perf_counter()
+    statuses = broadcaster.broadcast(
+        nodes + [hung_node], '/broadcast-block',
+        {'block': {'index': 1, 'transactions': []}})
+    elapsed = time.perf_counter() - start
+    hung_server.close()
+    print('hung peer: broadcast to {} peers returned after {:.1f} ms'.format(
+        len(nodes) + 1, elapsed * 1000))
+    assert statuses[hung_node] is None
+    assert all(statuses[node] == 201 for node in nodes)
+    assert elapsed < args.timeout + 3 * args.delay, \
+        'the hung peer blocked the broadcast'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Compares the binary codec with JSON for blocks and transactions.
+
+Run from the project root:
+
+    python -m benchmarks.codec [--transactions 100] [--rounds 200]
+
+Builds a block with signed transactions between real wallets and prints
+the encoded size and the encode/decode time of a single transaction and of
+the block in both formats.
+"""
+from argparse import ArgumentParser
+import json
+import time
+
+from block import Block
+from transaction import Transaction
+from utility import codec
+from wallet import Wallet
+
+
+def measure(function, value, rounds):
+    """Returns the average seconds of a call. """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(value)
+    return (time.perf_counter() - start) / rounds
+
+
+def compare(name, value, encode, decode, rounds):
+    """Prints size and timings of JSON and the codec for a value. """
+    json_data = json.dumps(value).encode('utf8')
+    binary = encode(value)
+    assert decode(binary) == value
+    for fmt, data, dump, load in [
+            ('json', json_data, lambda v: json.dumps(v).encode('utf8'),
+             lambda d: json.loads(d.decode('utf8'))),
+            ('binary', binary, encode, decode)]:
+        print('{:<12} {:<7} {:>9} {:>12.1f} {:>12.1f}'.format(
+            name, fmt, len(data), measure(dump, value, rounds) * 1e6,
+            measure(load, data, rounds) * 1e6))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+    senders = []
+    for index in range(4):
+        sender = Wallet(index)
+        sender.create_keys()
+        senders.append(sender)
+    transactions = []
+    for index in range(args.transactions):
+        sender = senders[index % len(senders)]
+        recipient = senders[(index + 1) % len(senders)].public_key
+        amount = 0.5 + index
+        transactions.append(Transaction(
+            sender.public_key, recipient,
+            sender.sign_transaction(sender.public_key, recipient, amount),
+            amount))
+    transactions.append(Transaction('MINING', senders[0].public_key, '', 10))
+    block = Block(1, '00' * 32, transactions, 12345, 1500000000.0)
+
+    print('{:<12} {:<7} {:>9} {:>12} {:>12}'.format(
+        'value', 'format', 'bytes', 'encode us', 'decode us'))
+    compare('transaction', transactions[0].to_dict(),
+            codec.encode_transaction, codec.decode_transaction, args.rounds)
+    compare('block', block.to_dict(with_hash=True), codec.encode_block,
+            codec.decode_block, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Measures the transaction throughput of the durability modes.
+
+Run from the project root:
+
+    python -m benchmarks.durability [--transactions 2000] [--threads 16]
+
+For every mode a fresh blockchain is created in a temporary directory and
+the same number of signed transactions is added from several threads (every
+added transaction changes the stored open transactions).
+"""
+from argparse import ArgumentParser
+import os
+import tempfile
+from threading import Thread
+import time
+
+from blockchain import Blockchain
+from utility.persistence import DURABILITY_MODES
+from wallet import Wallet
+
+
+def sign_transactions(wallet, count):
+    """Returns signed transactions of the wallet (with unique recipients). """
+    return [(wallet.public_key, 'bench-{}'.format(index), 0.001,
+             wallet.sign_transaction(wallet.public_key,
+                                     'bench-{}'.format(index), 0.001))
+            for index in range(count)]
+
+
+def measure(mode, wallet, transactions, threads):
+    root = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            blockchain = Blockchain(wallet.public_key, 'bench',
+                                    durability=mode)
+            for _ in range(3):
+                blockchain.mine_block()
+            batches = [transactions[index::threads]
+                       for index in range(threads)]
+
+            def add(batch):
+                for sender, recipient, amount, signature in batch:
+                    assert blockchain.add_transaction(
+                        recipient, sender, signature, amount)
+            workers = [Thread(target=add, args=(batch,))
+                       for batch in batches]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            blockchain.close()
+            # Everything has to be on disk after closing
+            reloaded = Blockchain(wallet.public_key, 'bench')
+            assert (len(reloaded.get_open_transactions()) ==
+                    len(transactions))
+            reloaded.close()
+        finally:
+            os.chdir(root)
+    return len(transactions) / elapsed
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+    wallet = Wallet(None)
+    wallet.create_keys()
+    transactions = sign_transactions(wallet, args.transactions)
+    print('{:>6} {:>10}'.format('mode', 'tx/s'))
+    for mode in DURABILITY_MODES:
+        print('{:>6} {:>10.1f}'.format(
+            mode, measure(mode, wallet, transactions, args.threads)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Compares the Flask node (node.py) with the async node (async_node.py)
+under broadcast load while the node is mining.
+
+Run from the project root (the async node needs uvicorn):
+
+    python -m benchmarks.load [--clients 64] [--seconds 10]
+
+Every node is started as a separate process in a temporary directory. Its
+wallet mines a few blocks to have funds, then the clients post signed
+transactions to /broadcast-transaction (every fourth request reads
+/balance instead) while a background thread keeps mining blocks. The
+throughput and the latency percentiles of both nodes are printed.
+"""
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+import tempfile
+from threading import Event, Lock, Thread
+import time
+
+import requests
+
+from wallet import Wallet
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NODES = [('flask', 'node.py'), ('async', 'async_node.py')]
+
+
+def start_node(script, port, directory):
+    """Starts a node process and waits until it answers. """
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, script), '-p', str(port)],
+        cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = 'http://127.0.0.1:{}'.format(port)
+    for _ in range(100):
+        try:
+            requests.get(url + '/nodes', timeout=1)
+            return process, url
+        except requests.exceptions.RequestException:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('{} did not start'.format(script))
+
+
+def mine(url):
+    """Mines a block and waits until it's added. """
+    response = requests.post(url + '/mine')
+    job_url = url + '/mine/' + response.json()['job_id']
+    while requests.get(job_url).json()['status'] == 'running':
+        time.sleep(0.01)
+
+
+def sign_transactions(url, count):
+    """Sets up the node's wallet and returns signed transactions spending
+    its funds. """
+    keys = requests.post(url + '/wallet').json()
+    for _ in range(3):
+        mine(url)
+    wallet = Wallet(None)
+    wallet.public_key = keys['public_key']
+    wallet.private_key = keys['private_key']
+    transactions = []
+    for index in range(count):
+        # Every transaction gets its own recipient to be unique
+        recipient = 'load-{}'.format(index)
+        transactions.append({
+            'sender': wallet.public_key,
+            'recipient': recipient,
+            'amount': 0.001,
+            'signature': wallet.sign_transaction(
+                wallet.public_key, recipient, 0.001)
+        })
+    return transactions
+
+
+def client(url, transactions, lock, stop, latencies, errors):
+    session = requests.Session()
+    count = 0
+    while not stop.is_set():
+        count += 1
+        start = time.perf_counter()
+        try:
+            if count % 4 == 0:
+                response = session.get(url + '/balance')
+            else:
+                with lock:
+                    transaction = transactions.pop() if transactions else None
+                if transaction is None:
+                    break
+                response = session.post(url + '/broadcast-transaction',
+                                        json=transaction)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except requests.exceptions.RequestException as e:
+            errors.append(repr(e))
+        latencies.append(time.perf_counter() - start)
+
+
+def keep_mining(url, stop, blocks):
+    while not stop.is_set():
+        try:
+            mine(url)
+            blocks.append(1)
+        except requests.exceptions.RequestException:
+            pass
+
+
+def measure(script, port, args):
+    with tempfile.TemporaryDirectory() as directory:
+        process, url = start_node(script, port, directory)
+        try:
+            transactions = sign_transactions(url, args.transactions)
+            stop = Event()
+            lock = Lock()
+            latencies = []
+            errors = []
+            blocks = []
+            threads = [Thread(target=client,
+                              args=(url, transactions, lock, stop,
+                                    latencies, errors))
+                       for _ in range(args.clients)]
+            threads.append(Thread(target=keep_mining,
+                                  args=(url, stop, blocks)))
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            process.kill()
+            process.wait()
+    latencies.sort()
+
+    def percentile(fraction):
+        if not latencies:
+            return 0
+        return latencies[min(int(len(latencies) * fraction),
+                             len(latencies) - 1)] * 1000
+    return (len(latencies) / elapsed, percentile(0.5), percentile(0.99),
+            len(errors), len(blocks))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--transactions', type=int, default=5000,
+                        help='number of signed transactions per node')
+    parser.add_argument('--port', type=int, default=5600)
+    args = parser.parse_args()
+    print('{:>6} {:>10} {:>10} {:>10} {:>8} {:>8}'.format(
+        'node', 'req/s', 'p50 ms', 'p99 ms', 'errors', 'blocks'))
+    for offset, (name, script) in enumerate(NODES):
+        if name == 'async':
+            try:
+                import uvicorn  # noqa: F401
+            except ImportError:
+                print('{:>6} skipped (uvicorn is not installed)'.format(name))
+                continue
+        print('{:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>8} {:>8}'.format(
+            name, *measure(script, args.port + offset, args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Measures the memory held by the Block and Transaction objects of a
+chain, comparing the old __dict__ based classes with the slotted ones.
+
+Run from the project root:
+
+    python -m benchmarks.memory [--transactions 1000000] [--block-size 100]
+
+The transaction data (keys, signatures) is created up front and shared by
+both variants, so only the object overhead is measured. The hashes of both
+variants are compared to make sure hash_block didn't change.
+"""
+from argparse import ArgumentParser
+import hashlib as hl
+import json
+import tracemalloc
+
+from block import Block
+from transaction import Transaction
+from utility.hash_util import hash_block
+
+
+class LegacyTransaction:
+    def __init__(self, sender, recipient, signature, amount):
+        self.sender = sender
+        self.recipient = recipient
+        self.amount = amount
+        self.signature = signature
+
+    def to_ordered_dict(self):
+        return Transaction.to_ordered_dict(self)
+
+
+class LegacyBlock:
+    def __init__(self, index, previous_hash, transactions, proof, time):
+        self.index = index
+        self.previous_hash = previous_hash
+        self.timestamp = time
+        self.transactions = transactions
+        self.proof = proof
+
+
+def legacy_hash_block(block):
+    hashable_block = block.__dict__.copy()
+    hashable_block['transactions'] = [
+        tx.to_ordered_dict() for tx in hashable_block['transactions']
+    ]
+    return hl.sha256(json.dumps(hashable_block, sort_keys=True).encode()
+                     ).hexdigest()
+
+
+def build_chain(block_cls, tx_cls, data, block_size):
+    chain = []
+    for start in range(0, len(data), block_size):
+        chain.append(block_cls(
+            len(chain), '00' * 32,
+            [tx_cls(*tx) for tx in data[start:start + block_size]],
+            start, 1500000000.0 + start))
+    return chain
+
+
+def measure(block_cls, tx_cls, data, block_size):
+    tracemalloc.start()
+    chain = build_chain(block_cls, tx_cls, data, block_size)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return chain, size
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--block-size', type=int, default=100)
+    args = parser.parse_args()
+    senders = ['{:0324x}'.format(index) for index in range(10)]
+    data = [(senders[index % 10], senders[(index + 1) % 10],
+             '{:0256x}'.format(index), index)
+            for index in range(args.transactions)]
+
+    legacy_chain, legacy_size = measure(
+        LegacyBlock, LegacyTransaction, data, args.block_size)
+    legacy_hashes = [legacy_hash_block(block)
+                     for block in legacy_chain[:1000]]
+    del legacy_chain
+    chain, size = measure(Block, Transaction, data, args.block_size)
+    hashes = [hash_block(block) for block in chain[:1000]]
+    assert hashes == legacy_hashes, 'hash_block output changed'
+
+    print('{:<10} {:>12} {:>14}'.format('classes', 'MiB', 'bytes per tx'))
+    for name, total in (('__dict__', legacy_size), ('__slots__', size)):
+        print('{:<10} {:>12.1f} {:>14.1f}'.format(
+            name, total / 2 ** 20, total / args.transactions))
+
+
+if __name__ == '__main__':
+    main()
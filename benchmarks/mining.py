@@ -0,0 +1,58 @@
+"""Compares the proof of work search of Verification.valid_proof with the
+Miner (prefix hashing, optionally on several processes).
+
+Run from the project root:
+
+    python -m benchmarks.mining [--blocks 200] [--transactions 50]
+                                [--workers 1 2 4]
+
+Every path solves the same proofs for a number of synthetic blocks. Hashes
+per second count the proofs a sequential search has to check (the found
+proof + 1), so the numbers of all paths are comparable.
+"""
+from argparse import ArgumentParser
+import time
+
+from transaction import Transaction
+from utility.miner import Miner
+from utility.verification import Verification
+
+
+def legacy_proof_of_work(transactions, last_hash):
+    proof = 0
+    while not Verification.valid_proof(transactions, last_hash, proof):
+        proof += 1
+    return proof
+
+
+def run(name, solve, blocks, transactions):
+    start = time.perf_counter()
+    hashes = 0
+    for index in range(blocks):
+        last_hash = '{:064x}'.format(index)
+        proof = solve(transactions, last_hash)
+        assert Verification.valid_proof(transactions, last_hash, proof)
+        hashes += proof + 1
+    elapsed = time.perf_counter() - start
+    print('{:<16} {:>12.0f} {:>10.3f}'.format(name, hashes / elapsed, elapsed))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    transactions = [Transaction('ab' * 162, 'cd' * 162, 'ef' * 64, amount)
+                    for amount in range(args.transactions)]
+    print('{:<16} {:>12} {:>10}'.format('path', 'hashes/s', 'seconds'))
+    run('valid_proof', legacy_proof_of_work, args.blocks, transactions)
+    for workers in args.workers:
+        miner = Miner(workers)
+        run('miner ({})'.format(workers), miner.proof_of_work,
+            args.blocks, transactions)
+        miner.close()
+
+
+if __name__ == '__main__':
+    main()
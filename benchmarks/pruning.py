@@ -0,0 +1,96 @@
+"""Measures the memory of a node reading its whole chain, with and without
+pruning.
+
+Run from the project root:
+
+    python -m benchmarks.pruning [--sizes 5000 20000 80000] [--prune 100]
+
+Every chain is written into a temporary directory. A fresh interpreter loads
+it and reads every block (like serving /chain or re-verifying the chain),
+then the peak RSS is printed. Without pruning the recently used blocks are
+kept and the whole block segment is memory mapped, with pruning only the
+last --prune blocks are.
+"""
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+import tempfile
+
+from utility.storage import BlockStorage
+
+LOADER = '''
+import resource, sys, time
+sys.path.insert(0, {root!r})
+from blockchain import Blockchain
+blockchain = Blockchain(None, 'bench', prune_depth={prune})
+start = time.perf_counter()
+transactions = sum(len(block.transactions) for block in blockchain.chain)
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss, transactions)
+'''
+
+
+def synthetic_blocks(count, block_size):
+    """Yields blocks with transfers between a few addresses and a mining
+    reward each. """
+    addresses = ['{:02x}'.format(index) * 162 for index in range(10)]
+    for index in range(count):
+        transactions = [] if index == 0 else [{
+            'sender': addresses[(index + offset) % len(addresses)],
+            'recipient': addresses[(index + offset + 1) % len(addresses)],
+            'signature': '{:0256x}'.format(index * block_size + offset),
+            'amount': 1
+        } for offset in range(block_size - 1)] + [{
+            'sender': 'MINING',
+            'recipient': addresses[index % len(addresses)],
+            'signature': '',
+            'amount': 10
+        }]
+        yield {
+            'index': index,
+            'previous_hash': '00' * 32,
+            'timestamp': 1500000000.0 + index,
+            'transactions': transactions,
+            'proof': index
+        }
+
+
+def measure(directory, prune):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-c', LOADER.format(root=root, prune=prune)],
+        cwd=directory)
+    elapsed, rss, _ = output.decode('utf8').split('\n')[-2].split()
+    return float(elapsed), int(rss) / 1024
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[5000, 20000, 80000])
+    parser.add_argument('--block-size', type=int, default=20)
+    parser.add_argument('--prune', type=int, default=100)
+    args = parser.parse_args()
+    print('{:>9} {:>10} {:>10} {:>10} {:>10}'.format(
+        'blocks', 'full s', 'full MiB', 'pruned s', 'pruned MiB'))
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                BlockStorage('bench').replace_blocks(
+                    synthetic_blocks(size, args.block_size))
+            finally:
+                os.chdir(cwd)
+            # The first load books the balances and saves them
+            measure(directory, None)
+            full = measure(directory, None)
+            pruned = measure(directory, args.prune)
+        print('{:>9} {:>10.3f} {:>10.1f} {:>10.3f} {:>10.1f}'.format(
+            size, full[0], full[1], pruned[0], pruned[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Measures the signature verification throughput of the Wallet.
+
+Run from the project root:
+
+    python -m benchmarks.signatures [--transactions 2000] [--senders 10]
+
+Compares parsing the public key for every transaction (the old code path)
+with the cached verifiers, the batch API and re-verifying transactions
+whose signature was already checked.
+"""
+from argparse import ArgumentParser
+import binascii
+import time
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from transaction import Transaction
+import wallet
+from wallet import Wallet
+
+
+def legacy_verify_transaction(transaction):
+    public_key = RSA.importKey(binascii.unhexlify(transaction.sender))
+    verifier = PKCS1_v1_5.new(public_key)
+    h = SHA256.new((str(transaction.sender) + str(transaction.recipient) +
+                    str(transaction.amount)).encode('utf8'))
+    return verifier.verify(h, binascii.unhexlify(transaction.signature))
+
+
+def run(name, verify, transactions):
+    start = time.perf_counter()
+    assert all(verify(transactions))
+    elapsed = time.perf_counter() - start
+    print('{:<20} {:>10.0f}'.format(name, len(transactions) / elapsed))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=2000)
+    parser.add_argument('--senders', type=int, default=10)
+    args = parser.parse_args()
+    senders = []
+    for index in range(args.senders):
+        sender = Wallet(index)
+        sender.create_keys()
+        senders.append(sender)
+    transactions = []
+    for index in range(args.transactions):
+        sender = senders[index % len(senders)]
+        recipient = senders[(index + 1) % len(senders)].public_key
+        signature = sender.sign_transaction(
+            sender.public_key, recipient, index)
+        transactions.append(Transaction(
+            sender.public_key, recipient, signature, index))
+
+    print('{:<20} {:>10}'.format('path', 'tx/s'))
+    run('uncached',
+        lambda txs: [legacy_verify_transaction(tx) for tx in txs],
+        transactions)
+    run('cached keys',
+        lambda txs: [Wallet.verify_transaction(tx) for tx in txs],
+        transactions)
+    wallet._verified_signatures.clear()
+    run('batch (pool)', Wallet.verify_transactions, transactions)
+    run('already verified',
+        lambda txs: [Wallet.verify_transaction(tx) for tx in txs],
+        transactions)
+
+
+if __name__ == '__main__':
+    main()
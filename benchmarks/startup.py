@@ -0,0 +1,79 @@
+"""Measures node startup time and memory for long synthetic chains.
+
+Run from the project root:
+
+    python -m benchmarks.startup [--sizes 10000 100000 1000000]
+
+Every chain is written into a temporary directory and loaded by a fresh
+interpreter twice: the cold start books all blocks on the balances, the warm
+start reuses the saved balance state.
+"""
+from argparse import ArgumentParser
+import os
+import subprocess
+import sys
+import tempfile
+
+from utility.storage import BlockStorage
+
+LOADER = '''
+import resource, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+from blockchain import Blockchain
+blockchain = Blockchain(None, 'bench')
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(elapsed, rss, len(blockchain.chain[-1:]))
+'''
+
+
+def synthetic_blocks(count):
+    """Yields blocks with a single mining reward transaction each. """
+    recipient = 'ab' * 162
+    for index in range(count):
+        yield {
+            'index': index,
+            'previous_hash': '00' * 32,
+            'timestamp': 1500000000.0 + index,
+            'transactions': [] if index == 0 else [{
+                'sender': 'MINING',
+                'recipient': recipient,
+                'signature': '',
+                'amount': 10
+            }],
+            'proof': index
+        }
+
+
+def measure(directory):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(
+        [sys.executable, '-c', LOADER.format(root=root)], cwd=directory)
+    elapsed, rss, _ = output.decode('utf8').split('\n')[-2].split()
+    return float(elapsed), int(rss) / 1024
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+    print('{:>9} {:>10} {:>10} {:>10} {:>10}'.format(
+        'blocks', 'cold s', 'cold MiB', 'warm s', 'warm MiB'))
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            cwd = os.getcwd()
+            os.chdir(directory)
+            try:
+                BlockStorage('bench').replace_blocks(synthetic_blocks(size))
+            finally:
+                os.chdir(cwd)
+            cold = measure(directory)
+            warm = measure(directory)
+        print('{:>9} {:>10.3f} {:>10.1f} {:>10.3f} {:>10.1f}'.format(
+            size, cold[0], cold[1], warm[0], warm[1]))
+
+
+if __name__ == '__main__':
+    main()
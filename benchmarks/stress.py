@@ -0,0 +1,192 @@
+"""Hammers the node's Flask app from many threads and checks that the
+blockchain stays consistent.
+
+Run from the project root:
+
+    python -m benchmarks.stress [--readers 16] [--writers 4] [--seconds 10]
+
+Reader threads fetch balances, open transactions and the chain, writer
+threads create transactions, a miner thread mines blocks and a racer thread
+posts competing blocks for the same tip (like a peer would). Afterwards the
+balances, the open transactions and the stored chain are checked against
+each other.
+"""
+from argparse import ArgumentParser
+import os
+import tempfile
+from threading import Event, Lock, Thread
+import time
+from uuid import uuid4
+
+from block import Block
+from blockchain import MINING_REWARD
+from transaction import Transaction
+from utility.broadcast import Broadcaster
+from utility.mempool import DEFAULT_MAX_BLOCK_BYTES
+from utility.miner import Miner
+from utility.verification import Verification
+from wallet import Wallet
+import node
+
+
+def setup():
+    """Creates a node with a wallet and a few mined blocks. """
+    node.port = 'stress'
+    node.blockchain_options = {
+        'miner': Miner(),
+        'broadcaster': Broadcaster(),
+        'max_open_transactions': 1000,
+        'durability': 'sync',
+        # Small blocks, so open transactions wait for several blocks
+        'max_block_transactions': 50,
+        'max_block_bytes': DEFAULT_MAX_BLOCK_BYTES
+    }
+    node.wallet = Wallet(node.port)
+    node.blockchain = None
+    client = node.app.test_client()
+    assert client.post('/wallet').status_code == 201
+    for _ in range(5):
+        assert node.blockchain.mine_block() is not None
+
+
+def run(target, stop, errors, counts, name):
+    """Calls the target until stop is set, recording failed checks. """
+    client = node.app.test_client()
+    while not stop.is_set():
+        try:
+            target(client)
+        except Exception as e:
+            errors.append('{}: {!r}'.format(name, e))
+        with counts['lock']:
+            counts[name] = counts.get(name, 0) + 1
+
+
+def read(client):
+    response = client.get('/balance')
+    assert response.status_code == 200, response.status_code
+    assert response.json['funds'] >= 0, response.json
+    response = client.get('/transactions')
+    assert response.status_code == 200, response.status_code
+    response = client.get('/chain/height')
+    height = response.json['height']
+    start = max(height - 20, 0)
+    response = client.get('/chain?start={}&limit=20'.format(start))
+    indexes = [block['index'] for block in response.json]
+    assert indexes == list(range(start, start + len(indexes))), indexes
+    # The blocks have to match the stored headers
+    headers = client.get('/chain/headers?start={}&limit={}'.format(
+        start, len(indexes))).json
+    assert ([header['previous_hash'] for header in headers] ==
+            [block['previous_hash'] for block in response.json])
+
+
+def write(client):
+    # Signatures are deterministic, so every transaction gets its own
+    # recipient to be unique
+    response = client.post('/transaction', json={
+        'recipient': uuid4().hex, 'amount': 0.01})
+    # Running out of funds (500) is fine, anything else isn't
+    assert response.status_code in (201, 500), response.status_code
+
+
+def mine(client):
+    node.blockchain.mine_block()
+
+
+def race(client):
+    """Mines an empty block on the current tip and posts it like a peer. """
+    tip = node.blockchain.chain.tip
+    proof = node.blockchain_options['miner'].proof_of_work([], tip.hash)
+    block = Block(tip.index + 1, tip.hash,
+                  [Transaction('MINING', 'racer', '', MINING_REWARD)], proof)
+    response = client.post('/broadcast-block',
+                           json={'block': block.to_dict()})
+    # Losing the race against the local miner is fine
+    assert response.status_code in (200, 201, 409), response.status_code
+
+
+def check(blockchain):
+    """Checks the invariants and returns the list of violations. """
+    errors = []
+    chain = list(blockchain.chain)
+    if not Verification.verify_chain(chain):
+        errors.append('the chain is invalid')
+    if [block.index for block in chain] != list(range(len(chain))):
+        errors.append('the block indexes have gaps')
+    if blockchain.get_block_hashes(0, len(chain)) != [
+            block.hash for block in chain]:
+        errors.append('the stored hashes differ from the blocks')
+    balances = {}
+    mined_ids = set()
+    for block in chain:
+        for tx in block.transactions:
+            if tx.sender != 'MINING':
+                if tx.id in mined_ids:
+                    errors.append('transaction {} was mined twice'.format(
+                        tx.id))
+                mined_ids.add(tx.id)
+            balances[tx.sender] = balances.get(tx.sender, 0) - tx.amount
+            balances[tx.recipient] = balances.get(tx.recipient, 0) + tx.amount
+    supply = sum(amount for participant, amount in balances.items()
+                 if participant != 'MINING')
+    if abs(supply - MINING_REWARD * (len(chain) - 1)) > 1e-6:
+        errors.append('the supply is {}'.format(supply))
+    open_transactions = blockchain.get_open_transactions()
+    for tx in open_transactions:
+        if tx.id in mined_ids:
+            errors.append('mined transaction {} is still open'.format(tx.id))
+        balances[tx.sender] = balances.get(tx.sender, 0) - tx.amount
+    for participant, amount in balances.items():
+        if participant == 'MINING':
+            continue
+        if abs(blockchain.get_balance(participant) - amount) > 1e-6:
+            errors.append('the balance of {} is off'.format(participant))
+        if amount < -1e-6:
+            errors.append('{} overspent'.format(participant))
+    return errors
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    root = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            setup()
+            stop = Event()
+            errors = []
+            counts = {'lock': Lock()}
+            workers = ([(read, 'read')] * args.readers +
+                       [(write, 'write')] * args.writers +
+                       [(mine, 'mine'), (race, 'race')])
+            threads = [Thread(target=run,
+                              args=(target, stop, errors, counts, name))
+                       for target, name in workers]
+            for thread in threads:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            errors.extend(check(node.blockchain))
+        finally:
+            os.chdir(root)
+    del counts['lock']
+    print('requests per second:')
+    for name, count in sorted(counts.items()):
+        print('{:>8} {:>10.1f}'.format(name, count / args.seconds))
+    print('height: {}'.format(node.blockchain.get_height()))
+    if errors:
+        print('{} violations, e.g.:'.format(len(errors)))
+        for error in errors[:10]:
+            print('  ' + error)
+        raise SystemExit(1)
+    print('all invariants hold')
+
+
+if __name__ == '__main__':
+    main()
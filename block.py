@@ -1,13 +1,85 @@
 from time import time
 
+from transaction import Transaction
+from utility.hash_util import hash_block
 from utility.printable import Printable
 
 
 class Block(Printable):
-    def __init__(self, index, previous_hash, transactions, proof, time=time()):
-        self.index = index
-        self.previous_hash = previous_hash
-        self.timestamp = time() if time is None else time
-        self.transactions = transactions
-        self.proof = proof
-        
\ No newline at end of file
+    """A block of the blockchain. Blocks are immutable once created.
+
+    Attributes:
+        :index: The position of the block in the chain.
+        :previous_hash: The hash of the previous block.
+        :timestamp: The creation time of the block.
+        :transactions: The transactions included in the block.
+        :proof: The proof of work of the block.
+    """
+    __slots__ = ('index', 'previous_hash', 'timestamp', 'transactions',
+                 'proof', '_hash')
+
+    def __init__(self, index, previous_hash, transactions, proof,
+                 timestamp=None):
+        set_attribute = super().__setattr__
+        set_attribute('index', index)
+        set_attribute('previous_hash', previous_hash)
+        set_attribute('timestamp', time() if timestamp is None else timestamp)
+        set_attribute('transactions', tuple(transactions))
+        set_attribute('proof', proof)
+        set_attribute('_hash', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Blocks are immutable.')
+
+    def __reduce__(self):
+        # Pickle through the constructor (e.g. for process pools) since the
+        # attributes can't be set afterwards
+        return (self.__class__, (self.index, self.previous_hash,
+                                 self.transactions, self.proof,
+                                 self.timestamp))
+
+    @property
+    def hash(self):
+        """The hash of the block (computed once, blocks are immutable). """
+        if self._hash is None:
+            super().__setattr__('_hash', hash_block(self))
+        return self._hash
+
+    def to_dict(self, with_hash=False):
+        """Returns the block (and its transactions) as a JSON serializable
+        dictionary.
+
+        Arguments:
+            :with_hash: Whether the block hash should be included (e.g. to
+            store it with the block).
+        """
+        block = {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'timestamp': self.timestamp,
+            'transactions': [tx.to_dict() for tx in self.transactions],
+            'proof': self.proof
+        }
+        if with_hash:
+            block['hash'] = self.hash
+        return block
+
+    @classmethod
+    def from_dict(cls, block, trust_hash=False):
+        """Creates a block from a dictionary (see to_dict).
+
+        Arguments:
+            :block: The dictionary holding the block data.
+            :trust_hash: Whether a hash stored in the dictionary is used
+            instead of computing it (only for our own, checksummed storage,
+            never for blocks received from peers).
+        """
+        converted_block = cls(
+            block['index'],
+            block['previous_hash'],
+            [Transaction.from_dict(tx) for tx in block['transactions']],
+            block['proof'],
+            block['timestamp'])
+        if trust_hash and 'hash' in block:
+            super(Block, converted_block).__setattr__('_hash', block['hash'])
+        return converted_block
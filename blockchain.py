@@ -1,12 +1,20 @@
-from functools import reduce
 import hashlib as hl
-
-import json
-import pickle
-import requests
+from threading import Event
 
 # Import two functions from our hash_util.py file. Omit the ".py" in the import
-from utility.hash_util import hash_block
+from utility.broadcast import Broadcaster
+from utility import codec
+from utility.chain_view import ChainView
+from utility.lazy_chain import LazyChain
+from utility.ledger import Ledger
+from utility.mempool import (DEFAULT_MAX_BLOCK_BYTES,
+                             DEFAULT_MAX_BLOCK_TRANSACTIONS,
+                             DEFAULT_MAX_SIZE, Mempool)
+from utility.miner import Miner
+from utility.persistence import Persister
+from utility.rwlock import RWLock
+from utility.snapshot import create_snapshot, verify_snapshot
+from utility.storage import BlockStorage
 from utility.verification import Verification
 from block import Block
 from transaction import Transaction
@@ -14,6 +22,14 @@ from wallet import Wallet
 
 # The reward we give to miners (for creating a new block)
 MINING_REWARD = 10
+# The balances are persisted every time the chain grows by this many blocks,
+# so a restarting node only needs to book the blocks added since
+STATE_INTERVAL = 100
+# A snapshot new nodes can be bootstrapped from is written every time the
+# chain grows by this many blocks
+CHECKPOINT_INTERVAL = 1000
+# The number of block headers and blocks fetched per request while syncing
+SYNC_BATCH_SIZE = 500
 
 print(__name__)
 
@@ -24,125 +40,376 @@ class Blockchain:
 
     Attributes:
         :chain: The list of blocks
-        :open_transactions (private): The list of open transactions
+        :open_transactions (private): The pool of open transactions
+        :max_block_transactions: The maximum number of transactions mined
+        into one block
+        :max_block_bytes: The maximum encoded size of the transactions mined
+        into one block
+        :prune_depth (private): The number of blocks at the tip kept in
+        memory (None keeps the recently used ones)
+        :ledger (private): The balance index kept in sync with the chain and
+        the open transactions
+        :lock (private): Lets reads run in parallel and serializes writes
+        (network requests and proof of work searches run outside of it)
+        :persister (private): Writes the storage files according to the
+        durability mode
         :hosting_node: The connected node (which runs the blockchain).
     """
 
-    def __init__(self, public_key, node_id):
-        """The constructor of the Blockchain class. """
+    def __init__(self, public_key, node_id, miner=None, broadcaster=None,
+                 max_open_transactions=DEFAULT_MAX_SIZE, durability='sync',
+                 max_block_transactions=DEFAULT_MAX_BLOCK_TRANSACTIONS,
+                 max_block_bytes=DEFAULT_MAX_BLOCK_BYTES, prune_depth=None):
+        """The constructor of the Blockchain class.
+
+        Arguments:
+            :public_key: The public key of the hosting node's wallet.
+            :node_id: The id (port) of the hosting node.
+            :miner: The proof of work miner (defaults to an in-process one).
+            :broadcaster: The client used to reach the peer nodes.
+            :max_open_transactions: The size cap of the open transactions.
+            :durability: 'sync' writes every change before returning,
+            'group' shares one write between concurrent changes and 'async'
+            writes in the background (see utility.persistence).
+            :max_block_transactions: The transaction cap of mined blocks.
+            :max_block_bytes: The size cap of mined blocks.
+            :prune_depth: Enables pruning: only the last prune_depth blocks
+            are kept in memory, older blocks are read from the block archive
+            on disk when they're accessed (see LazyChain and BlockStorage).
+        """
         # Our starting block for the blockchain
         genesis_block = Block(0, '', [], 100, 0)
+        # Balances are booked incrementally instead of rescanning the chain
+        self.__ledger = Ledger()
         # Initializing our (empty) blockchain list
         self.chain = [genesis_block]
         # Unhandled transactions
-        self.__open_transactions = []
+        self.__open_transactions = Mempool(max_open_transactions)
+        self.max_block_transactions = max_block_transactions
+        self.max_block_bytes = max_block_bytes
         self.public_key = public_key
         self.__peer_nodes = set()
         self.node_id = node_id
         self.resolve_conflicts = False
+        self.__miner = miner if miner is not None else Miner()
+        self.__broadcaster = (broadcaster if broadcaster is not None
+                              else Broadcaster())
+        # The cancel events of the running proof of work searches
+        self.__mining_cancels = set()
+        self.__persister = Persister(durability)
+        self.__storage = BlockStorage(node_id)
+        # Outside of sync mode appended blocks are synced by the persister
+        self.__storage.sync_appends = durability == 'sync'
+        self.__prune_depth = prune_depth
+        self.__storage.hot_blocks = prune_depth
+        self.__lock = RWLock()
         self.load_data()
 
     # This turns the chain attribute into a property with a getter (the method
     # below) and a setter (@chain.setter)
     @property
     def chain(self):
-        return self.__chain[:]
+        # A read-only view instead of a copy (use chain.snapshot() for
+        # consistent reads while blocks are added)
+        return ChainView(self.__chain, lock=self.__lock)
 
     # The setter for the chain property
     @chain.setter
     def chain(self, val):
         self.__chain = val
 
+    def get_height(self):
+        """Returns the number of blocks in the chain. """
+        with self.__lock.read():
+            return len(self.__chain)
+
+    def get_blocks(self, start, end):
+        """Returns the blocks in the range [start, end) without touching the
+        rest of the chain.
+
+        Arguments:
+            :start: The index of the first block.
+            :end: The index after the last block.
+        """
+        return self.chain[start:end]
+
+    def get_block_hashes(self, start, end):
+        """Returns the hashes of the blocks in the range [start, end) from the
+        storage, without decoding the blocks.
+
+        Arguments:
+            :start: The index of the first block.
+            :end: The index after the last block.
+        """
+        with self.__lock.read():
+            return self.__storage.block_hashes(start, end)
+
+    def get_headers(self, start, end):
+        """Returns the headers (index, hash and previous hash) of the blocks
+        in the range [start, end).
+
+        The headers are built from the stored hashes, so no block has to be
+        decoded (the previous hash of a block is the hash of its
+        predecessor). Only the first stored block is decoded for its previous
+        hash, the headers start there at the earliest.
+
+        Arguments:
+            :start: The index of the first block.
+            :end: The index after the last block.
+        """
+        with self.__lock.read():
+            base = self.__storage.base
+            start = max(start, base)
+            hashes = self.__storage.block_hashes(max(start - 1, base), end)
+            if start == base and hashes:
+                hashes.insert(0, self.__chain[base].previous_hash)
+        return [{
+            'index': index,
+            'hash': block_hash,
+            'previous_hash': previous_hash
+        } for index, previous_hash, block_hash in zip(
+            range(start, end), hashes, hashes[1:])]
+
+    def find_block(self, block_hash):
+        """Returns the index of the block with the given hash or None.
+
+        Arguments:
+            :block_hash: The hash of the block.
+        """
+        with self.__lock.read():
+            return self.__storage.find_block(block_hash)
+
     def get_open_transactions(self):
         """Returns a copy of the open transactions. """
-        return self.__open_transactions[:]
+        with self.__lock.read():
+            return list(self.__open_transactions)
 
     def load_data(self):
-        """Initialize blockchain and open transactions data from a file. """
+        """Initialize blockchain, open transactions and peer nodes from the
+        node's storage files. Blocks are only read when they are accessed. """
+        with self.__lock.write():
+            self.__load_data()
+        self.__persister.wait()
+
+    def __load_data(self):
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='r') as f:
-                # file_content = pickle.loads(f.read())
-                file_content = f.readlines()
-                # blockchain = file_content['chain']
-                # open_transactions = file_content['ot']
-                blockchain = json.loads(file_content[0][:-1])
-                # We need to convert  the loaded data because Transactions
-                # should use OrderedDict
-                updated_blockchain = []
-                for block in blockchain:
-                    converted_tx = [Transaction(
-                        tx['sender'],
-                        tx['recipient'],
-                        tx['signature'],
-                        tx['amount']) for tx in block['transactions']]
-                    updated_block = Block(
-                        block['index'],
-                        block['previous_hash'],
-                        converted_tx,
-                        block['proof'],
-                        block['timestamp'])
-                    updated_blockchain.append(updated_block)
-                self.chain = updated_blockchain
-                open_transactions = json.loads(file_content[1][:-1])
-                # We need to convert  the loaded data because Transactions
-                # should use OrderedDict
-                updated_transactions = []
-                for tx in open_transactions:
-                    updated_transaction = Transaction(
-                        tx['sender'],
-                        tx['recipient'],
-                        tx['signature'],
-                        tx['amount'])
-                    updated_transactions.append(updated_transaction)
-                self.__open_transactions = updated_transactions
-                peer_nodes = json.loads(file_content[2])
-                self.__peer_nodes = set(peer_nodes)
-        except (IOError, IndexError):
-            pass
-        finally:
-            print('Cleanup!')
+            if not self.__storage.open():
+                # A fresh node starts its block segment with the genesis
+                # block
+                self.__storage.append_block(
+                    self.__chain[0].to_dict(with_hash=True))
+        except IOError:
+            print('Loading failed!')
+            return
+        self.chain = LazyChain(
+            self.__storage, self.__decode_block, self.__encode_block,
+            self.__prune_depth)
+        transactions, height = self.__storage.load_open_transactions()
+        # A block is stored before the open transactions are saved without
+        # the transactions it includes, so after a crash in between they'd
+        # be open (and mined) again
+        confirmed = self.__confirmed_transaction_ids(height)
+        for tx in transactions:
+            transaction = Transaction.from_dict(tx)
+            if transaction.id not in confirmed:
+                self.__open_transactions.add(transaction)
+        self.__peer_nodes = set(self.__storage.load_peer_nodes())
+        self.__load_state()
+        if len(self.__open_transactions) != len(transactions):
+            self.__save_open_transactions()
+
+    def __confirmed_transaction_ids(self, height):
+        """Returns the ids of the transactions in the blocks from the given
+        height on.
+
+        Arguments:
+            :height: The chain height the open transactions were saved at
+            (None if the file doesn't record it).
+        """
+        if height is None:
+            # Files of older versions don't record the height, the blocks
+            # since the saved balance state (and the tip) are checked
+            state = self.__storage.load_state()
+            height = len(self.__chain) - 1
+            if state:
+                height = min(height, state['height'])
+        return {tx.id
+                for block in self.__chain[max(height, 0):]
+                for tx in block.transactions}
+
+    def __load_state(self):
+        """Restore the balance index from the saved state, booking only the
+        blocks which were added after it was saved. """
+        state = self.__storage.load_state()
+        height = len(self.__chain)
+        if not self.__matches_chain(state, height):
+            # The latest snapshot holds balances as well, so only the blocks
+            # after it are booked instead of the whole (possibly archived)
+            # chain. A chain bootstrapped from a snapshot lacks the blocks
+            # before it, so its balances can only start over from one.
+            state = self.__storage.load_snapshot()
+        if self.__matches_chain(state, height):
+            self.__ledger.restore(state['balances'],
+                                  self.__chain[state['height']:],
+                                  self.__open_transactions)
+        else:
+            # The state is missing or belongs to a replaced chain
+            if self.__storage.base:
+                print('Missing balances before block {}!'.format(
+                    self.__storage.base))
+            self.__ledger.rebuild(self.__chain, self.__open_transactions)
+        if not state or state['height'] != height:
+            self.__save_state()
 
-    def save_data(self):
-        """Save blockchain and open transactions snapshot on a file. """
+    def __matches_chain(self, state, height):
+        """Returns whether a saved state (or snapshot) belongs to the stored
+        chain of the given height. """
+        return bool(state) and (
+            self.__storage.base < state['height'] <= height and
+            self.__storage.block_hash(state['height'] - 1) ==
+            state['tip_hash'])
+
+    def __save_state(self):
+        """Save the confirmed balances together with the chain height and tip
+        they belong to. """
+        state = {
+            'height': len(self.__chain),
+            'tip_hash': self.__storage.block_hash(-1),
+            'balances': self.__ledger.confirmed_balances()
+        }
+        self.__persister.save(
+            'state', lambda: self.__storage.save_state(state))
+
+    def __append_block(self, block):
+        """Append a new block to the (stored) chain and book it on the
+        balances. """
         try:
-            with open('blockchain-{}.txt'.format(self.node_id), mode='w') as f:
-                saveable_chain = [
-                    block.__dict__ for block in
-                    [
-                        Block(block_el.index,
-                              block_el.previous_hash,
-                              [tx.__dict__ for tx in block_el.transactions],
-                              block_el.proof,
-                              block_el.timestamp) for block_el in self.__chain
-                    ]
-                ]
-                f.write(json.dumps(saveable_chain))
-                f.write('\n')
-                saveable_tx = [tx.__dict__ for tx in self.__open_transactions]
-                f.write(json.dumps(saveable_tx))
-                f.write('\n')
-                f.write(json.dumps(list(self.__peer_nodes)))
-                # save_data = {
-                #     'chain': blockchain,
-                #     'ot': open_transactions
-                # }
-                # f.write(pickle.dumps(save_data))
+            self.__chain.append(block)
         except IOError:
             print('Saving failed!')
+            return False
+        self.__save_blocks()
+        self.__ledger.apply_block(block)
+        if len(self.__chain) % STATE_INTERVAL == 0:
+            self.__save_state()
+        if len(self.__chain) % CHECKPOINT_INTERVAL == 0:
+            self.__save_snapshot()
+        return True
+
+    def __save_snapshot(self):
+        """Save a snapshot of the tip, the confirmed balances and the open
+        transactions (see utility.snapshot). """
+        tip = self.__chain[-1]
+        balances = self.__ledger.confirmed_balances()
+        # Transactions of the tip block may still be open while the block
+        # is added, they're confirmed already
+        included = {tx.id for tx in tip.transactions}
+        transactions = [tx for tx in self.__open_transactions
+                        if tx.id not in included]
+        self.__persister.save(
+            'snapshot',
+            lambda: self.__storage.save_snapshot(create_snapshot(
+                tip.to_dict(with_hash=True), balances,
+                [tx.to_dict() for tx in transactions])))
+
+    def get_snapshot(self):
+        """Returns a snapshot of the current tip, the confirmed balances and
+        the open transactions (see utility.snapshot). """
+        with self.__lock.read():
+            tip = self.__chain[-1]
+            balances = self.__ledger.confirmed_balances()
+            transactions = list(self.__open_transactions)
+        return create_snapshot(tip.to_dict(with_hash=True), balances,
+                               [tx.to_dict() for tx in transactions])
+
+    def bootstrap(self, snapshot, checkpoint=None):
+        """Replaces a fresh chain with the state of a snapshot. Only the
+        blocks after the snapshot's tip have to be fetched from the peers and
+        verified then (see resolve), the blocks before it are never stored.
+
+        Arguments:
+            :snapshot: The snapshot as dictionary (see utility.snapshot).
+            :checkpoint: The trusted checkpoint hash the snapshot has to
+            match (without it, the snapshot is only checked for damage).
+        """
+        try:
+            verify_snapshot(snapshot, checkpoint)
+            transactions = [Transaction.from_dict(tx)
+                            for tx in snapshot['open_transactions']]
+        except (KeyError, TypeError, ValueError) as error:
+            print('Bootstrapping failed: {}'.format(error))
+            return False
+        signatures_valid = Wallet.verify_transactions(transactions)
+        with self.__lock.write():
+            if len(self.__chain) > 1:
+                print('Snapshot ignored, the chain isn\'t fresh.')
+                return False
+            try:
+                self.__storage.replace_blocks([snapshot['tip']])
+            except IOError:
+                print('Saving failed!')
+                return False
+            self.chain = LazyChain(
+                self.__storage, self.__decode_block, self.__encode_block,
+                self.__prune_depth)
+            self.__cancel_mining()
+            self.__open_transactions.clear()
+            self.__ledger.restore(snapshot['balances'], [], [])
+            for transaction, signature_valid in zip(transactions,
+                                                    signatures_valid):
+                if signature_valid:
+                    self.__admit_transaction(transaction)
+            # The snapshot is kept, so the balances can be restored from it
+            # if the state file gets lost
+            self.__persister.save(
+                'snapshot', lambda: self.__storage.save_snapshot(snapshot))
+            self.__save_state()
+            self.__save_open_transactions()
+        self.__persister.wait()
+        return True
+
+    def __save_blocks(self):
+        """Sync the appended blocks (unless every append syncs them). """
+        if not self.__storage.sync_appends:
+            self.__persister.save('blocks', self.__storage.sync)
+
+    def __save_open_transactions(self):
+        """Save the open transactions. """
+        # Transactions are immutable, so the writer can encode them later
+        transactions = list(self.__open_transactions)
+        height = len(self.__chain)
+        self.__persister.save(
+            'open_transactions',
+            lambda: self.__storage.save_open_transactions(
+                [tx.to_dict() for tx in transactions], height))
+
+    def __save_peer_nodes(self):
+        """Save the peer nodes. """
+        peer_nodes = list(self.__peer_nodes)
+        self.__persister.save(
+            'peer_nodes', lambda: self.__storage.save_peer_nodes(peer_nodes))
+
+    def flush(self):
+        """Writes all outstanding changes to disk now. """
+        self.__persister.flush()
+
+    def close(self):
+        """Writes all outstanding changes and stops the background writer
+        (e.g. when the node shuts down). Running proof of work searches are
+        cancelled and the storage stops writing, so a blockchain replacing
+        this one can take over the files. """
+        self.__cancel_mining()
+        self.__persister.close()
+        with self.__lock.write():
+            self.__storage.close()
 
     def proof_of_work(self):
         """Generate a proof of work for the open transactions, the hash of the
         previous block and a random number (which is guessed until it fits)."""
-        last_block = self.__chain[-1]
-        last_hash = hash_block(last_block)
-        proof = 0
-        # Try different PoW numbers and return the first valid one
-        while not Verification.valid_proof(
-            self.__open_transactions,
-            last_hash, proof
-        ):
-            proof += 1
-        return proof
+        with self.__lock.read():
+            last_hash = self.__chain[-1].hash
+            transactions = self.__block_template()
+        return self.__miner.proof_of_work(transactions, last_hash)
 
     def get_balance(self, sender=None):
         """Calculate and return the balance for a participant.
@@ -153,49 +420,17 @@ class Blockchain:
             participant = self.public_key
         else:
             participant = sender
-        # Fetch a list of all sent coin amounts for the given person (empty
-        # lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of transactions that were already included
-        # in blocks of the blockchain
-        tx_sender = [[tx.amount for tx in block.transactions
-                      if tx.sender == participant] for block in self.__chain]
-        # Fetch a list of all sent coin amounts for the given person (empty
-        # lists are returned if the person was NOT the sender)
-        # This fetches sent amounts of open transactions (to avoid double
-        # spending)
-        open_tx_sender = [
-            tx.amount for tx in self.__open_transactions
-            if tx.sender == participant
-        ]
-        tx_sender.append(open_tx_sender)
-        print(tx_sender)
-        amount_sent = reduce(lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-                             if len(tx_amt) > 0 else tx_sum + 0, tx_sender, 0)
-        # This fetches received coin amounts of transactions that were already
-        # included in blocks of the blockchain
-        # We ignore open transactions here because you shouldn't be able to
-        # spend coins before the transaction was confirmed + included in a
-        # block
-        tx_recipient = [
-            [
-                tx.amount for tx in block.transactions
-                if tx.recipient == participant
-            ] for block in self.__chain
-        ]
-        amount_received = reduce(
-            lambda tx_sum, tx_amt: tx_sum + sum(tx_amt)
-            if len(tx_amt) > 0 else tx_sum + 0,
-            tx_recipient,
-            0
-        )
-        # Return the total balance
-        return amount_received - amount_sent
+        # Confirmed balances are booked whenever a block is added and open
+        # transactions reserve their amount (to avoid double spending).
+        # Received amounts of open transactions are ignored because you
+        # shouldn't be able to spend coins before the transaction was
+        # confirmed + included in a block
+        with self.__lock.read():
+            return self.__ledger.balance(participant)
 
     def get_last_blockchain_value(self):
         """ Returns the last value of the blockchain. """
-        if len(self.__chain) < 1:
-            return None
-        return self.__chain[-1]
+        return self.chain.tip
 
     # This function accepts two arguments.
     # One required one (transaction_amount) and one optional one
@@ -207,13 +442,16 @@ class Blockchain:
                         sender,
                         signature,
                         amount=1.0,
-                        is_receiving=False):
+                        is_receiving=False,
+                        fee=0):
         """ Append a new value and the last blockchain value to the blockchain.
 
         Arguments:
             :sender: The sender of the coins.
             :recipient: The recipient of the coins.
             :amount: The amount of coins (default = 1.0)
+            :fee: The coins paid to the miner (default = 0, signed along
+            with the transaction if there is one)
         """
         # transaction = {
         #     'sender': sender,
@@ -222,175 +460,477 @@ class Blockchain:
         # }
         # if self.public_key == None:
         #     return False
-        transaction = Transaction(sender, recipient, signature, amount)
-        if Verification.verify_transaction(transaction, self.get_balance):
-            self.__open_transactions.append(transaction)
-            self.save_data()
-            if not is_receiving:
-                for node in self.__peer_nodes:
-                    url = 'http://{}/broadcast-transaction'.format(node)
-                    try:
-                        response = requests.post(url,
-                                                 json={
-                                                     'sender': sender,
-                                                     'recipient': recipient,
-                                                     'amount': amount,
-                                                     'signature': signature
-                                                 })
-                        if (response.status_code == 400 or
-                                response.status_code == 500):
-                            print('Transaction failed, needs resolving')
-                            return False
-                    except requests.exceptions.ConnectionError:
-                        continue
-            return True
-        return False
-
-    def mine_block(self):
-        """Create a new block and add open transactions. """
+        transaction = Transaction(sender, recipient, signature, amount, fee)
+        # The signature is checked before taking the lock (the result is
+        # cached, so checking it again below is cheap)
+        if not Wallet.verify_transaction(transaction):
+            return False
+        with self.__lock.write():
+            if transaction.id in self.__open_transactions:
+                # We already know this transaction (e.g. it was broadcast
+                # twice)
+                return True
+            if not self.__admit_transaction(transaction):
+                return False
+            self.__save_open_transactions()
+            peer_nodes = list(self.__peer_nodes)
+        self.__persister.wait()
+        if not is_receiving:
+            dict_transaction = transaction.to_dict()
+            statuses = self.__broadcaster.broadcast(
+                peer_nodes, '/broadcast-transaction', dict_transaction,
+                codec.encode_transaction(dict_transaction))
+            if any(status == 400 or status == 500
+                   for status in statuses.values()):
+                print('Transaction failed, needs resolving')
+                return False
+        return True
+
+    def add_transactions(self, transactions, is_receiving=False):
+        """Adds several transactions at once and returns whether each of them
+        was accepted (in the same order).
+
+        The transactions are checked in order against the running balances,
+        so a batch can't spend the same coins twice. The signatures are
+        verified together, the open transactions are saved once and the
+        accepted transactions are sent to the peers as one batch.
+
+        Arguments:
+            :transactions: The transactions as dictionaries (with sender,
+            recipient, amount, signature and optionally fee).
+            :is_receiving: Whether the batch was broadcast by a peer (and
+            mustn't be broadcast again).
+        """
+        converted_transactions = [Transaction.from_dict(tx)
+                                  for tx in transactions]
+        signatures_valid = Wallet.verify_transactions(converted_transactions)
+        results = []
+        accepted = []
+        with self.__lock.write():
+            for transaction, signature_valid in zip(converted_transactions,
+                                                    signatures_valid):
+                if transaction.id in self.__open_transactions:
+                    results.append(True)
+                    continue
+                admitted = (signature_valid and
+                            self.__admit_transaction(transaction))
+                if admitted:
+                    accepted.append(transaction)
+                results.append(admitted)
+            if accepted:
+                self.__save_open_transactions()
+            peer_nodes = list(self.__peer_nodes)
+        self.__persister.wait()
+        if accepted and not is_receiving:
+            self.__broadcast_transactions(peer_nodes, accepted)
+        return results
+
+    def __admit_transaction(self, transaction):
+        """Checks the funds for a transaction (its signature is checked
+        already) and adds it to the open transactions. """
+        if not Verification.verify_transaction(transaction,
+                                               self.__ledger.balance):
+            return False
+        for evicted in self.__open_transactions.add(transaction):
+            if evicted.id != transaction.id:
+                self.__ledger.remove_pending(evicted)
+        # A full pool evicts the new transaction itself if its fee is the
+        # lowest. Its funds are only reserved once it's in the pool.
+        if transaction.id not in self.__open_transactions:
+            return False
+        self.__ledger.add_pending(transaction)
+        return True
+
+    def __block_template(self):
+        """Returns the open transactions for the next block (highest fees
+        first, within the block caps). """
+        return self.__open_transactions.template(
+            self.max_block_transactions, self.max_block_bytes)
+
+    def __broadcast_transactions(self, peer_nodes, transactions):
+        """Sends transactions to the peers as one batch (one by one to peers
+        without the batch endpoint). """
+        dict_transactions = [tx.to_dict() for tx in transactions]
+        statuses = self.__broadcaster.broadcast(
+            peer_nodes, '/broadcast-transactions',
+            {'transactions': dict_transactions},
+            codec.encode_transactions(dict_transactions))
+        for node, status in statuses.items():
+            if status == 404:
+                for tx in dict_transactions:
+                    response = self.__broadcaster.post(
+                        node, '/broadcast-transaction', tx,
+                        codec.encode_transaction(tx))
+                    status = (response.status_code if response is not None
+                              else None)
+                    if status == 400 or status == 500:
+                        break
+            if status == 400 or status == 500:
+                print('Transactions declined, needs resolving')
+
+    def mine_block(self, cancel=None):
+        """Create a new block and add open transactions.
+
+        Arguments:
+            :cancel: An optional event which stops mining when set. It's also
+            set when a competing block for the same height is added.
+        """
         # Fetch the currently last block of the blockchain
         if self.public_key is None:
             return None
-        last_block = self.__chain[-1]
+        with self.__lock.read():
+            last_block = self.__chain[-1]
+            # Copy transaction instead of manipulating the original
+            # open_transactions list
+            # This ensures that if for some reason the mining should fail,
+            # we don't have the reward transaction stored in the open
+            # transactions
+            # It also fixes the transactions covered by the proof while new
+            # ones keep arriving during the search
+            copied_transactions = self.__block_template()
         # Hash the last block (=> to be able to compare it to the stored hash
         # value)
-        hashed_block = hash_block(last_block)
-        proof = self.proof_of_work()
+        hashed_block = last_block.hash
+        if not all(Wallet.verify_transactions(copied_transactions)):
+            return None
+        if cancel is None:
+            cancel = Event()
+        self.__mining_cancels.add(cancel)
+        try:
+            proof = self.__miner.proof_of_work(
+                copied_transactions, hashed_block, cancel)
+        finally:
+            self.__mining_cancels.discard(cancel)
+        if proof is None:
+            return None
         # Miners should be rewarded, so let's create a reward transaction
         # reward_transaction = {
         #     'sender': 'MINING',
         #     'recipient': owner,
         #     'amount': MINING_REWARD
         # }
+        # The miner also collects the fees of the included transactions
         reward_transaction = Transaction(
-            'MINING', self.public_key, '', MINING_REWARD)
-        # Copy transaction instead of manipulating the original
-        # open_transactions list
-        # This ensures that if for some reason the mining should fail,
-        # we don't have the reward transaction stored in the open transactions
-        copied_transactions = self.__open_transactions[:]
-        for tx in copied_transactions:
-            if not Wallet.verify_transaction(tx):
-                return None
+            'MINING', self.public_key, '',
+            MINING_REWARD + sum(tx.fee for tx in copied_transactions))
         copied_transactions.append(reward_transaction)
-        block = Block(len(self.__chain), hashed_block,
+        block = Block(last_block.index + 1, hashed_block,
                       copied_transactions, proof)
-        self.__chain.append(block)
-        self.__open_transactions = []
-        self.save_data()
-        for node in self.__peer_nodes:
-            url = 'http://{}/broadcast-block'.format(node)
-            converted_block = block.__dict__.copy()
-            converted_block['transactions'] = [
-                tx.__dict__ for tx in converted_block['transactions']]
-            try:
-                response = requests.post(url, json={'block': converted_block})
-                if response.status_code == 400 or response.status_code == 500:
-                    print('Block declined, needs resolving')
-                if response.status_code == 409:
-                    self.resolve_conflicts = True
-            except requests.exceptions.ConnectionError:
-                continue
+        with self.__lock.write():
+            # Give up if another block took over the tip in the meantime
+            if self.__chain[-1].hash != hashed_block:
+                return None
+            if not self.__funds_still_reserved(copied_transactions[:-1]):
+                return None
+            if not self.__append_block(block):
+                return None
+            for tx in copied_transactions[:-1]:
+                if self.__open_transactions.remove(tx.id) is not None:
+                    self.__ledger.remove_pending(tx)
+            self.__save_open_transactions()
+            peer_nodes = list(self.__peer_nodes)
+        self.__persister.wait()
+        dict_block = block.to_dict()
+        statuses = self.__broadcaster.broadcast(
+            peer_nodes, '/broadcast-block', {'block': dict_block},
+            codec.encode_block(dict_block))
+        for status in statuses.values():
+            if status == 400 or status == 500:
+                print('Block declined, needs resolving')
+            if status == 409:
+                self.resolve_conflicts = True
         return block
 
+    def __funds_still_reserved(self, transactions):
+        """Checks the funds of mined transactions which were evicted from
+        the open transactions during the proof of work search. Their
+        reservation was released, so the sender may have spent the coins
+        again in the meantime.
+
+        Arguments:
+            :transactions: The transactions covered by the proof.
+        """
+        evicted = [tx for tx in transactions
+                   if tx.id not in self.__open_transactions]
+        reserved = []
+        funded = True
+        for tx in evicted:
+            # Evicted transactions of the same sender are checked together
+            if not Verification.verify_transaction(tx,
+                                                   self.__ledger.balance):
+                funded = False
+                break
+            self.__ledger.add_pending(tx)
+            reserved.append(tx)
+        for tx in reserved:
+            self.__ledger.remove_pending(tx)
+        return funded
+
     def add_block(self, block):
         """Add a block which was received via broadcasting to the local
         blockchain. """
-        # Create a list of transaction objects
-        transactions = [Transaction(
-            tx['sender'],
-            tx['recipient'],
-            tx['signature'],
-            tx['amount']) for tx in block['transactions']]
+        # Create a Block object (with a list of transaction objects)
+        try:
+            converted_block = Block.from_dict(block)
+        except (KeyError, TypeError, AttributeError):
+            return False
+        # Fields of the wrong type would only fail when the block is stored
+        if not Verification.valid_fields(converted_block):
+            return False
+        transactions = converted_block.transactions
         # Validate the proof of work of the block and store the result (True
         # or False) in a variable
         proof_is_valid = Verification.valid_proof(
-            transactions[:-1], block['previous_hash'], block['proof'])
-        # Check if previous_hash stored in the block is equal to the local
-        # blockchain's last block's hash and store the result in a block
-        hashes_match = hash_block(self.chain[-1]) == block['previous_hash']
-        if not proof_is_valid or not hashes_match:
+            transactions[:-1], converted_block.previous_hash,
+            converted_block.proof)
+        if not proof_is_valid:
             return False
-        # Create a Block object
-        converted_block = Block(
-            block['index'],
-            block['previous_hash'],
-            transactions,
-            block['proof'],
-            block['timestamp'])
-        self.__chain.append(converted_block)
-        stored_transactions = self.__open_transactions[:]
-        # Check which open transactions were included in the received block
-        # and remove them
-        # This could be improved by giving each transaction an ID that would
-        # uniquely identify it
-        for itx in block['transactions']:
-            for opentx in stored_transactions:
-                if (opentx.sender == itx['sender'] and
-                        opentx.recipient == itx['recipient'] and
-                        opentx.amount == itx['amount'] and
-                        opentx.signature == itx['signature']):
-                    try:
-                        self.__open_transactions.remove(opentx)
-                    except ValueError:
-                        print('Item was already removed')
-        self.save_data()
+        with self.__lock.write():
+            # Check if previous_hash stored in the block is equal to the
+            # local blockchain's last block's hash
+            if self.__chain[-1].hash != converted_block.previous_hash:
+                return False
+            if not self.__append_block(converted_block):
+                return False
+            # Any block we're still mining for this height is stale now
+            self.__cancel_mining()
+            # Remove the open transactions which were included in the
+            # received block
+            for tx in transactions:
+                opentx = self.__open_transactions.remove(tx.id)
+                if opentx is not None:
+                    self.__ledger.remove_pending(opentx)
+            self.__save_open_transactions()
+        self.__persister.wait()
         return True
 
     def resolve(self):
         """Checks all peer nodes' blockchains and replaces the local one with
-        a longer valid one. """
+        a longer valid one.
+
+        Only the block hashes are compared to find where a peer's chain forks
+        from the local one, and only the blocks after the fork are downloaded
+        and verified.
+        """
+        # The peers' chains are compared with a snapshot of the local chain
+        # (without holding the lock while talking to the peers)
+        with self.__lock.read():
+            local_chain = ChainView(self.__chain, len(self.__chain),
+                                    self.__lock)
+            generation = self.__chain.generation
+            peer_nodes = list(self.__peer_nodes)
+        # Healthy peers are asked first, quarantined ones are skipped
+        peer_nodes = self.__broadcaster.rank(peer_nodes)
         # Initialize the winner chain with the local chain
-        winner_chain = self.chain
+        winner_chain_length = len(local_chain)
+        winner_fork = None
+        winner_blocks = None
         replace = False
-        for node in self.__peer_nodes:
-            url = 'http://{}/chain'.format(node)
+        for node in peer_nodes:
             try:
-                # Send a request and store the response
-                response = requests.get(url)
-                # Retrieve the JSON data as a dictionary
-                node_chain = response.json()
-                # Convert the dictionary list to a list of block AND
-                # transaction objects
-                node_chain = [
-                    Block(block['index'],
-                          block['previous_hash'],
-                          [
-                        Transaction(
-                            tx['sender'],
-                            tx['recipient'],
-                            tx['signature'],
-                            tx['amount']) for tx in block['transactions']
-                    ],
-                        block['proof'],
-                        block['timestamp']) for block in node_chain
-                ]
-                node_chain_length = len(node_chain)
-                local_chain_length = len(winner_chain)
-                # Store the received chain as the current winner chain if it's
-                # longer AND valid
-                if (node_chain_length > local_chain_length and
-                        Verification.verify_chain(node_chain)):
-                    winner_chain = node_chain
-                    replace = True
-            except requests.exceptions.ConnectionError:
+                candidate = self.__fetch_longer_chain(
+                    node, local_chain, winner_chain_length)
+            except (KeyError, TypeError, ValueError):
+                # The peer didn't answer with a valid chain
+                continue
+            if candidate is None:
                 continue
+            fork, node_blocks = candidate
+            if fork <= local_chain.base:
+                # The peer's chain forks before the snapshot the local chain
+                # was bootstrapped from (or, without a snapshot, has another
+                # genesis block), the stored blocks can't be replaced
+                continue
+            # The blocks after the fork are verified against the last shared
+            # local block
+            previous_block = local_chain[fork - 1] if fork > 0 else None
+            # Store the received chain as the current winner chain if it's
+            # longer AND valid (and every block can be stored)
+            if (all(map(Verification.valid_fields, node_blocks)) and
+                    Verification.verify_chain(node_blocks, 0,
+                                              previous_block)):
+                winner_chain_length = fork + len(node_blocks)
+                winner_fork = fork
+                winner_blocks = node_blocks
+                replace = True
         self.resolve_conflicts = False
-        # Replace the local chain with the winner chain
-        self.chain = winner_chain
-        if replace:
-            self.__open_transactions = []
-        self.save_data()
+        if not replace:
+            return False
+        with self.__lock.write():
+            # The local chain may have changed while the peers were asked:
+            # the winner still has to be longer and fork from unchanged
+            # blocks
+            if (winner_chain_length <= len(self.__chain) or
+                    self.__chain.stable_length(generation) < winner_fork):
+                return False
+            # Replace the local blocks after the fork with the winner chain's
+            # blocks
+            dropped_blocks = self.__chain[winner_fork:]
+            try:
+                self.__chain.truncate(winner_fork)
+                self.__chain.extend(winner_blocks)
+                self.__save_blocks()
+            except (IOError, ValueError, TypeError):
+                print('Saving failed!')
+                replace = False
+                self.__restore_blocks(winner_fork, dropped_blocks)
+            self.__cancel_mining()
+            self.__open_transactions.clear()
+            self.__ledger.clear_pending()
+            if replace:
+                # Only the blocks after the fork change the balances
+                self.__ledger.reorganize(dropped_blocks, winner_blocks)
+            else:
+                # The dropped blocks are back (or, if restoring them failed
+                # too, the chain was replaced partially)
+                self.__ledger.rebuild(self.__chain, self.__open_transactions)
+            self.__save_state()
+            if (len(self.__chain) // CHECKPOINT_INTERVAL >
+                    winner_fork // CHECKPOINT_INTERVAL):
+                self.__save_snapshot()
+            self.__save_open_transactions()
+        self.__persister.wait()
         return replace
 
+    def __restore_blocks(self, fork, blocks):
+        """Puts the local blocks after a fork back after replacing them
+        failed (e.g. a winner block couldn't be encoded after the local
+        blocks were cut off).
+
+        Arguments:
+            :fork: The number of blocks before the fork.
+            :blocks: The local blocks after the fork.
+        """
+        try:
+            self.__chain.truncate(fork)
+            self.__chain.extend(blocks)
+            self.__save_blocks()
+        except (IOError, ValueError):
+            print('Saving failed!')
+
+    def __fetch_longer_chain(self, node, local_chain, min_length):
+        """Returns the fork point and the blocks after it (as objects) of a
+        peer's chain if it's longer than the given length, otherwise None.
+
+        Arguments:
+            :node: The peer node.
+            :local_chain: The snapshot of the local chain to compare with.
+            :min_length: The length the peer's chain has to exceed.
+        """
+        response = self.__broadcaster.get(node, '/chain/height')
+        if response is None:
+            return None
+        if response.status_code == 404:
+            # The peer only offers its full chain
+            return self.__fetch_full_chain(node, local_chain, min_length)
+        height = response.json()['height']
+        if height <= min_length:
+            return None
+        fork = self.__find_fork(node, len(local_chain), height)
+        if fork is None:
+            return None
+        blocks = []
+        for start in range(fork, height, SYNC_BATCH_SIZE):
+            response = self.__broadcaster.get(
+                node, '/chain/blocks?start={}&end={}'.format(
+                    start, min(start + SYNC_BATCH_SIZE, height)),
+                binary=True)
+            if response is None or response.status_code != 200:
+                return None
+            # Peers without the binary encoding answer with JSON
+            if (response.headers.get('Content-Type', '').split(';')[0] ==
+                    codec.CONTENT_TYPE):
+                try:
+                    blocks.extend(codec.decode_blocks(response.content))
+                except ValueError:
+                    return None
+            else:
+                blocks.extend(response.json())
+        if fork + len(blocks) <= min_length:
+            return None
+        # Convert the dictionary list to a list of block AND transaction
+        # objects
+        return fork, [Block.from_dict(block) for block in blocks]
+
+    def __find_fork(self, node, local_height, height):
+        """Compares the block hashes of a peer with the local ones (starting
+        at the tip and going back further until a shared block is found) and
+        returns the index of the first differing block.
+
+        Arguments:
+            :node: The peer node.
+            :local_height: The height of the local chain snapshot.
+            :height: The height of the peer's chain.
+        """
+        # The hashes are compared in windows [start, end) which move back
+        # (and grow) until a shared block is found
+        # Blocks before the base (of a bootstrapped chain) aren't stored
+        base = self.__storage.base
+        end = min(local_height, height)
+        window = SYNC_BATCH_SIZE
+        while True:
+            start = max(base, end - window)
+            response = self.__broadcaster.get(
+                node, '/chain/headers?start={}&limit={}'.format(
+                    start, end - start))
+            if response is None or response.status_code != 200:
+                return None
+            headers = response.json()
+            if len(headers) != end - start:
+                return None
+            local_hashes = self.__storage.block_hashes(start, end)
+            for offset, header in enumerate(headers):
+                if header['hash'] != local_hashes[offset]:
+                    break
+            else:
+                return end
+            if offset > 0 or start == base:
+                return start + offset
+            # Even the first compared block differs, look further back
+            end = start
+            window *= 2
+
+    def __fetch_full_chain(self, node, local_chain, min_length):
+        """Downloads a peer's full chain (for peers without the sync
+        endpoints) and returns it like __fetch_longer_chain. """
+        response = self.__broadcaster.get(node, '/chain')
+        if response is None:
+            return None
+        node_chain = response.json()
+        if len(node_chain) <= min_length:
+            return None
+        node_blocks = [Block.from_dict(block) for block in node_chain]
+        try:
+            fork = Verification.fork_point(local_chain, node_blocks)
+        except IndexError:
+            # The chains differ down to the base of the local chain
+            return None
+        return fork, node_blocks[fork:]
+
+    @staticmethod
+    def __decode_block(block):
+        # The stored hash comes from our own, checksummed block segment
+        return Block.from_dict(block, trust_hash=True)
+
+    @staticmethod
+    def __encode_block(block):
+        return block.to_dict(with_hash=True)
+
+    def __cancel_mining(self):
+        """Stops all running proof of work searches. """
+        for cancel in list(self.__mining_cancels):
+            cancel.set()
+
     def add_peer_node(self, node):
         """Adds a new node to the peer node set.
 
         Arguments:
             :node: The peer node which should be added.
         """
-        self.__peer_nodes.add(node)
-        self.save_data()
+        with self.__lock.write():
+            self.__peer_nodes.add(node)
+            self.__save_peer_nodes()
+        self.__persister.wait()
 
     def remove_peer_node(self, node):
         """Removes a node from the peer node set.
@@ -398,9 +938,17 @@ class Blockchain:
         Arguments:
             :node: The peer node which should be removed.
         """
-        self.__peer_nodes.discard(node)
-        self.save_data()
+        with self.__lock.write():
+            self.__peer_nodes.discard(node)
+            self.__save_peer_nodes()
+        self.__broadcaster.forget(node)
+        self.__persister.wait()
 
     def get_peer_nodes(self):
         """Return a list of all connected nodes."""
-        return list(self.__peer_nodes)
+        with self.__lock.read():
+            return list(self.__peer_nodes)
+
+    def get_peer_stats(self):
+        """Returns the health of every peer node (see PeerHealth.to_dict). """
+        return self.__broadcaster.stats(self.get_peer_nodes())
@@ -1,11 +1,42 @@
-from flask import Flask, jsonify, request, send_from_directory
+from collections import OrderedDict
+from threading import Lock
+
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
 
 from wallet import Wallet
-from blockchain import Blockchain
+from utility import codec, node_api
 
 app = Flask(__name__)
 CORS(app)
+mining_jobs = OrderedDict()
+mining_jobs_lock = Lock()
+# The further Blockchain arguments set by the command line options (see
+# node_api.blockchain_options)
+blockchain_options = {}
+
+
+def new_blockchain():
+    """Creates the blockchain of this node for the current wallet (the
+    running mining jobs are stopped first). """
+    with mining_jobs_lock:
+        jobs = list(mining_jobs.values())
+    return node_api.new_blockchain(blockchain, wallet.public_key, port,
+                                   blockchain_options, jobs)
+
+
+def respond(result):
+    """Turns the result of a shared handler (see utility.node_api) into a
+    response: streamed and binary bodies are sent as they are, everything
+    else as JSON.
+
+    Arguments:
+        :result: The response, its status and optionally its headers.
+    """
+    response, status = result[:2]
+    if isinstance(response, bytes) or hasattr(response, '__next__'):
+        return Response(response, status=status, headers=result[2])
+    return jsonify(response), status
 
 
 @app.route('/', methods=['GET'])
@@ -20,266 +51,144 @@ def get_network_ui():
 
 @app.route('/wallet', methods=['POST'])
 def create_keys():
+    global blockchain
     wallet.create_keys()
-    if wallet.save_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
-        response = {
-            'public_key': wallet.public_key,
-            'private_key': wallet.private_key,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Error in saving the keys.'
-        }
-        return jsonify(response), 500
+    saved = wallet.save_keys()
+    if saved:
+        blockchain = new_blockchain()
+    return respond(node_api.wallet_keys(
+        wallet, blockchain, saved, 'Error in saving the keys.'))
 
 
 @app.route('/wallet', methods=['GET'])
 def load_keys():
-    if wallet.load_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
-        response = {
-            'public_key': wallet.public_key,
-            'private_key': wallet.private_key,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Error in loading keys.'
-        }
-        return jsonify(response), 500
+    global blockchain
+    loaded = wallet.load_keys()
+    if loaded:
+        blockchain = new_blockchain()
+    return respond(node_api.wallet_keys(
+        wallet, blockchain, loaded, 'Error in loading keys.'))
 
 
 @app.route('/balance', methods=['GET'])
 def get_balance():
-    balance = blockchain.get_balance()
-    if balance is not None:
-        response = {
-            'message': 'Balance fetched successfully.',
-            'funds': balance
-        }
-        return jsonify(response), 200
-    else:
-        response = {
-            'messsage': 'Loading balance failed.',
-            'wallet_set_up': wallet.public_key is not None
-        }
-        return jsonify(response), 500
+    return respond(node_api.get_balance(wallet, blockchain))
 
 
 @app.route('/broadcast-transaction', methods=['POST'])
 def broadcast_transaction():
-    values = request.get_json()
-    if not values:
-        response = {'message': 'No data found.'}
-        return jsonify(response), 400
-    required = ['sender', 'recipient', 'amount', 'signature']
-    if not all(key in values for key in required):
-        response = {'message': 'Some data is missing.'}
-        return jsonify(response), 400
-    success = blockchain.add_transaction(
-        values['recipient'],
-        values['sender'],
-        values['signature'],
-        values['amount'],
-        is_receiving=True)
-    if success:
-        response = {
-            'message': 'Transaction added successfully.',
-            'transaction': {
-                'sender': values['sender'],
-                'recipient': values['recipient'],
-                'amount': values['amount'],
-                'signature': values['signature']
-            }
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Creating a transaction failed.'
-        }
-        return jsonify(response), 500
+    return respond(node_api.broadcast_transaction(blockchain, request))
 
 
 @app.route('/broadcast-block', methods=['POST'])
 def broadcast_block():
-    values = request.get_json()
-    if not values:
-        response = {'message': 'No data found.'}
-        return jsonify(response), 400
-    if 'block' not in values:
-        response = {'message': 'Some data is missing.'}
-        return jsonify(response), 400
-    block = values['block']
-    if block['index'] == blockchain.chain[-1].index + 1:
-        if blockchain.add_block(block):
-            response = {'message': 'Block added'}
-            return jsonify(response), 201
-        else:
-            response = {'message': 'Block seems invalid.'}
-            return jsonify(response), 409
-    elif block['index'] > blockchain.chain[-1].index:
-        response = {
-            'message': 'Blockchain differs from local blockchain.'}
-        blockchain.resolve_conflicts = True
-        return jsonify(response), 200
-    else:
-        response = {
-            'message': 'Blockchain shorter, block not added'}
-        return jsonify(response), 409
+    return respond(node_api.broadcast_block(blockchain, request))
 
 
 @app.route('/transaction', methods=['POST'])
 def add_transaction():
-    if wallet.public_key is None:
-        response = {
-            'message': 'No wallet set up.'
-        }
-        return jsonify(response), 400
-    values = request.get_json()
-    if not values:
-        response = {
-            'message': 'No data found.'
-        }
-        return jsonify(response), 400
-    required_fields = ['recipient', 'amount']
-    if not all(field in values for field in required_fields):
-        response = {
-            'message': 'Required data is missing.'
-        }
-        return jsonify(response), 400
-    recipient = values['recipient']
-    amount = values['amount']
-    signature = wallet.sign_transaction(wallet.public_key, recipient, amount)
-    success = blockchain.add_transaction(
-        recipient, wallet.public_key, signature, amount)
-    if success:
-        response = {
-            'message': 'Transaction added successfully.',
-            'transaction': {
-                'sender': wallet.public_key,
-                'recipient': recipient,
-                'amount': amount,
-                'signature': signature
-            },
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Creating a transaction failed.'
-        }
-        return jsonify(response), 500
+    return respond(node_api.add_transaction(
+        wallet, blockchain, request.get_json()))
+
+
+@app.route('/transactions/batch', methods=['POST'])
+def add_transactions():
+    return respond(node_api.add_transactions(
+        wallet, blockchain, request.get_json()))
+
+
+@app.route('/broadcast-transactions', methods=['POST'])
+def broadcast_transactions():
+    return respond(node_api.broadcast_transactions(blockchain, request))
 
 
 @app.route('/mine', methods=['POST'])
 def mine():
-    if blockchain.resolve_conflicts:
-        response = {'message': 'Block not added! Resolve conflicts first.'}
-        return jsonify(response), 409
-    block = blockchain.mine_block()
-    if block is not None:
-        dict_block = block.__dict__.copy()
-        dict_block['transactions'] = [
-            tx.__dict__ for tx in dict_block['transactions']]
-        response = {
-            'message': 'Block added successfully.',
-            'block': dict_block,
-            'funds': blockchain.get_balance()
-        }
-        return jsonify(response), 201
-    else:
-        response = {
-            'message': 'Adding a block failed.',
-            'wallet_set_up': wallet.public_key is not None
-        }
-        return jsonify(response), 500
+    with mining_jobs_lock:
+        return respond(node_api.mine(wallet, blockchain, mining_jobs))
+
+
+@app.route('/mine/<job_id>', methods=['GET'])
+def get_mining_job(job_id):
+    with mining_jobs_lock:
+        job = mining_jobs.get(job_id)
+    return respond(node_api.get_mining_job(blockchain, job))
 
 
 @app.route('/resolve-conflicts', methods=['POST'])
 def resolve_conflicts():
-    replaced = blockchain.resolve()
-    if replaced:
-        response = {'message': 'Chain replaced.'}
-    else:
-        response = {'message': 'Keeping local chain.'}
-    return jsonify(response), 200
+    return respond(node_api.resolve_conflicts(blockchain))
 
 
 @app.route('/transactions', methods=['GET'])
 def get_open_transaction():
-    transactions = blockchain.get_open_transactions()
-    dict_transactions = [tx.__dict__ for tx in transactions]
-    return jsonify(dict_transactions), 200
+    return respond(node_api.get_open_transactions(blockchain))
 
 
 @app.route('/chain', methods=['GET'])
 def get_chain():
-    chain_snapshot = blockchain.chain
-    dict_chain = [block.__dict__.copy() for block in chain_snapshot]
-    for dict_block in dict_chain:
-        dict_block['transactions'] = [
-            tx.__dict__ for tx in dict_block['transactions']]
-    return jsonify(dict_chain), 200
+    return respond(node_api.get_chain(
+        blockchain, request.args.get('start', 0, type=int),
+        request.args.get('limit', type=int)))
+
+
+@app.route('/chain/height', methods=['GET'])
+def get_chain_height():
+    return respond(node_api.get_chain_height(blockchain))
+
+
+@app.route('/chain/headers', methods=['GET'])
+def get_chain_headers():
+    return respond(node_api.get_chain_headers(
+        blockchain, request.args.get('start', 0, type=int),
+        request.args.get('limit', type=int)))
+
+
+@app.route('/chain/blocks', methods=['GET'])
+def get_chain_blocks():
+    # Peers asking for the binary encoding get it, everyone else JSON
+    binary = request.accept_mimetypes.best_match(
+        ['application/json', codec.CONTENT_TYPE]) == codec.CONTENT_TYPE
+    return respond(node_api.get_chain_blocks(
+        blockchain, request.args.get('start', 0, type=int),
+        request.args.get('end', type=int), binary))
+
+
+@app.route('/snapshot', methods=['GET'])
+def get_snapshot():
+    return respond(node_api.get_snapshot(blockchain))
 
 
 @app.route('/node', methods=['POST'])
 def add_node():
-    values = request.get_json()
-    if not values:
-        response = {
-            'message': 'No data attached.'
-        }
-        return jsonify(response), 400
-    if 'node' not in values:
-        response = {
-            'message': 'No node data found.'
-        }
-        return jsonify(response), 400
-    node = values['node']
-    blockchain.add_peer_node(node)
-    response = {
-        'message': 'Node added successfully.',
-        'all_nodes': blockchain.get_peer_nodes()
-    }
-    return jsonify(response), 201
+    return respond(node_api.add_node(blockchain, request.get_json()))
 
 
 @app.route('/node/<node_url>', methods=['DELETE'])
 def remove_node(node_url):
-    if node_url == '' or node_url is None:
-        response = {
-            'message': 'No node found.'
-        }
-        return jsonify(response), 400
-    blockchain.remove_peer_node(node_url)
-    response = {
-        'message': 'Node removed',
-        'all_nodes': blockchain.get_peer_nodes()
-    }
-    return jsonify(response), 200
+    return respond(node_api.remove_node(blockchain, node_url))
 
 
 @app.route('/nodes', methods=['GET'])
 def get_nodes():
-    nodes = blockchain.get_peer_nodes()
-    response = {
-        'all_nodes': nodes
-    }
-    return jsonify(response), 200
+    return respond(node_api.get_nodes(blockchain))
+
+
+@app.route('/nodes/stats', methods=['GET'])
+def get_node_stats():
+    return respond(node_api.get_node_stats(blockchain))
 
 
 if __name__ == '__main__':
-    from argparse import ArgumentParser
-    parser = ArgumentParser()
-    parser.add_argument('-p', '--port', type=int, default=3000)
-    args = parser.parse_args()
+    args = node_api.argument_parser().parse_args()
     port = args.port
+    blockchain_options = node_api.blockchain_options(args)
     wallet = Wallet(port)
-    blockchain = Blockchain(wallet.public_key, port)
-    app.run(host='0.0.0.0', port=port)
+    blockchain = None
+    blockchain = new_blockchain()
+    node_api.bootstrap(blockchain, args)
+    try:
+        app.run(host='0.0.0.0', port=port)
+    finally:
+        # Write the outstanding changes before the node stops
+        blockchain.close()
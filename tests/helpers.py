@@ -0,0 +1,42 @@
+"""Provides helpers shared by the tests. """
+
+import os
+import tempfile
+import unittest
+
+from block import Block
+from transaction import Transaction
+from utility.verification import Verification
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Runs every test in a fresh temporary directory (the storage files
+    are named relative to the working directory). """
+
+    def setUp(self):
+        self.__directory = tempfile.TemporaryDirectory()
+        self.__cwd = os.getcwd()
+        os.chdir(self.__directory.name)
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__directory.cleanup()
+
+
+def transfer(sender, recipient, amount, fee=0):
+    """Returns a transaction (with a dummy signature, the ledger, the
+    storage and the mempool don't check it). """
+    return Transaction(sender, recipient, 'ab' * 4, amount, fee)
+
+
+def make_block(previous_block, transactions, miner='miner', reward=10):
+    """Returns the block after the given one with a valid proof of work and
+    a reward transaction for the miner. """
+    proof = 0
+    while not Verification.valid_proof(transactions, previous_block.hash,
+                                       proof):
+        proof += 1
+    reward_transaction = Transaction('MINING', miner, '', reward)
+    return Block(previous_block.index + 1, previous_block.hash,
+                 list(transactions) + [reward_transaction], proof,
+                 previous_block.index + 1.0)
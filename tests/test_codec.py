@@ -0,0 +1,82 @@
+import os
+import unittest
+
+from tests.helpers import TempDirTestCase
+from utility import codec
+from utility.addresses import AddressRegistry
+
+TRANSACTION = {'sender': 'ab' * 8, 'recipient': 'bob', 'amount': 1.5,
+               'signature': 'cd' * 8}
+BLOCK = {'index': 3, 'previous_hash': 'ef' * 32, 'timestamp': 12.5,
+         'proof': 7, 'transactions': [
+             dict(TRANSACTION, fee=2),
+             {'sender': 'MINING', 'recipient': 'ab' * 8, 'amount': 12,
+              'signature': ''}]}
+
+
+class CodecTest(unittest.TestCase):
+    def test_transaction_round_trip(self):
+        for transaction in (TRANSACTION, dict(TRANSACTION, fee=0.25)):
+            data = codec.encode_transaction(transaction)
+            self.assertEqual(data[0], codec.VERSION)
+            self.assertEqual(codec.decode_transaction(data), transaction)
+
+    def test_block_round_trip_keeps_number_types(self):
+        decoded = codec.decode_block(codec.encode_block(BLOCK))
+        self.assertEqual(decoded, BLOCK)
+        self.assertIsInstance(decoded['proof'], int)
+        self.assertIsInstance(decoded['timestamp'], float)
+        blocks = [BLOCK, dict(BLOCK, index=4, hash='01' * 32)]
+        self.assertEqual(codec.decode_blocks(codec.encode_blocks(blocks)),
+                         blocks)
+
+    def test_version_1_payloads_are_read(self):
+        # Version 1 had no fee field after the signature
+        data = codec.encode_transaction(TRANSACTION)
+        self.assertEqual(codec.decode_transaction(b'\x01' + data[1:-2]),
+                         TRANSACTION)
+        self.assertEqual(codec.decode_transactions(
+            b'\x01\x01' + data[1:-2]), [TRANSACTION])
+
+    def test_unknown_version_is_rejected(self):
+        data = b'\x09' + codec.encode_transaction(TRANSACTION)[1:]
+        self.assertFalse(codec.is_supported(data))
+        self.assertFalse(codec.is_supported(b''))
+        with self.assertRaises(ValueError):
+            codec.decode_transaction(data)
+
+    def test_malformed_payloads_raise_value_errors(self):
+        data = codec.encode_block(BLOCK)
+        for payload in (data[:-3], data + b'\x00', b'\x02\xff'):
+            with self.assertRaises(ValueError):
+                codec.decode_block(payload)
+
+    def test_non_numbers_are_rejected(self):
+        for amount in (True, '5', None):
+            with self.assertRaises(ValueError):
+                codec.encode_transaction(dict(TRANSACTION, amount=amount))
+
+
+class AddressCodecTest(TempDirTestCase):
+    def test_block_round_trip_with_registry(self):
+        addresses = AddressRegistry('test.addresses')
+        data = codec.encode_block(BLOCK, addresses)
+        self.assertEqual(len(addresses), 3)
+        self.assertEqual(codec.decode_block(data, addresses), BLOCK)
+        addresses.write()
+        reloaded = AddressRegistry('test.addresses')
+        reloaded.load()
+        self.assertEqual(codec.decode_block(data, reloaded), BLOCK)
+        with self.assertRaises(ValueError):
+            codec.decode_block(data)
+
+    def test_failed_encode_registers_no_addresses(self):
+        addresses = AddressRegistry('test.addresses')
+        bad_block = dict(BLOCK, transactions=[
+            dict(TRANSACTION, recipient='new'),
+            dict(TRANSACTION, amount='5')])
+        with self.assertRaises(ValueError):
+            codec.encode_block(bad_block, addresses)
+        self.assertEqual(len(addresses), 0)
+        addresses.write()
+        self.assertFalse(os.path.exists('test.addresses'))
@@ -0,0 +1,112 @@
+import os
+import unittest
+
+from blockchain import Blockchain
+from block import Block
+from tests.helpers import TempDirTestCase, make_block, transfer
+from utility.ledger import Ledger
+
+GENESIS = Block(0, '', [], 100, 0)
+PARTICIPANTS = ('alice', 'bob', 'carol', 'dave')
+
+
+def extend_chain(chain, count, miner, transactions=()):
+    """Returns the chain with count blocks mined by miner appended (the
+    given transactions go into the first one). """
+    chain = list(chain)
+    for index in range(count):
+        chain.append(make_block(chain[-1], transactions if index == 0
+                                else [], miner))
+    return chain
+
+
+def balances(ledger):
+    return {participant: ledger.balance(participant)
+            for participant in PARTICIPANTS}
+
+
+def rescanned_balances(chain):
+    ledger = Ledger()
+    ledger.rebuild(chain, [])
+    return balances(ledger)
+
+
+class LedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.base = extend_chain([GENESIS], 2, 'alice')
+        self.local = extend_chain(self.base, 3, 'alice',
+                                  [transfer('alice', 'bob', 5, 1)])
+        self.fork = extend_chain(self.base, 4, 'carol',
+                                 [transfer('alice', 'dave', 3)])
+
+    def test_reorganize_matches_rescan(self):
+        ledger = Ledger()
+        ledger.rebuild(self.local, [])
+        self.assertEqual(balances(ledger), {'alice': 44, 'bob': 5,
+                                            'carol': 0, 'dave': 0})
+        ledger.reorganize(self.local[3:], self.fork[3:])
+        self.assertEqual(balances(ledger), rescanned_balances(self.fork))
+        # Settled entries (bob's) are dropped, rewards come from MINING
+        self.assertEqual(ledger.confirmed_balances(),
+                         {'MINING': -60, 'alice': 17, 'carol': 40, 'dave': 3})
+
+    def test_reorganize_back_restores_balances(self):
+        ledger = Ledger()
+        ledger.rebuild(self.local, [])
+        ledger.reorganize(self.local[3:], self.fork[3:])
+        ledger.reorganize(self.fork[3:], self.local[3:])
+        self.assertEqual(balances(ledger), rescanned_balances(self.local))
+
+    def test_pending_transactions_reserve_funds(self):
+        ledger = Ledger()
+        ledger.rebuild(self.local, [transfer('alice', 'bob', 4, 1)])
+        self.assertEqual(ledger.balance('alice'), 39)
+        # Received amounts only count once they're confirmed
+        self.assertEqual(ledger.balance('bob'), 5)
+        ledger.clear_pending()
+        self.assertEqual(ledger.balance('alice'), 44)
+
+
+class PrunedBlockchainTest(TempDirTestCase):
+    """Resolving to a peer's fork books only the blocks after the fork,
+    the balances have to match a full rescan of the (mostly archived)
+    chain. """
+
+    def setUp(self):
+        super().setUp()
+        base = extend_chain([GENESIS], 2, 'alice')
+        self.local = extend_chain(base, 3, 'alice',
+                                  [transfer('alice', 'bob', 5, 1)])
+        self.fork = extend_chain(base, 4, 'carol',
+                                 [transfer('alice', 'dave', 3)])
+
+    def open_blockchain(self):
+        return Blockchain('alice', 'test', prune_depth=2)
+
+    def test_resolve_matches_full_rescan(self):
+        blockchain = self.open_blockchain()
+        for block in self.local[1:]:
+            self.assertTrue(blockchain.add_block(block.to_dict()))
+        self.assertEqual(blockchain.get_balance(), 44)
+        blockchain.add_peer_node('localhost:5001')
+        fork = self.fork
+        blockchain._Blockchain__fetch_longer_chain = (
+            lambda node, local_chain, min_length: (3, fork[3:]))
+        self.assertTrue(blockchain.resolve())
+        expected = rescanned_balances(self.fork)
+        resolved = {participant: blockchain.get_balance(participant)
+                    for participant in PARTICIPANTS}
+        self.assertEqual(resolved, expected)
+        self.assertEqual(blockchain.get_height(), len(self.fork))
+        blockchain.close()
+        # Without the saved balances the chain is rescanned from the archive
+        for name in ('blockchain-test.state', 'blockchain-test.snapshot'):
+            if os.path.exists(name):
+                os.remove(name)
+        reloaded = self.open_blockchain()
+        self.assertEqual(
+            [block.hash for block in reloaded.get_blocks(0, len(self.fork))],
+            [block.hash for block in self.fork])
+        self.assertEqual({participant: reloaded.get_balance(participant)
+                          for participant in PARTICIPANTS}, expected)
+        reloaded.close()
@@ -0,0 +1,75 @@
+import unittest
+
+from tests.helpers import transfer
+from utility import codec
+from utility.mempool import Mempool
+
+
+def recipients(transactions):
+    return [tx.recipient for tx in transactions]
+
+
+class MempoolTest(unittest.TestCase):
+    def test_priority_order(self):
+        pool = Mempool()
+        for index, fee in enumerate([0, 2, 0, 1, 2]):
+            pool.add(transfer('a', 'r{}'.format(index), 1, fee))
+        # Higher fees first, arrival order among equal fees
+        self.assertEqual(recipients(pool), ['r1', 'r4', 'r3', 'r0', 'r2'])
+
+    def test_duplicates_are_ignored(self):
+        pool = Mempool()
+        transaction = transfer('a', 'b', 1)
+        self.assertEqual(pool.add(transaction), [])
+        self.assertEqual(pool.add(transfer('a', 'b', 1)), [])
+        self.assertEqual(len(pool), 1)
+        self.assertIn(transaction.id, pool)
+
+    def test_eviction_takes_newest_lowest_fee(self):
+        pool = Mempool(3)
+        for index, fee in enumerate([0, 0, 1]):
+            pool.add(transfer('a', 'r{}'.format(index), 1, fee))
+        evicted = pool.add(transfer('a', 'r3', 1, 2))
+        self.assertEqual(recipients(evicted), ['r1'])
+        self.assertEqual(recipients(pool), ['r3', 'r2', 'r0'])
+
+    def test_incoming_transaction_not_beating_the_pool_is_evicted(self):
+        pool = Mempool(2)
+        pool.add(transfer('a', 'r0', 1, 1))
+        pool.add(transfer('a', 'r1', 1, 0))
+        incoming = transfer('a', 'r2', 1, 0)
+        self.assertEqual(pool.add(incoming), [incoming])
+        self.assertNotIn(incoming.id, pool)
+        self.assertEqual(recipients(pool), ['r0', 'r1'])
+
+    def test_remove_and_clear(self):
+        pool = Mempool()
+        transactions = [transfer('a', 'r{}'.format(index), 1, index % 2)
+                        for index in range(4)]
+        for transaction in transactions:
+            pool.add(transaction)
+        self.assertIs(pool.remove(transactions[1].id), transactions[1])
+        self.assertIsNone(pool.remove(transactions[1].id))
+        self.assertEqual(recipients(pool), ['r3', 'r0', 'r2'])
+        pool.clear()
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.template(), [])
+
+    def test_template_caps(self):
+        pool = Mempool()
+        for index in range(5):
+            pool.add(transfer('a', 'r{}'.format(index), 1, 5 - index))
+        self.assertEqual(recipients(pool.template(max_count=2)),
+                         ['r0', 'r1'])
+        size = len(codec.encode_transaction(
+            transfer('a', 'r0', 1, 5).to_dict()))
+        self.assertEqual(recipients(pool.template(max_bytes=size * 3)),
+                         ['r0', 'r1', 'r2'])
+
+    def test_unencodable_transaction_leaves_pool_unchanged(self):
+        pool = Mempool()
+        pool.add(transfer('a', 'r0', 1))
+        with self.assertRaises(ValueError):
+            pool.add(transfer('a', 'r1', True))
+        self.assertEqual(recipients(pool), ['r0'])
+        self.assertEqual(len(pool.template()), 1)
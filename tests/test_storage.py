@@ -0,0 +1,81 @@
+import os
+
+from block import Block
+from tests.helpers import TempDirTestCase, make_block, transfer
+from utility.storage import BlockStorage
+
+GENESIS = Block(0, '', [], 100, 0)
+
+
+def stored_blocks(count):
+    """Returns a chain of blocks (as stored dictionaries) starting with the
+    genesis block. """
+    blocks = [GENESIS]
+    for index in range(1, count):
+        blocks.append(make_block(blocks[-1], [transfer('a', 'b', index)]))
+    return [block.to_dict(with_hash=True) for block in blocks]
+
+
+class BlockStorageTest(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.blocks = stored_blocks(4)
+        storage = BlockStorage('test')
+        storage.open()
+        storage.append_blocks(self.blocks)
+
+    def reopen(self):
+        storage = BlockStorage('test')
+        storage.open()
+        return storage
+
+    def test_blocks_survive_reopening(self):
+        storage = self.reopen()
+        self.assertEqual(len(storage), 4)
+        self.assertEqual([storage.read_block(i) for i in range(4)],
+                         self.blocks)
+        self.assertEqual(storage.block_hash(-1), self.blocks[-1]['hash'])
+
+    def test_torn_tail_is_cut_off(self):
+        size = os.path.getsize('blockchain-test.blocks')
+        with open('blockchain-test.blocks', mode='ab') as f:
+            f.write(b'\x00\x00\x01\x00\x12\x34')
+        storage = self.reopen()
+        self.assertEqual(len(storage), 4)
+        self.assertEqual(os.path.getsize('blockchain-test.blocks'), size)
+        self.assertEqual(storage.read_block(3), self.blocks[3])
+
+    def test_corrupt_last_record_is_rejected(self):
+        with open('blockchain-test.blocks', mode='r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xff]))
+        storage = self.reopen()
+        self.assertEqual(len(storage), 3)
+        self.assertEqual(storage.block_hash(-1), self.blocks[2]['hash'])
+        # The chain continues after the last intact block
+        storage.append_block(self.blocks[3])
+        self.assertEqual(self.reopen().read_block(3), self.blocks[3])
+
+    def test_missing_index_is_rebuilt(self):
+        os.remove('blockchain-test.index')
+        storage = self.reopen()
+        self.assertEqual(len(storage), 4)
+        self.assertEqual(storage.read_block(2), self.blocks[2])
+
+    def test_truncate_keeps_leading_blocks(self):
+        storage = self.reopen()
+        storage.truncate(2)
+        storage = self.reopen()
+        self.assertEqual(len(storage), 2)
+        self.assertIsNone(storage.find_block(self.blocks[3]['hash']))
+
+    def test_closed_storage_rejects_writes(self):
+        storage = self.reopen()
+        storage.close()
+        with self.assertRaises(IOError):
+            storage.append_block(self.blocks[0])
+        with self.assertRaises(IOError):
+            storage.truncate(1)
+        self.assertEqual(len(self.reopen()), 4)
@@ -1,25 +1,79 @@
 from collections import OrderedDict
+import json
 
+from utility.hash_util import hash_string_256
 from utility.printable import Printable
 
 
 class Transaction(Printable):
-    """A transaction that can be added to a block.
+    """A transaction that can be added to a block. Transactions are immutable
+    once created.
 
     Attributes:
         :sender: The sender of the coins.
         :recipient: The recipient of the coins.
         :signature: The signature of the transaction.
         :amount: The coin amount.
+        :fee: The coins paid to the miner including the transaction (on top
+        of the amount). A fee of 0 leaves the transaction's data, signature
+        and hash as they were before fees existed.
     """
-    def __init__(self, sender, recipient, signature, amount):
-        self.sender = sender
-        self.recipient = recipient
-        self.amount = amount
-        self.signature = signature
+    __slots__ = ('sender', 'recipient', 'amount', 'signature', 'fee', '_id')
+
+    def __init__(self, sender, recipient, signature, amount, fee=0):
+        set_attribute = super().__setattr__
+        set_attribute('sender', sender)
+        set_attribute('recipient', recipient)
+        set_attribute('amount', amount)
+        set_attribute('signature', signature)
+        set_attribute('fee', fee)
+        set_attribute('_id', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Transactions are immutable.')
+
+    def __reduce__(self):
+        # Pickle through the constructor (e.g. for process pools) since the
+        # attributes can't be set afterwards
+        return (self.__class__, (self.sender, self.recipient,
+                                 self.signature, self.amount, self.fee))
+
+    @property
+    def id(self):
+        """The canonical content hash which identifies the transaction. """
+        if self._id is None:
+            super().__setattr__('_id', hash_string_256(json.dumps(
+                self.to_dict(), sort_keys=True).encode()))
+        return self._id
 
     def to_ordered_dict(self):
-        return OrderedDict([
+        transaction = OrderedDict([
             ('sender', self.sender), 
             ('recipient', self.recipient), 
             ('amount', self.amount)])
+        if self.fee:
+            transaction['fee'] = self.fee
+        return transaction
+
+    def to_dict(self):
+        """Returns the transaction as a JSON serializable dictionary (the fee
+        is only included if there is one). """
+        transaction = {
+            'sender': self.sender,
+            'recipient': self.recipient,
+            'amount': self.amount,
+            'signature': self.signature
+        }
+        if self.fee:
+            transaction['fee'] = self.fee
+        return transaction
+
+    @classmethod
+    def from_dict(cls, tx):
+        """Creates a transaction from a dictionary (see to_dict).
+
+        Arguments:
+            :tx: The dictionary holding the transaction data.
+        """
+        return cls(tx['sender'], tx['recipient'], tx['signature'],
+                   tx['amount'], tx.get('fee', 0))
@@ -0,0 +1,105 @@
+"""Provides the registry which interns the addresses of a node. """
+
+import json
+import os
+from threading import Lock
+
+
+class AddressRegistry:
+    """Interns addresses (hex encoded public keys and other participant
+    names) and assigns every address a compact integer ID.
+
+    Every address is kept once: transactions decoded with the registry hold
+    its copy of the address, so a key repeated in thousands of transactions
+    takes its memory once and comparing it is an identity check. Stored
+    blocks reference addresses by ID (see utility.codec). IDs are never
+    reused or removed, so they stay valid when blocks are cut off.
+
+    Attributes:
+        :path: The append-only file holding the addresses (one JSON string
+        per line, the ID is the line number).
+        :addresses (private): The addresses by ID.
+        :ids (private): The ID per address.
+        :unwritten (private): The number of addresses not written yet.
+        :lock (private): Guards assigning new IDs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__addresses = []
+        self.__ids = {}
+        self.__unwritten = 0
+        self.__lock = Lock()
+
+    def __len__(self):
+        return len(self.__addresses)
+
+    def load(self):
+        """Loads the stored addresses. A torn last line (e.g. from a crash
+        in the middle of a write) is cut off. """
+        self.__addresses = []
+        self.__ids = {}
+        self.__unwritten = 0
+        try:
+            with open(self.path, mode='rb') as f:
+                content = f.read()
+        except IOError:
+            return
+        end = content.rfind(b'\n') + 1
+        for line in content[:end].splitlines():
+            address = json.loads(line.decode('utf8'))
+            self.__ids[address] = len(self.__addresses)
+            self.__addresses.append(address)
+        if end != len(content):
+            with open(self.path, mode='r+b') as f:
+                f.truncate(end)
+
+    def id_of(self, address):
+        """Returns the ID of an address, registering it if it's new (call
+        write before storing anything which references the ID).
+
+        Arguments:
+            :address: The address.
+        """
+        address_id = self.__ids.get(address)
+        if address_id is None:
+            with self.__lock:
+                address_id = self.__ids.get(address)
+                if address_id is None:
+                    address_id = len(self.__addresses)
+                    self.__addresses.append(address)
+                    self.__ids[address] = address_id
+                    self.__unwritten += 1
+        return address_id
+
+    def address_of(self, address_id):
+        """Returns the (interned) address with the given ID.
+
+        Arguments:
+            :address_id: The ID of the address.
+        """
+        return self.__addresses[address_id]
+
+    def write(self, sync=True):
+        """Appends the newly registered addresses to the file.
+
+        Arguments:
+            :sync: Whether the file is synced to disk as well.
+        """
+        with self.__lock:
+            if not self.__unwritten:
+                return
+            new_addresses = self.__addresses[-self.__unwritten:]
+            with open(self.path, mode='ab') as f:
+                f.write(b''.join(
+                    json.dumps(address).encode('utf8') + b'\n'
+                    for address in new_addresses))
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            self.__unwritten = 0
+
+    def sync(self):
+        """Syncs the written addresses to disk. """
+        with open(self.path, mode='ab') as f:
+            os.fsync(f.fileno())
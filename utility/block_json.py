@@ -0,0 +1,46 @@
+"""Provides the cached JSON encoding of blocks for the chain endpoints. """
+
+from collections import OrderedDict
+import json
+from threading import Lock
+
+# The number of encoded blocks kept for the chain endpoints
+BLOCK_JSON_CACHE_SIZE = 4096
+
+_block_json_cache = OrderedDict()
+_block_json_cache_lock = Lock()
+
+
+def encode_block(block):
+    """Returns the JSON encoding of a block, reusing the cached one (blocks
+    are immutable, so they're cached by their hash).
+
+    Arguments:
+        :block: The block which should be encoded.
+    """
+    with _block_json_cache_lock:
+        encoded_block = _block_json_cache.get(block.hash)
+        if encoded_block is not None:
+            _block_json_cache.move_to_end(block.hash)
+            return encoded_block
+    encoded_block = json.dumps(block.to_dict())
+    with _block_json_cache_lock:
+        _block_json_cache[block.hash] = encoded_block
+        if len(_block_json_cache) > BLOCK_JSON_CACHE_SIZE:
+            _block_json_cache.popitem(last=False)
+    return encoded_block
+
+
+def stream_blocks(blocks):
+    """Yields a JSON list of blocks block by block, so a long chain is never
+    built up in memory as a whole.
+
+    Arguments:
+        :blocks: The blocks which should be sent.
+    """
+    yield '['
+    for index, block in enumerate(blocks):
+        if index:
+            yield ','
+        yield encode_block(block)
+    yield ']'
@@ -0,0 +1,162 @@
+"""Provides the HTTP client used to talk to peer nodes. """
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import time
+
+import requests
+
+from utility import codec
+from utility.peer_health import PeerHealth
+
+# Seconds to wait for a peer to accept the connection and to answer
+DEFAULT_TIMEOUT = (3.05, 10)
+
+
+class Broadcaster:
+    """Sends requests to peer nodes.
+
+    Every peer gets its own session, so connections are kept alive and
+    reused. Broadcasts are posted to all peers in parallel, so they take as
+    long as the slowest peer instead of the sum of all round-trips.
+    Data which has a binary encoding (see utility.codec) is posted binary;
+    peers which reject it get JSON from then on.
+    The health of every peer (latency, failures, last answer) is recorded,
+    and unresponsive peers are quarantined (see PeerHealth), so they don't
+    cost a connect timeout on every request.
+
+    Attributes:
+        :timeout: The connect and read timeout of every request.
+        :sessions (private): The HTTP session per peer node.
+        :health (private): The PeerHealth per peer node.
+        :health_lock (private): Guards the health records.
+        :json_only (private): The peers which don't accept binary data.
+        :executor (private): The threads posting the broadcasts.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, workers=32):
+        self.timeout = timeout
+        self.__sessions = {}
+        self.__health = {}
+        self.__health_lock = Lock()
+        self.__json_only = set()
+        self.__executor = ThreadPoolExecutor(workers)
+
+    def get(self, node, path, binary=False):
+        """Sends a GET request to a peer node and returns the response or None
+        if the peer couldn't be reached (or is quarantined).
+
+        Arguments:
+            :node: The peer node.
+            :path: The path of the requested resource.
+            :binary: Whether the binary encoding is preferred (the peer may
+            still answer with JSON, see the response's Content-Type).
+        """
+        headers = None
+        if binary:
+            headers = {'Accept': '{}, application/json;q=0.9'.format(
+                codec.CONTENT_TYPE)}
+        return self.__send(node, 'GET', 'http://{}{}'.format(node, path),
+                           headers=headers)
+
+    def post(self, node, path, payload, binary=None):
+        """Posts data to a peer node and returns the response or None if the
+        peer couldn't be reached (or is quarantined).
+
+        Arguments:
+            :node: The peer node.
+            :path: The path of the endpoint.
+            :payload: The JSON serializable data to post.
+            :binary: The same data in the binary encoding (optional).
+        """
+        url = 'http://{}{}'.format(node, path)
+        if binary is None or node in self.__json_only:
+            return self.__send(node, 'POST', url, json=payload)
+        response = self.__send(node, 'POST', url, data=binary,
+                               headers={'Content-Type': codec.CONTENT_TYPE})
+        # Older peers can't read binary data (400), newer ones may not
+        # support its version (415), so retry with JSON
+        if response is None or response.status_code not in (400, 415):
+            return response
+        response = self.__send(node, 'POST', url, json=payload)
+        if response is not None and response.status_code < 400:
+            self.__json_only.add(node)
+        return response
+
+    def broadcast(self, nodes, path, payload, binary=None):
+        """Posts data to all peer nodes in parallel and returns the status
+        code per node (None for peers which couldn't be reached).
+
+        Arguments:
+            :nodes: The peer nodes.
+            :path: The path of the endpoint.
+            :payload: The JSON serializable data to post.
+            :binary: The same data in the binary encoding (optional).
+        """
+        nodes = list(nodes)
+        responses = self.__executor.map(
+            lambda node: self.post(node, path, payload, binary), nodes)
+        return {node: response.status_code if response is not None else None
+                for node, response in zip(nodes, responses)}
+
+    def rank(self, nodes):
+        """Returns the peer nodes ordered by health: reachable peers with
+        few recent failures and low latency first.
+
+        Arguments:
+            :nodes: The peer nodes.
+        """
+        with self.__health_lock:
+            return sorted(nodes, key=lambda node: self.__health.get(
+                node, PeerHealth()).rank())
+
+    def stats(self, nodes):
+        """Returns the health of the given peer nodes as JSON serializable
+        dictionaries by node.
+
+        Arguments:
+            :nodes: The peer nodes.
+        """
+        with self.__health_lock:
+            return {node: self.__health.get(node, PeerHealth()).to_dict()
+                    for node in nodes}
+
+    def forget(self, node):
+        """Closes the session and drops the health of a removed peer.
+
+        Arguments:
+            :node: The peer node.
+        """
+        with self.__health_lock:
+            self.__health.pop(node, None)
+        session = self.__sessions.pop(node, None)
+        if session is not None:
+            session.close()
+        self.__json_only.discard(node)
+
+    def __send(self, node, method, url, **kwargs):
+        """Sends a request unless the peer is quarantined and records the
+        outcome in its health. """
+        with self.__health_lock:
+            health = self.__health.get(node)
+            if health is None:
+                health = self.__health[node] = PeerHealth()
+            if health.is_quarantined():
+                return None
+        start = time.perf_counter()
+        try:
+            response = self.__session(node).request(
+                method, url, timeout=self.timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            with self.__health_lock:
+                health.record_failure()
+            return None
+        with self.__health_lock:
+            health.record_answer(time.perf_counter() - start)
+        return response
+
+    def __session(self, node):
+        session = self.__sessions.get(node)
+        if session is None:
+            session = self.__sessions.setdefault(node, requests.Session())
+        return session
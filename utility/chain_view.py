@@ -0,0 +1,98 @@
+"""Provides a read-only view of the blockchain. """
+
+from contextlib import nullcontext
+
+
+class ChainView:
+    """A read-only, copy-free view of the blockchain.
+
+    Reading the tip, the height or single blocks only touches those blocks,
+    instead of copying the whole chain first. A snapshot of the view is
+    pinned to the height it was taken at, so blocks appended afterwards
+    don't show up in it (e.g. while a response is built from it).
+
+    Attributes:
+        :chain (private): The chain the view reads from.
+        :height (private): The pinned height of a snapshot (None follows the
+        chain).
+        :generation (private): The generation of the chain when the view was
+        created (to notice blocks cut off by a chain replacement).
+        :lock (private): The reader/writer lock guarding the chain (or None).
+    """
+
+    def __init__(self, chain, height=None, lock=None):
+        self.__chain = chain
+        self.__height = height
+        self.__generation = getattr(chain, 'generation', 0)
+        self.__lock = lock
+
+    @property
+    def height(self):
+        """The number of blocks in the view. """
+        if self.__height is None:
+            return len(self.__chain)
+        return self.__height
+
+    @property
+    def base(self):
+        """The index of the first readable block (see LazyChain.base). """
+        return getattr(self.__chain, 'base', 0)
+
+    @property
+    def tip(self):
+        """The last block of the view (None if it's empty). """
+        height = self.height
+        if height < 1:
+            return None
+        return self.__block(height - 1)
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, index):
+        height = self.height
+        if isinstance(index, slice):
+            start, stop, step = index.indices(height)
+            if step != 1:
+                return [self.__block(i) for i in range(start, stop, step)
+                        if i >= self.base]
+            if start >= stop:
+                return []
+            with self.__reading():
+                self.__check(stop)
+                return self.__chain[start:stop]
+        if index < 0:
+            index += height
+        if not 0 <= index < height:
+            raise IndexError('chain index out of range')
+        return self.__block(index)
+
+    def __iter__(self):
+        for index in range(self.base, self.height):
+            yield self.__block(index)
+
+    def snapshot(self):
+        """Returns a view pinned to the current height. """
+        with self.__reading():
+            return ChainView(self.__chain, self.height, self.__lock)
+
+    def __block(self, index):
+        with self.__reading():
+            self.__check(index + 1)
+            return self.__chain[index]
+
+    def __reading(self):
+        if self.__lock is None:
+            return nullcontext()
+        return self.__lock.read()
+
+    def __check(self, end):
+        """Makes sure the blocks before end weren't replaced since the
+        snapshot was taken. """
+        if self.__height is None:
+            return
+        stable_length = getattr(self.__chain, 'stable_length', None)
+        if (stable_length is not None and
+                stable_length(self.__generation) < end):
+            raise RuntimeError('The chain was replaced since the snapshot '
+                               'was taken.')
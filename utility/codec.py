@@ -0,0 +1,335 @@
+"""Provides the compact binary encoding of blocks and transactions.
+
+Every payload starts with the version of the encoding (version 2 added
+the transaction fee, version 1 payloads are still read). Hex strings (keys,
+signatures and hashes) are stored as raw bytes, other strings as UTF-8, and
+lengths, counts and integers as varints. Integers and floats are kept
+apart, so a decoded block hashes exactly like the original one.
+
+Blocks can be encoded with an address registry (see utility.addresses):
+senders and recipients are then written as registry IDs. Such payloads
+can only be decoded with the same registry, so they're only used for the
+node's own storage, never sent to peers.
+"""
+
+import struct
+
+# The media type of binary payloads on the peer endpoints
+CONTENT_TYPE = 'application/x-pchain'
+# The version of the encoding written as the first byte of every payload
+VERSION = 2
+# The versions which can be decoded
+SUPPORTED_VERSIONS = (1, 2)
+
+# Tags of the string and number encodings
+_TEXT = 0
+_HEX = 1
+_ADDRESS = 2
+_INT = 0
+_FLOAT = 1
+_DOUBLE = struct.Struct('>d')
+
+
+def is_supported(data):
+    """Returns whether a payload was written with a supported version.
+
+    Arguments:
+        :data: The encoded payload.
+    """
+    return len(data) > 0 and data[0] in SUPPORTED_VERSIONS
+
+
+def encode_transaction(transaction):
+    """Encodes a transaction given as dictionary (see Transaction.to_dict).
+
+    Arguments:
+        :transaction: The transaction which should be encoded.
+    """
+    out = bytearray([VERSION])
+    _write_transaction(out, transaction)
+    return bytes(out)
+
+
+def decode_transaction(data):
+    """Decodes a transaction into a dictionary.
+
+    Arguments:
+        :data: The encoded transaction.
+    """
+    return _decode(data, _read_transaction)
+
+
+def encode_transactions(transactions):
+    """Encodes a list of transactions given as dictionaries.
+
+    Arguments:
+        :transactions: The transactions which should be encoded.
+    """
+    out = bytearray([VERSION])
+    _write_list(out, transactions, _write_transaction)
+    return bytes(out)
+
+
+def decode_transactions(data):
+    """Decodes a list of transactions into dictionaries.
+
+    Arguments:
+        :data: The encoded transactions.
+    """
+    return _decode(data, lambda data, position, version: _read_list(
+        data, position, lambda data, position: _read_transaction(
+            data, position, version)))
+
+
+def encode_block(block, addresses=None):
+    """Encodes a block given as dictionary (see Block.to_dict, a stored
+    'hash' is kept).
+
+    Arguments:
+        :block: The block which should be encoded.
+        :addresses: The registry to write addresses as IDs with (optional,
+        new addresses are registered).
+    """
+    if addresses is not None:
+        # Registering the addresses can't be undone, so a block which fails
+        # to encode mustn't get that far
+        _check_block(block)
+    out = bytearray([VERSION])
+    _write_block(out, block, addresses)
+    return bytes(out)
+
+
+def decode_block(data, addresses=None):
+    """Decodes a block into a dictionary.
+
+    Arguments:
+        :data: The encoded block.
+        :addresses: The registry the block was encoded with (if any).
+    """
+    return _decode(data, lambda data, position, version: _read_block(
+        data, position, version, addresses))
+
+
+def encode_blocks(blocks):
+    """Encodes a list of blocks given as dictionaries.
+
+    Arguments:
+        :blocks: The blocks which should be encoded.
+    """
+    out = bytearray([VERSION])
+    _write_list(out, blocks, _write_block)
+    return bytes(out)
+
+
+def decode_blocks(data):
+    """Decodes a list of blocks into dictionaries.
+
+    Arguments:
+        :data: The encoded blocks.
+    """
+    return _decode(data, lambda data, position, version: _read_list(
+        data, position, lambda data, position: _read_block(
+            data, position, version)))
+
+
+def _decode(data, read):
+    """Checks the version, reads the payload and makes sure nothing is left
+    over. Any malformed payload raises a ValueError. """
+    if not is_supported(data):
+        raise ValueError('Unsupported encoding version.')
+    data = bytes(data)
+    try:
+        value, position = read(data, 1, data[0])
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError('Malformed payload: {}'.format(e))
+    if position != len(data):
+        raise ValueError('Malformed payload: trailing bytes')
+    return value
+
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError('Varints must not be negative.')
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, position):
+    # Most lengths and counts fit into one byte
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _write_string(out, value):
+    # Hex strings which survive the round trip are stored as raw bytes
+    try:
+        raw = bytes.fromhex(value)
+        tag = _HEX if raw.hex() == value and raw else _TEXT
+    except ValueError:
+        tag = _TEXT
+    if tag == _TEXT:
+        raw = value.encode('utf8')
+    out.append(tag)
+    _write_varint(out, len(raw))
+    out += raw
+
+
+def _read_string(data, position):
+    tag = data[position]
+    length, position = _read_varint(data, position + 1)
+    end = position + length
+    if end > len(data):
+        raise IndexError('string out of range')
+    if tag == _HEX:
+        return data[position:end].hex(), end
+    if tag == _TEXT:
+        return data[position:end].decode('utf8'), end
+    raise ValueError('Unknown string tag {}.'.format(tag))
+
+
+def _write_address(out, value, addresses):
+    if addresses is None:
+        _write_string(out, value)
+    else:
+        out.append(_ADDRESS)
+        _write_varint(out, addresses.id_of(value))
+
+
+def _read_address(data, position, addresses):
+    if data[position] != _ADDRESS:
+        return _read_string(data, position)
+    if addresses is None:
+        raise ValueError('Address IDs need the address registry.')
+    address_id, position = _read_varint(data, position + 1)
+    return addresses.address_of(address_id), position
+
+
+def _write_number(out, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('Not a number: {!r}'.format(value))
+    if isinstance(value, int):
+        out.append(_INT)
+        # Zigzag encoding maps negative numbers onto small varints
+        _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    else:
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+
+
+def _read_number(data, position):
+    tag = data[position]
+    position += 1
+    if tag == _INT:
+        value, position = _read_varint(data, position)
+        return (value // 2 if value % 2 == 0 else -(value + 1) // 2,
+                position)
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, position)[0], position + 8
+    raise ValueError('Unknown number tag {}.'.format(tag))
+
+
+def _write_list(out, values, write):
+    _write_varint(out, len(values))
+    for value in values:
+        write(out, value)
+
+
+def _read_list(data, position, read):
+    count, position = _read_varint(data, position)
+    values = []
+    for _ in range(count):
+        value, position = read(data, position)
+        values.append(value)
+    return values, position
+
+
+def _write_transaction(out, transaction, addresses=None):
+    _write_address(out, transaction['sender'], addresses)
+    _write_address(out, transaction['recipient'], addresses)
+    _write_number(out, transaction['amount'])
+    _write_string(out, transaction['signature'])
+    _write_number(out, transaction.get('fee', 0))
+
+
+def _read_transaction(data, position, version, addresses=None):
+    sender, position = _read_address(data, position, addresses)
+    recipient, position = _read_address(data, position, addresses)
+    amount, position = _read_number(data, position)
+    signature, position = _read_string(data, position)
+    transaction = {
+        'sender': sender,
+        'recipient': recipient,
+        'amount': amount,
+        'signature': signature
+    }
+    if version >= 2:
+        fee, position = _read_number(data, position)
+        if fee:
+            transaction['fee'] = fee
+    return transaction, position
+
+
+def _write_block(out, block, addresses=None):
+    _write_varint(out, block['index'])
+    _write_string(out, block['previous_hash'])
+    _write_number(out, block['timestamp'])
+    _write_number(out, block['proof'])
+    _write_list(out, block['transactions'],
+                lambda out, tx: _write_transaction(out, tx, addresses))
+    if 'hash' in block:
+        out.append(1)
+        _write_string(out, block['hash'])
+    else:
+        out.append(0)
+
+
+def _check_block(block):
+    """Raises a ValueError if a block given as dictionary has fields which
+    can't be encoded. """
+    strings = [block['previous_hash'], block.get('hash', '')]
+    numbers = [block['timestamp'], block['proof']]
+    for transaction in block['transactions']:
+        strings += [transaction['sender'], transaction['recipient'],
+                    transaction['signature']]
+        numbers += [transaction['amount'], transaction.get('fee', 0)]
+    index = block['index']
+    if (isinstance(index, bool) or not isinstance(index, int) or index < 0 or
+            not all(isinstance(value, str) for value in strings) or
+            any(isinstance(value, bool) or
+                not isinstance(value, (int, float)) for value in numbers)):
+        raise ValueError('Block fields can\'t be encoded.')
+
+
+def _read_block(data, position, version, addresses=None):
+    index, position = _read_varint(data, position)
+    previous_hash, position = _read_string(data, position)
+    timestamp, position = _read_number(data, position)
+    proof, position = _read_number(data, position)
+    transactions, position = _read_list(
+        data, position,
+        lambda data, position: _read_transaction(
+            data, position, version, addresses))
+    block = {
+        'index': index,
+        'previous_hash': previous_hash,
+        'timestamp': timestamp,
+        'transactions': transactions,
+        'proof': proof
+    }
+    has_hash = data[position]
+    position += 1
+    if has_hash:
+        block['hash'], position = _read_string(data, position)
+    return block, position
@@ -12,8 +12,8 @@ def hash_block(block):
     Arguments:
         :block: The block that should be hashed.
     """
-    hashable_block = block.__dict__.copy()
+    hashable_block = block.to_dict()
     hashable_block['transactions'] = [
-        tx.to_ordered_dict() for tx in hashable_block['transactions']
+        tx.to_ordered_dict() for tx in block.transactions
     ]
     return hash_string_256(json.dumps(hashable_block, sort_keys=True).encode())
@@ -0,0 +1,152 @@
+"""Provides a lazily materialized view of the stored blockchain. """
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class LazyChain:
+    """A list-like blockchain backed by the block storage.
+
+    Blocks are only decoded into objects when they are accessed (by index,
+    slice or iteration). Recently used blocks are kept in a small cache, so
+    the tip of the chain doesn't need to be decoded over and over again.
+    Indexes are positions in the whole chain, even if the storage starts at
+    a later block (see base): slices and iteration start at the base, while
+    accessing a single block before it raises an IndexError.
+    In pruning mode (keep_last), only the last blocks of the chain are kept
+    as objects: older blocks are decoded whenever they're accessed and
+    dropped again, so the memory doesn't grow with the chain.
+
+    Attributes:
+        :storage (private): The block storage holding the records.
+        :decode (private): Turns a stored dictionary into a block object.
+        :encode (private): Turns a block object into a storable dictionary.
+        :keep_last: The number of blocks at the tip which are kept as
+        objects (None keeps the CACHE_SIZE most recently used blocks).
+        :cache (private): The kept block objects by index.
+        :truncations (private): The number of blocks kept by every
+        truncation (the chain's generation is the number of truncations).
+        :cache_lock (private): Guards the cache (readers share it).
+    """
+    CACHE_SIZE = 1024
+
+    def __init__(self, storage, decode, encode, keep_last=None):
+        self.__storage = storage
+        self.__decode = decode
+        self.__encode = encode
+        self.keep_last = keep_last
+        self.__cache = OrderedDict()
+        self.__truncations = []
+        self.__cache_lock = Lock()
+
+    @property
+    def base(self):
+        """The index of the first stored block. """
+        return self.__storage.base
+
+    @property
+    def generation(self):
+        """The number of times the chain was truncated. """
+        return len(self.__truncations)
+
+    def stable_length(self, generation):
+        """Returns the number of leading blocks which weren't replaced since
+        the given generation (blocks appended since count as unchanged).
+
+        Arguments:
+            :generation: The generation of the chain to compare with.
+        """
+        return min(self.__truncations[generation:], default=float('inf'))
+
+    def __len__(self):
+        return len(self.__storage)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.__block(i)
+                    for i in range(*index.indices(len(self)))
+                    if i >= self.base]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('chain index out of range')
+        if index < self.base:
+            raise IndexError('block {} is not stored'.format(index))
+        return self.__block(index)
+
+    def __iter__(self):
+        for index in range(self.base, len(self)):
+            yield self.__block(index)
+
+    def append(self, block):
+        """Persists a new block at the end of the chain.
+
+        Arguments:
+            :block: The block which should be appended.
+        """
+        self.__storage.append_block(self.__encode(block))
+        self.__slide(len(self) - 1)
+        self.__remember(len(self) - 1, block)
+
+    def extend(self, blocks):
+        """Persists several new blocks at the end of the chain at once.
+
+        Arguments:
+            :blocks: The blocks which should be appended.
+        """
+        start = len(self)
+        self.__storage.append_blocks([self.__encode(block)
+                                      for block in blocks])
+        self.__slide(start)
+        for index, block in enumerate(blocks, start):
+            self.__remember(index, block)
+
+    def truncate(self, count):
+        """Cuts off all blocks after the given number of blocks (e.g. to
+        replace the blocks after a fork).
+
+        Arguments:
+            :count: The number of blocks to keep.
+        """
+        if count >= len(self):
+            return
+        self.__storage.truncate(count)
+        with self.__cache_lock:
+            for index in [index for index in self.__cache if index >= count]:
+                del self.__cache[index]
+        self.__truncations.append(count)
+
+    def __block(self, index):
+        with self.__cache_lock:
+            block = self.__cache.get(index)
+            if block is not None:
+                self.__cache.move_to_end(index)
+                return block
+        # Decoding happens outside the lock, so readers don't queue up
+        # behind each other
+        block = self.__decode(self.__storage.read_block(index))
+        self.__remember(index, block)
+        return block
+
+    def __remember(self, index, block):
+        if self.keep_last is not None:
+            # Blocks before the tip window are only decoded for the caller
+            if index < len(self) - self.keep_last:
+                return
+            with self.__cache_lock:
+                self.__cache[index] = block
+            return
+        with self.__cache_lock:
+            self.__cache[index] = block
+            if len(self.__cache) > self.CACHE_SIZE:
+                self.__cache.popitem(last=False)
+
+    def __slide(self, length):
+        """Drops the blocks which left the tip window since the chain had
+        the given length (in pruning mode). """
+        if self.keep_last is None:
+            return
+        with self.__cache_lock:
+            for index in range(length - self.keep_last,
+                               len(self) - self.keep_last):
+                self.__cache.pop(index, None)
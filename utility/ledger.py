@@ -0,0 +1,127 @@
+"""Provides an incrementally maintained balance index. """
+
+
+class Ledger:
+    """Keeps the balance of every participant up to date as blocks and open
+    transactions come and go, so balances can be looked up without walking
+    the whole blockchain. When the chain switches to a peer's branch, only
+    the blocks after the fork are reverted and booked again.
+
+    Attributes:
+        :balances (private): Confirmed balance per address (received minus
+        sent in mined blocks).
+        :pending_spend (private): Amount per address that is spent by open
+        transactions (not yet included in a block).
+    """
+
+    def __init__(self):
+        self.__balances = {}
+        self.__pending_spend = {}
+
+    def balance(self, participant):
+        """Returns the spendable balance of a participant.
+
+        Arguments:
+            :participant: The address whose balance should be returned.
+        """
+        return (self.__balances.get(participant, 0) -
+                self.__pending_spend.get(participant, 0))
+
+    def apply_block(self, block):
+        """Books all transactions of a block on the confirmed balances.
+
+        Arguments:
+            :block: The block which was appended to the chain.
+        """
+        for tx in block.transactions:
+            # The fee goes to the miner with the reward transaction
+            self.__credit(self.__balances, tx.sender, -(tx.amount + tx.fee))
+            self.__credit(self.__balances, tx.recipient, tx.amount)
+
+    def revert_block(self, block):
+        """Takes back the transactions of a block from the confirmed
+        balances (the inverse of apply_block).
+
+        Arguments:
+            :block: The block which was cut off the chain.
+        """
+        for tx in reversed(block.transactions):
+            self.__credit(self.__balances, tx.recipient, -tx.amount)
+            self.__credit(self.__balances, tx.sender, tx.amount + tx.fee)
+
+    def reorganize(self, reverted_blocks, applied_blocks):
+        """Moves the confirmed balances to another branch of the chain: the
+        blocks after the fork point are reverted (newest first) and the
+        blocks of the new branch are booked. Costs as much as the two
+        branches are long, not the whole chain.
+
+        Arguments:
+            :reverted_blocks: The blocks cut off the chain (in chain order).
+            :applied_blocks: The blocks which replaced them.
+        """
+        for block in reversed(reverted_blocks):
+            self.revert_block(block)
+        for block in applied_blocks:
+            self.apply_block(block)
+
+    def add_pending(self, transaction):
+        """Reserves the amount of an open transaction for its sender.
+
+        Arguments:
+            :transaction: The open transaction which was added.
+        """
+        self.__credit(self.__pending_spend, transaction.sender,
+                      transaction.amount + transaction.fee)
+
+    def remove_pending(self, transaction):
+        """Releases the reserved amount of an open transaction.
+
+        Arguments:
+            :transaction: The open transaction which was removed.
+        """
+        self.__credit(self.__pending_spend, transaction.sender,
+                      -(transaction.amount + transaction.fee))
+
+    def clear_pending(self):
+        """Drops all reservations (e.g. after the open transactions were
+        mined or discarded). """
+        self.__pending_spend = {}
+
+    def confirmed_balances(self):
+        """Returns a copy of the confirmed balances (e.g. to persist them). """
+        return dict(self.__balances)
+
+    def restore(self, balances, blocks, open_transactions):
+        """Resets the index to previously saved balances and books the blocks
+        which were added after they were saved.
+
+        Arguments:
+            :balances: The saved confirmed balances.
+            :blocks: The blocks added after the balances were saved.
+            :open_transactions: The open transactions to reserve.
+        """
+        self.__balances = dict(balances)
+        self.__pending_spend = {}
+        for block in blocks:
+            self.apply_block(block)
+        for tx in open_transactions:
+            self.add_pending(tx)
+
+    def rebuild(self, blockchain, open_transactions):
+        """Recomputes the whole index from scratch.
+
+        Arguments:
+            :blockchain: The blocks to book.
+            :open_transactions: The open transactions to reserve.
+        """
+        self.restore({}, blockchain, open_transactions)
+
+    @staticmethod
+    def __credit(index, participant, amount):
+        total = index.get(participant, 0) + amount
+        # Drop settled entries so the index doesn't keep every address that
+        # ever had a pending transaction
+        if total == 0:
+            index.pop(participant, None)
+        else:
+            index[participant] = total
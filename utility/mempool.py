@@ -0,0 +1,138 @@
+"""Provides the pool of open transactions. """
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from utility import codec
+
+# The default maximum number of open transactions
+DEFAULT_MAX_SIZE = 10000
+# The default caps of the transactions mined into one block (the encoded
+# size is measured with the binary codec)
+DEFAULT_MAX_BLOCK_TRANSACTIONS = 1000
+DEFAULT_MAX_BLOCK_BYTES = 1000000
+
+
+class Mempool:
+    """The open transactions, indexed by their id and ordered by priority:
+    higher fees first, and in arrival order among equal fees (so without
+    fees the pool is FIFO).
+
+    Duplicates are detected on admission and transactions can be removed
+    quickly once they're included in a block. Every fee level keeps its
+    transactions in arrival order, so adding and removing a transaction
+    only touches its own level (the sorted list of fee levels changes when
+    a level appears or empties). The transactions of the next block (see
+    template) are taken from the front without scanning the whole pool.
+    When the pool is full, the transactions with the lowest priority (the
+    newest ones of the lowest fee level) are evicted.
+
+    Attributes:
+        :max_size: The maximum number of open transactions.
+        :transactions (private): The open transactions by id.
+        :levels (private): The ids of the transactions of every fee (in
+        arrival order) by fee.
+        :fees (private): The fees which have transactions, ascending.
+        :sizes (private): The encoded size of every transaction by id.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.__transactions = {}
+        self.__levels = {}
+        self.__fees = []
+        self.__sizes = {}
+
+    def __len__(self):
+        return len(self.__transactions)
+
+    def __iter__(self):
+        """Iterates over a copy of the transactions in priority order. """
+        return iter([self.__transactions[tx_id]
+                     for tx_id in self.__ordered_ids()])
+
+    def __contains__(self, tx_id):
+        return tx_id in self.__transactions
+
+    def add(self, transaction):
+        """Adds a transaction and returns the transactions evicted to make
+        room for it (possibly the new transaction itself, if its priority is
+        the lowest).
+
+        Arguments:
+            :transaction: The transaction which should be added.
+        """
+        tx_id = transaction.id
+        if tx_id in self.__transactions:
+            return []
+        # Encoded first, so a transaction which can't be encoded raises
+        # before the pool is changed
+        size = len(codec.encode_transaction(transaction.to_dict()))
+        level = self.__levels.get(transaction.fee)
+        if level is None:
+            level = self.__levels[transaction.fee] = OrderedDict()
+            insort(self.__fees, transaction.fee)
+        level[tx_id] = None
+        self.__transactions[tx_id] = transaction
+        self.__sizes[tx_id] = size
+        evicted = []
+        while len(self.__transactions) > self.max_size:
+            evicted.append(self.remove(self.__lowest_priority()))
+        return evicted
+
+    def remove(self, tx_id):
+        """Removes a transaction and returns it (or None if it wasn't open).
+
+        Arguments:
+            :tx_id: The id of the transaction.
+        """
+        transaction = self.__transactions.pop(tx_id, None)
+        if transaction is None:
+            return None
+        level = self.__levels[transaction.fee]
+        del level[tx_id]
+        if not level:
+            del self.__levels[transaction.fee]
+            del self.__fees[bisect_left(self.__fees, transaction.fee)]
+        del self.__sizes[tx_id]
+        return transaction
+
+    def clear(self):
+        """Removes all transactions. """
+        self.__transactions.clear()
+        self.__levels.clear()
+        self.__fees = []
+        self.__sizes.clear()
+
+    def template(self, max_count=DEFAULT_MAX_BLOCK_TRANSACTIONS,
+                 max_bytes=DEFAULT_MAX_BLOCK_BYTES):
+        """Returns the transactions for the next block: the open
+        transactions in priority order, up to the first one which would
+        exceed one of the caps. Only the selected transactions are looked
+        at.
+
+        Arguments:
+            :max_count: The maximum number of transactions.
+            :max_bytes: The maximum encoded size of the transactions.
+        """
+        selected = []
+        size = 0
+        for tx_id in self.__ordered_ids():
+            if len(selected) >= max_count:
+                break
+            size += self.__sizes[tx_id]
+            if size > max_bytes:
+                break
+            selected.append(self.__transactions[tx_id])
+        return selected
+
+    def __ordered_ids(self):
+        """Yields the ids of the transactions in priority order. """
+        for fee in reversed(self.__fees):
+            yield from self.__levels[fee]
+
+    def __lowest_priority(self):
+        """Returns the id of the transaction to evict first: the newest one
+        with the lowest fee. """
+        level = self.__levels[self.__fees[0]]
+        return next(reversed(level))
@@ -0,0 +1,103 @@
+"""Provides the proof of work search. """
+
+import hashlib as hl
+from itertools import count
+from multiprocessing import Pool
+
+# The number of proofs a worker checks per task
+CHUNK_SIZE = 2048
+
+
+def proof_prefix(transactions, last_hash):
+    """Returns the part of the guess hashed by Verification.valid_proof which
+    doesn't depend on the proof.
+
+    Arguments:
+        :transactions: The transactions of the block that is mined.
+        :last_hash: The hash of the previous block.
+    """
+    return (str([tx.to_ordered_dict() for tx in transactions]) +
+            str(last_hash)).encode()
+
+
+def search(prefix, start, stop):
+    """Returns the first valid proof in [start, stop) or None.
+
+    The prefix is hashed once and the hash object is copied for every proof,
+    so only the proof itself is hashed per guess.
+
+    Arguments:
+        :prefix: The encoded prefix (see proof_prefix).
+        :start: The first proof to check.
+        :stop: The proof after the last one to check.
+    """
+    prefix_hash = hl.sha256(prefix)
+    for proof in range(start, stop):
+        guess_hash = prefix_hash.copy()
+        guess_hash.update(str(proof).encode())
+        # Same condition as Verification.valid_proof: the hex digest has to
+        # start with '00', i.e. the first byte is zero
+        if guess_hash.digest()[0] == 0:
+            return proof
+    return None
+
+
+def _search_chunk(args):
+    return search(*args)
+
+
+class Miner:
+    """Searches proofs of work, optionally on several processes.
+
+    The proof space is split into chunks which are handed to the worker
+    processes one round at a time. The lowest valid proof of a round wins,
+    so the result is the same proof a sequential search would find.
+
+    Attributes:
+        :workers: The number of worker processes (1 searches in-process).
+        :pool (private): The worker pool (started on first use).
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.__pool = None
+
+    def proof_of_work(self, transactions, last_hash, cancel=None):
+        """Returns the first proof which is valid for the transactions and the
+        hash of the previous block or None if the search was cancelled.
+
+        Arguments:
+            :transactions: The transactions of the block that is mined.
+            :last_hash: The hash of the previous block.
+            :cancel: An optional event which stops the search when set (it's
+            checked between rounds).
+        """
+        prefix = proof_prefix(transactions, last_hash)
+        for start in count(0, CHUNK_SIZE * self.workers):
+            if cancel is not None and cancel.is_set():
+                return None
+            chunks = [(prefix, chunk_start, chunk_start + CHUNK_SIZE)
+                      for chunk_start in range(
+                          start, start + CHUNK_SIZE * self.workers,
+                          CHUNK_SIZE)]
+            if self.workers > 1:
+                # Results arrive in chunk order, so we can return as soon as
+                # the lowest chunk with a valid proof is done (the remaining
+                # chunks of the round finish in the background)
+                results = self.__get_pool().imap(_search_chunk, chunks)
+            else:
+                results = [_search_chunk(chunks[0])]
+            for proof in results:
+                if proof is not None:
+                    return proof
+
+    def close(self):
+        """Stops the worker processes. """
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+
+    def __get_pool(self):
+        if self.__pool is None:
+            self.__pool = Pool(self.workers)
+        return self.__pool
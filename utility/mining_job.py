@@ -0,0 +1,55 @@
+"""Provides background mining. """
+
+from threading import Event, Thread
+from uuid import uuid4
+
+
+class MiningJob:
+    """Mines a block in a background thread, so the node keeps serving
+    requests during the proof of work search.
+
+    Attributes:
+        :id: The unique id of the job.
+        :status: 'running', 'done', 'cancelled' or 'failed'.
+        :block: The mined block (once the job is done).
+        :cancelled: The event which stops the proof of work search.
+    """
+
+    def __init__(self, blockchain):
+        self.id = uuid4().hex
+        self.status = 'running'
+        self.block = None
+        self.cancelled = Event()
+        self.__blockchain = blockchain
+        self.__thread = Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        """Starts mining in the background. """
+        self.__thread.start()
+
+    def cancel(self):
+        """Stops the proof of work search. """
+        self.cancelled.set()
+
+    def join(self, timeout=None):
+        """Waits for the job to finish.
+
+        Arguments:
+            :timeout: The maximum number of seconds to wait.
+        """
+        # A job registered by a request which hasn't started it yet
+        if self.__thread.ident is None:
+            return
+        self.__thread.join(timeout)
+
+    def __run(self):
+        try:
+            self.block = self.__blockchain.mine_block(self.cancelled)
+        except Exception as e:
+            print('Mining failed: {}'.format(e))
+        if self.block is not None:
+            self.status = 'done'
+        elif self.cancelled.is_set():
+            self.status = 'cancelled'
+        else:
+            self.status = 'failed'
@@ -0,0 +1,620 @@
+"""Provides the parts shared by the Flask node (node.py) and the async node
+(async_node.py): limits, the request handling and the command line options.
+
+The handlers below validate a request, call the blockchain and build the
+response. They return the response and its status (and optionally headers,
+e.g. for streamed or binary responses), so the nodes only turn them into
+responses of their framework. They block while the blockchain works, the
+async node runs them on its thread pool.
+"""
+
+from argparse import ArgumentParser
+
+from blockchain import Blockchain
+from utility import codec
+from utility.block_json import stream_blocks
+from utility.broadcast import Broadcaster
+from utility.mempool import (DEFAULT_MAX_BLOCK_BYTES,
+                             DEFAULT_MAX_BLOCK_TRANSACTIONS,
+                             DEFAULT_MAX_SIZE)
+from utility.miner import Miner
+from utility.mining_job import MiningJob
+from utility.persistence import DURABILITY_MODES
+from utility.snapshot import read_snapshot
+
+# The number of finished mining jobs whose status can still be fetched
+MINING_JOB_HISTORY = 100
+# The maximum number of block headers/blocks returned per sync request
+MAX_SYNC_BATCH = 2000
+# The maximum number of transactions per batch request
+MAX_TRANSACTION_BATCH = 1000
+
+
+def transaction_dict(values):
+    """Returns the transaction fields of request data as dictionary (the fee
+    only if there is one).
+
+    Arguments:
+        :values: The request data of the transaction.
+    """
+    transaction = {
+        'sender': values['sender'],
+        'recipient': values['recipient'],
+        'amount': values['amount'],
+        'signature': values['signature']
+    }
+    if values.get('fee'):
+        transaction['fee'] = values['fee']
+    return transaction
+
+
+def batch_response(transactions, results):
+    """Returns the response (and its status) for a batch of transactions:
+    the accepted transactions and the positions of the rejected ones.
+
+    Arguments:
+        :transactions: The transactions of the batch as dictionaries.
+        :results: Whether each transaction was accepted.
+    """
+    response = {
+        'transactions': [transaction_dict(tx) for tx, accepted
+                         in zip(transactions, results) if accepted],
+        'rejected': [index for index, accepted in enumerate(results)
+                     if not accepted]
+    }
+    if response['transactions'] or not transactions:
+        response['message'] = 'Transactions added successfully.'
+        return response, 201
+    response['message'] = 'Creating the transactions failed.'
+    return response, 500
+
+
+def peer_values(request, decode, key=None):
+    """Returns the data of a peer request and an error response (None if
+    there is none). Binary data (see utility.codec) is decoded, everything
+    else is read as JSON.
+
+    Arguments:
+        :request: The request (with mimetype, get_data and get_json like
+        Flask's request).
+        :decode: The codec function which decodes the binary data.
+        :key: The key to return the decoded data under (None returns it as
+        it is).
+    """
+    if request.mimetype != codec.CONTENT_TYPE:
+        return request.get_json(), None
+    data = request.get_data()
+    if not codec.is_supported(data):
+        response = {'message': 'Unsupported encoding version.'}
+        return None, (response, 415)
+    try:
+        values = decode(data)
+    except ValueError:
+        response = {'message': 'Invalid data.'}
+        return None, (response, 400)
+    return (values if key is None else {key: values}), None
+
+
+def sign_transactions(wallet, transactions):
+    """Signs the transactions of a batch with the node's wallet and returns
+    them as dictionaries.
+
+    Arguments:
+        :wallet: The node's wallet.
+        :transactions: The recipients, amounts and fees.
+    """
+    return [transaction_dict({
+        'sender': wallet.public_key,
+        'recipient': tx['recipient'],
+        'amount': tx['amount'],
+        'signature': wallet.sign_transaction(
+            wallet.public_key, tx['recipient'], tx['amount'],
+            tx.get('fee', 0)),
+        'fee': tx.get('fee', 0)
+    }) for tx in transactions]
+
+
+def wallet_keys(wallet, blockchain, success, error):
+    """Handles /wallet (after the keys were created or loaded).
+
+    Arguments:
+        :wallet: The node's wallet.
+        :blockchain: The node's blockchain (for the wallet on success).
+        :success: Whether the keys were saved or loaded.
+        :error: The message if they weren't.
+    """
+    if not success:
+        response = {
+            'message': error
+        }
+        return response, 500
+    response = {
+        'public_key': wallet.public_key,
+        'private_key': wallet.private_key,
+        'funds': blockchain.get_balance()
+    }
+    return response, 201
+
+
+def get_balance(wallet, blockchain):
+    """Handles GET /balance. """
+    balance = blockchain.get_balance()
+    if balance is not None:
+        response = {
+            'message': 'Balance fetched successfully.',
+            'funds': balance
+        }
+        return response, 200
+    else:
+        response = {
+            'messsage': 'Loading balance failed.',
+            'wallet_set_up': wallet.public_key is not None
+        }
+        return response, 500
+
+
+def broadcast_transaction(blockchain, request):
+    """Handles POST /broadcast-transaction (a transaction from a peer). """
+    values, error = peer_values(request, codec.decode_transaction)
+    if error:
+        return error
+    if not values:
+        response = {'message': 'No data found.'}
+        return response, 400
+    required = ['sender', 'recipient', 'amount', 'signature']
+    if not all(key in values for key in required):
+        response = {'message': 'Some data is missing.'}
+        return response, 400
+    success = blockchain.add_transaction(
+        values['recipient'],
+        values['sender'],
+        values['signature'],
+        values['amount'],
+        is_receiving=True,
+        fee=values.get('fee', 0))
+    if success:
+        response = {
+            'message': 'Transaction added successfully.',
+            'transaction': transaction_dict(values)
+        }
+        return response, 201
+    else:
+        response = {
+            'message': 'Creating a transaction failed.'
+        }
+        return response, 500
+
+
+def broadcast_block(blockchain, request):
+    """Handles POST /broadcast-block (a block mined by a peer). """
+    values, error = peer_values(request, codec.decode_block, 'block')
+    if error:
+        return error
+    if not values:
+        response = {'message': 'No data found.'}
+        return response, 400
+    if 'block' not in values:
+        response = {'message': 'Some data is missing.'}
+        return response, 400
+    block = values['block']
+    index = block.get('index') if isinstance(block, dict) else None
+    if isinstance(index, bool) or not isinstance(index, int):
+        response = {'message': 'Block seems invalid.'}
+        return response, 409
+    last_block = blockchain.chain.tip
+    if index == last_block.index + 1:
+        if blockchain.add_block(block):
+            response = {'message': 'Block added'}
+            return response, 201
+        else:
+            response = {'message': 'Block seems invalid.'}
+            return response, 409
+    elif index > last_block.index:
+        response = {
+            'message': 'Blockchain differs from local blockchain.'}
+        blockchain.resolve_conflicts = True
+        return response, 200
+    else:
+        response = {
+            'message': 'Blockchain shorter, block not added'}
+        return response, 409
+
+
+def add_transaction(wallet, blockchain, values):
+    """Handles POST /transaction (a transaction of the node's wallet).
+
+    Arguments:
+        :wallet: The node's wallet.
+        :blockchain: The node's blockchain.
+        :values: The JSON data of the request.
+    """
+    if wallet.public_key is None:
+        response = {
+            'message': 'No wallet set up.'
+        }
+        return response, 400
+    if not values:
+        response = {
+            'message': 'No data found.'
+        }
+        return response, 400
+    required_fields = ['recipient', 'amount']
+    if not all(field in values for field in required_fields):
+        response = {
+            'message': 'Required data is missing.'
+        }
+        return response, 400
+    transaction = sign_transactions(wallet, [values])[0]
+    success = blockchain.add_transaction(
+        transaction['recipient'], wallet.public_key,
+        transaction['signature'], transaction['amount'],
+        fee=transaction.get('fee', 0))
+    if success:
+        response = {
+            'message': 'Transaction added successfully.',
+            'transaction': transaction,
+            'funds': blockchain.get_balance()
+        }
+        return response, 201
+    else:
+        response = {
+            'message': 'Creating a transaction failed.'
+        }
+        return response, 500
+
+
+def add_transactions(wallet, blockchain, values):
+    """Handles POST /transactions/batch (transactions of the node's
+    wallet).
+
+    Arguments:
+        :wallet: The node's wallet.
+        :blockchain: The node's blockchain.
+        :values: The JSON data of the request.
+    """
+    if wallet.public_key is None:
+        response = {
+            'message': 'No wallet set up.'
+        }
+        return response, 400
+    if not values or not isinstance(values.get('transactions'), list):
+        response = {
+            'message': 'No data found.'
+        }
+        return response, 400
+    if len(values['transactions']) > MAX_TRANSACTION_BATCH:
+        response = {
+            'message': 'Too many transactions.'
+        }
+        return response, 400
+    required_fields = ['recipient', 'amount']
+    if not all(isinstance(tx, dict) and
+               all(field in tx for field in required_fields)
+               for tx in values['transactions']):
+        response = {
+            'message': 'Required data is missing.'
+        }
+        return response, 400
+    transactions = sign_transactions(wallet, values['transactions'])
+    results = blockchain.add_transactions(transactions)
+    response, status = batch_response(transactions, results)
+    response['funds'] = blockchain.get_balance()
+    return response, status
+
+
+def broadcast_transactions(blockchain, request):
+    """Handles POST /broadcast-transactions (a batch from a peer). """
+    values, error = peer_values(request, codec.decode_transactions,
+                                'transactions')
+    if error:
+        return error
+    if not values or not isinstance(values.get('transactions'), list):
+        response = {'message': 'No data found.'}
+        return response, 400
+    if len(values['transactions']) > MAX_TRANSACTION_BATCH:
+        response = {'message': 'Too many transactions.'}
+        return response, 400
+    required = ['sender', 'recipient', 'amount', 'signature']
+    if not all(isinstance(tx, dict) and all(key in tx for key in required)
+               for tx in values['transactions']):
+        response = {'message': 'Some data is missing.'}
+        return response, 400
+    results = blockchain.add_transactions(values['transactions'],
+                                          is_receiving=True)
+    return batch_response(values['transactions'], results)
+
+
+def mine(wallet, blockchain, jobs):
+    """Handles POST /mine: starts a mining job unless one is running (the
+    caller guards the jobs if other threads change them).
+
+    Arguments:
+        :wallet: The node's wallet.
+        :blockchain: The node's blockchain.
+        :jobs: The node's mining jobs by id (oldest first).
+    """
+    if blockchain.resolve_conflicts:
+        response = {'message': 'Block not added! Resolve conflicts first.'}
+        return response, 409
+    if wallet.public_key is None:
+        response = {
+            'message': 'Adding a block failed.',
+            'wallet_set_up': False
+        }
+        return response, 500
+    running = [job for job in jobs.values() if job.status == 'running']
+    if running:
+        job = running[0]
+        response = {'message': 'Mining in progress.', 'job_id': job.id}
+        return response, 202
+    job = MiningJob(blockchain)
+    jobs[job.id] = job
+    # Forget the oldest finished jobs
+    while len(jobs) > MINING_JOB_HISTORY:
+        jobs.popitem(last=False)
+    job.start()
+    response = {'message': 'Mining started.', 'job_id': job.id}
+    return response, 202
+
+
+def get_mining_job(blockchain, job):
+    """Handles GET /mine/<job_id>.
+
+    Arguments:
+        :blockchain: The node's blockchain.
+        :job: The mining job (None if there's none with the id).
+    """
+    if job is None:
+        response = {'message': 'Mining job not found.'}
+        return response, 404
+    response = {'job_id': job.id, 'status': job.status}
+    if job.status == 'done':
+        response['message'] = 'Block added successfully.'
+        response['block'] = job.block.to_dict()
+        response['funds'] = blockchain.get_balance()
+    elif job.status == 'cancelled':
+        response['message'] = 'Mining cancelled, a competing block was added.'
+    elif job.status == 'failed':
+        response['message'] = 'Adding a block failed.'
+    else:
+        response['message'] = 'Mining in progress.'
+    return response, 200
+
+
+def resolve_conflicts(blockchain):
+    """Handles POST /resolve-conflicts. """
+    replaced = blockchain.resolve()
+    if replaced:
+        response = {'message': 'Chain replaced.'}
+    else:
+        response = {'message': 'Keeping local chain.'}
+    return response, 200
+
+
+def get_open_transactions(blockchain):
+    """Handles GET /transactions. """
+    transactions = blockchain.get_open_transactions()
+    return [tx.to_dict() for tx in transactions], 200
+
+
+def get_chain(blockchain, start, limit):
+    """Handles GET /chain: streams the blocks as JSON array.
+
+    Arguments:
+        :blockchain: The node's blockchain.
+        :start: The index of the first block.
+        :limit: The maximum number of blocks (None for all).
+    """
+    if start < 0 or (limit is not None and limit < 0):
+        response = {'message': 'Invalid range.'}
+        return response, 400
+    # The blocks are read from a snapshot while the response is streamed,
+    # so blocks added in the meantime don't end up in it
+    chain_snapshot = blockchain.chain.snapshot()
+    end = len(chain_snapshot) if limit is None else start + limit
+    blocks = (chain_snapshot[index]
+              for index in range(max(start, chain_snapshot.base),
+                                 min(end, len(chain_snapshot))))
+    return (stream_blocks(blocks), 200,
+            {'Content-Type': 'application/json',
+             'X-Chain-Height': str(len(chain_snapshot))})
+
+
+def get_chain_height(blockchain):
+    """Handles GET /chain/height. """
+    height = blockchain.get_height()
+    response = {
+        'height': height,
+        'tip': blockchain.get_block_hashes(height - 1, height)[0]
+    }
+    return response, 200
+
+
+def get_chain_headers(blockchain, start, limit):
+    """Handles GET /chain/headers.
+
+    Arguments:
+        :blockchain: The node's blockchain.
+        :start: The index of the first header.
+        :limit: The maximum number of headers (None for MAX_SYNC_BATCH).
+    """
+    if limit is None:
+        limit = MAX_SYNC_BATCH
+    limit = min(limit, MAX_SYNC_BATCH)
+    if start < 0 or limit < 0:
+        response = {'message': 'Invalid range.'}
+        return response, 400
+    return blockchain.get_headers(start, start + limit), 200
+
+
+def get_chain_blocks(blockchain, start, end, binary):
+    """Handles GET /chain/blocks.
+
+    Arguments:
+        :blockchain: The node's blockchain.
+        :start: The index of the first block.
+        :end: The index after the last block (None for MAX_SYNC_BATCH
+        blocks).
+        :binary: Whether the peer asked for the binary encoding (otherwise
+        the blocks are streamed as JSON).
+    """
+    if end is None:
+        end = start + MAX_SYNC_BATCH
+    if start < 0 or end < start:
+        response = {'message': 'Invalid range.'}
+        return response, 400
+    end = min(end, start + MAX_SYNC_BATCH)
+    blocks = blockchain.get_blocks(start, end)
+    if binary:
+        return (codec.encode_blocks([block.to_dict() for block in blocks]),
+                200, {'Content-Type': codec.CONTENT_TYPE})
+    return (stream_blocks(blocks), 200,
+            {'Content-Type': 'application/json'})
+
+
+def get_snapshot(blockchain):
+    """Handles GET /snapshot. """
+    return blockchain.get_snapshot(), 200
+
+
+def add_node(blockchain, values):
+    """Handles POST /node.
+
+    Arguments:
+        :blockchain: The node's blockchain.
+        :values: The JSON data of the request.
+    """
+    if not values:
+        response = {
+            'message': 'No data attached.'
+        }
+        return response, 400
+    if 'node' not in values:
+        response = {
+            'message': 'No node data found.'
+        }
+        return response, 400
+    blockchain.add_peer_node(values['node'])
+    response = {
+        'message': 'Node added successfully.',
+        'all_nodes': blockchain.get_peer_nodes()
+    }
+    return response, 201
+
+
+def remove_node(blockchain, node_url):
+    """Handles DELETE /node/<node_url>. """
+    if node_url == '' or node_url is None:
+        response = {
+            'message': 'No node found.'
+        }
+        return response, 400
+    blockchain.remove_peer_node(node_url)
+    response = {
+        'message': 'Node removed',
+        'all_nodes': blockchain.get_peer_nodes()
+    }
+    return response, 200
+
+
+def get_nodes(blockchain):
+    """Handles GET /nodes. """
+    response = {
+        'all_nodes': blockchain.get_peer_nodes()
+    }
+    return response, 200
+
+
+def get_node_stats(blockchain):
+    """Handles GET /nodes/stats. """
+    response = {
+        'nodes': blockchain.get_peer_stats()
+    }
+    return response, 200
+
+
+def argument_parser():
+    """Returns the parser of the command line options both nodes share. """
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=3000)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='number of processes searching proofs of work')
+    parser.add_argument('-t', '--timeout', type=float, default=10,
+                        help='seconds to wait for a peer node to answer')
+    parser.add_argument('-m', '--mempool-size', type=int,
+                        default=DEFAULT_MAX_SIZE,
+                        help='maximum number of open transactions')
+    parser.add_argument('-d', '--durability', default='sync',
+                        choices=DURABILITY_MODES,
+                        help='when changes are written to disk')
+    parser.add_argument('--block-transactions', type=int,
+                        default=DEFAULT_MAX_BLOCK_TRANSACTIONS,
+                        help='maximum number of transactions per mined block')
+    parser.add_argument('--block-bytes', type=int,
+                        default=DEFAULT_MAX_BLOCK_BYTES,
+                        help='maximum encoded size of a mined block')
+    parser.add_argument('--prune', type=int,
+                        help='number of blocks at the tip kept in memory '
+                        '(older ones are read from disk on demand)')
+    parser.add_argument('--snapshot',
+                        help='snapshot file to bootstrap a fresh node from')
+    parser.add_argument('--checkpoint',
+                        help='trusted checkpoint hash of the snapshot')
+    return parser
+
+
+def blockchain_options(args):
+    """Returns the Blockchain arguments (besides the key and the port) set by
+    the parsed command line options.
+
+    Arguments:
+        :args: The parsed command line options (see argument_parser).
+    """
+    return {
+        'miner': Miner(args.workers),
+        'broadcaster': Broadcaster(timeout=args.timeout),
+        'max_open_transactions': args.mempool_size,
+        'durability': args.durability,
+        'max_block_transactions': args.block_transactions,
+        'max_block_bytes': args.block_bytes,
+        'prune_depth': args.prune
+    }
+
+
+def new_blockchain(previous, public_key, port, options, jobs=()):
+    """Creates the blockchain of a node for a wallet. The mining jobs of the
+    previous one are stopped and it's closed first, so its outstanding
+    writes are on disk before the files are loaded again and it can't write
+    to them afterwards.
+
+    Arguments:
+        :previous: The node's previous blockchain (or None).
+        :public_key: The public key of the node's wallet.
+        :port: The port (and id) of the node.
+        :options: The further Blockchain arguments (see blockchain_options).
+        :jobs: The node's mining jobs (see utility.mining_job).
+    """
+    for job in jobs:
+        job.cancel()
+    for job in jobs:
+        job.join()
+    if previous is not None:
+        previous.close()
+    return Blockchain(public_key, port, **options)
+
+
+def bootstrap(blockchain, args):
+    """Bootstraps a fresh blockchain from the snapshot given on the command
+    line (if there is one).
+
+    Arguments:
+        :blockchain: The node's blockchain.
+        :args: The parsed command line options (see argument_parser).
+    """
+    if args.snapshot is None:
+        return
+    # Only the blocks after the snapshot are fetched when resolving
+    try:
+        blockchain.bootstrap(read_snapshot(args.snapshot), args.checkpoint)
+    except (IOError, ValueError):
+        print('Loading the snapshot failed!')
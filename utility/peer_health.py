@@ -0,0 +1,91 @@
+"""Provides the health record the Broadcaster keeps per peer node. """
+
+import time
+
+# Consecutive failures after which a peer is skipped for a while
+QUARANTINE_AFTER = 3
+# Seconds a peer is skipped after QUARANTINE_AFTER failures (doubled with
+# every further failure, up to MAX_BACKOFF)
+BASE_BACKOFF = 5
+MAX_BACKOFF = 300
+# The weight of the latest round-trip in the average latency
+LATENCY_WEIGHT = 0.2
+
+
+class PeerHealth:
+    """Records how a peer node answered our requests.
+
+    A peer which couldn't be reached QUARANTINE_AFTER times in a row is
+    quarantined: requests to it are skipped until its backoff is over, then
+    a single request probes it again (another failure doubles the backoff).
+    Any answer (whatever its status) counts as reachable.
+
+    Attributes:
+        :requests: The number of requests sent to the peer.
+        :failures: The number of requests which didn't reach the peer.
+        :consecutive_failures: The failures since the last answer.
+        :latency: The moving average of the round-trip seconds (None until
+        the peer answered).
+        :last_seen: The time of the last answer (None if it never
+        answered).
+        :retry_at: The monotonic time until which the peer is skipped.
+    """
+    __slots__ = ('requests', 'failures', 'consecutive_failures', 'latency',
+                 'last_seen', 'retry_at')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.last_seen = None
+        self.retry_at = 0
+
+    def is_quarantined(self):
+        """Returns whether requests to the peer are skipped right now. """
+        return time.monotonic() < self.retry_at
+
+    def record_answer(self, latency):
+        """Records a request which the peer answered.
+
+        Arguments:
+            :latency: The round-trip time in seconds.
+        """
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.retry_at = 0
+        self.last_seen = time.time()
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_WEIGHT * (latency - self.latency)
+
+    def record_failure(self):
+        """Records a request which didn't reach the peer (and quarantines
+        it after too many in a row). """
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= QUARANTINE_AFTER:
+            backoff = min(BASE_BACKOFF * 2 ** (
+                self.consecutive_failures - QUARANTINE_AFTER), MAX_BACKOFF)
+            self.retry_at = time.monotonic() + backoff
+
+    def rank(self):
+        """Returns the sort key of the peer: reachable peers first, then by
+        recent failures and latency (unknown latency last). """
+        return (self.is_quarantined(), self.consecutive_failures,
+                self.latency is None, self.latency or 0)
+
+    def to_dict(self):
+        """Returns the health as a JSON serializable dictionary. """
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ms': (round(self.latency * 1000, 1)
+                           if self.latency is not None else None),
+            'last_seen': self.last_seen,
+            'quarantined': self.is_quarantined(),
+            'retry_in': max(0, round(self.retry_at - time.monotonic(), 1))
+        }
@@ -0,0 +1,134 @@
+"""Provides the write scheduling behind the node's durability modes. """
+
+from threading import Condition, Lock, Thread
+import time
+
+# The durability modes: 'sync' writes every change before returning,
+# 'group' lets concurrent changes wait for one shared write and 'async'
+# writes in the background
+DURABILITY_MODES = ('sync', 'group', 'async')
+# Seconds the writer waits for more changes before a group write
+GROUP_WINDOW = 0.002
+# Seconds between two background writes
+ASYNC_INTERVAL = 0.05
+# The number of unwritten changes after which changes wait for the
+# background writer (so a crash loses at most this many)
+MAX_DIRTY = 1000
+
+
+class Persister:
+    """Runs the writes of the node's files according to a durability mode.
+
+    Changes register a write under a name (e.g. 'open_transactions'). A
+    later write for the same name replaces an unwritten earlier one, so a
+    burst of changes only writes the latest state once. The write functions
+    have to capture the state they write (they run on the writer thread).
+
+    Attributes:
+        :mode: The durability mode (see DURABILITY_MODES).
+        :window: The seconds to wait before a group or background write.
+        :max_dirty: The number of unwritten changes after which changes wait
+        for the writer.
+        :write_lock (private): Lets only one thread write at a time.
+        :condition (private): Guards the fields below.
+        :pending (private): The latest unwritten write function per name.
+        :changes (private): The number of changes registered so far.
+        :written (private): The number of changes written so far.
+        :closed (private): Whether the writer thread should stop.
+        :thread (private): The writer thread (not used in sync mode).
+    """
+
+    def __init__(self, mode='sync', window=None, max_dirty=MAX_DIRTY):
+        if mode not in DURABILITY_MODES:
+            raise ValueError('Unknown durability mode: {}'.format(mode))
+        self.mode = mode
+        if window is None:
+            window = GROUP_WINDOW if mode == 'group' else ASYNC_INTERVAL
+        self.window = window
+        self.max_dirty = max_dirty
+        self.__write_lock = Lock()
+        self.__condition = Condition()
+        self.__pending = {}
+        self.__changes = 0
+        self.__written = 0
+        self.__closed = False
+        self.__thread = None
+        if mode != 'sync':
+            self.__thread = Thread(target=self.__run, daemon=True)
+            self.__thread.start()
+
+    def save(self, name, write):
+        """Registers a write (sync mode runs it right away).
+
+        Arguments:
+            :name: The name of the written file.
+            :write: A function without arguments which writes it.
+        """
+        if self.mode == 'sync':
+            with self.__write_lock:
+                self.__write(write)
+            return
+        with self.__condition:
+            self.__pending[name] = write
+            self.__changes += 1
+            self.__condition.notify_all()
+
+    def wait(self):
+        """Waits until the changes registered so far are durable enough for
+        the mode: written in group mode, at most max_dirty behind in async
+        mode. Should be called after releasing the blockchain lock, so other
+        changes can join the same write. """
+        if self.mode == 'sync':
+            return
+        with self.__condition:
+            if self.mode == 'group':
+                target = self.__changes
+            else:
+                target = self.__changes - self.max_dirty
+            while self.__written < target and not self.__closed:
+                self.__condition.wait()
+
+    def flush(self):
+        """Runs all registered writes now. """
+        self.__flush()
+
+    def close(self):
+        """Runs the outstanding writes and stops the writer thread. """
+        self.__flush()
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    self.__condition.wait()
+                if self.__closed:
+                    return
+            # Give other changes the chance to join this write
+            time.sleep(self.window)
+            self.__flush()
+
+    def __flush(self):
+        """Runs the pending writes. New changes can be registered while they
+        run, they're written by the next flush. """
+        with self.__write_lock:
+            with self.__condition:
+                pending = self.__pending
+                changes = self.__changes
+                self.__pending = {}
+            for write in pending.values():
+                self.__write(write)
+            with self.__condition:
+                self.__written = max(self.__written, changes)
+                self.__condition.notify_all()
+
+    @staticmethod
+    def __write(write):
+        try:
+            write()
+        except IOError:
+            print('Saving failed!')
@@ -0,0 +1,72 @@
+"""Provides a reader/writer lock. """
+
+from contextlib import contextmanager
+from threading import Condition, get_ident
+
+
+class RWLock:
+    """A lock which lets any number of readers in at the same time, but a
+    writer only alone.
+
+    Waiting writers keep new readers out, so a steady stream of reads can't
+    starve the writes. The thread holding the write lock may acquire the
+    lock again (for reading or writing), so locked methods can call each
+    other while writing.
+
+    Attributes:
+        :condition (private): Guards the counters below and wakes up waiting
+        threads.
+        :readers (private): The number of threads holding the read lock.
+        :writer (private): The id of the thread holding the write lock.
+        :writer_depth (private): How often the writer acquired the lock.
+        :waiting_writers (private): The number of threads waiting to write.
+    """
+
+    def __init__(self):
+        self.__condition = Condition()
+        self.__readers = 0
+        self.__writer = None
+        self.__writer_depth = 0
+        self.__waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """Holds the lock shared with other readers. """
+        if self.__writer == get_ident():
+            # The writer already excludes everyone else
+            yield
+            return
+        with self.__condition:
+            while self.__writer is not None or self.__waiting_writers:
+                self.__condition.wait()
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Holds the lock exclusively. """
+        thread = get_ident()
+        with self.__condition:
+            if self.__writer != thread:
+                self.__waiting_writers += 1
+                try:
+                    while self.__writer is not None or self.__readers:
+                        self.__condition.wait()
+                finally:
+                    self.__waiting_writers -= 1
+                self.__writer = thread
+            self.__writer_depth += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writer_depth -= 1
+                if not self.__writer_depth:
+                    self.__writer = None
+                    self.__condition.notify_all()
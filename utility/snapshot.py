@@ -0,0 +1,92 @@
+"""Provides the snapshots a fresh node can be bootstrapped from. """
+
+import hashlib
+import json
+
+from block import Block
+from utility.verification import Verification
+
+# The format version of snapshots
+SNAPSHOT_VERSION = 1
+
+
+def create_snapshot(tip, balances, open_transactions):
+    """Returns a snapshot of a chain's state at its tip, sealed with its
+    checkpoint hash.
+
+    A snapshot holds the tip block, the confirmed balances up to it and the
+    open transactions, so a node bootstrapped from it only needs the blocks
+    after the tip. The height, tip hash and balances match the node's
+    balance state, so a snapshot can be restored like the state.
+
+    Arguments:
+        :tip: The tip block as dictionary (with its hash).
+        :balances: The confirmed balances up to the tip.
+        :open_transactions: The open transactions as dictionaries.
+    """
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'height': tip['index'] + 1,
+        'tip_hash': tip['hash'],
+        'tip': tip,
+        'balances': balances,
+        'open_transactions': open_transactions
+    }
+    snapshot['checkpoint'] = checkpoint_hash(snapshot)
+    return snapshot
+
+
+def checkpoint_hash(snapshot):
+    """Returns the checkpoint hash of a snapshot: the SHA-256 hash of its
+    canonical JSON encoding (without the checkpoint itself).
+
+    Arguments:
+        :snapshot: The snapshot as dictionary.
+    """
+    content = {key: value for key, value in snapshot.items()
+               if key != 'checkpoint'}
+    return hashlib.sha256(json.dumps(
+        content, sort_keys=True, separators=(',', ':')).encode('utf8')
+    ).hexdigest()
+
+
+def verify_snapshot(snapshot, checkpoint=None):
+    """Checks a snapshot and raises a ValueError if it's damaged, its tip
+    block isn't valid or it doesn't match the trusted checkpoint.
+
+    Arguments:
+        :snapshot: The snapshot as dictionary.
+        :checkpoint: The trusted checkpoint hash (e.g. published by the
+        node operator). Without it, only damage is detected.
+    """
+    try:
+        if snapshot['version'] != SNAPSHOT_VERSION:
+            raise ValueError('Unsupported snapshot version {}.'.format(
+                snapshot['version']))
+        if snapshot['checkpoint'] != checkpoint_hash(snapshot):
+            raise ValueError('The snapshot is damaged.')
+        if checkpoint is not None and snapshot['checkpoint'] != checkpoint:
+            raise ValueError('The snapshot doesn\'t match the checkpoint.')
+        tip = Block.from_dict(snapshot['tip'])
+        if (tip.hash != snapshot['tip_hash'] or
+                tip.index + 1 != snapshot['height']):
+            raise ValueError('The snapshot\'s tip doesn\'t match its hash.')
+        if tip.index > 0 and not Verification.valid_proof(
+                tip.transactions[:-1], tip.previous_hash, tip.proof):
+            raise ValueError('The snapshot\'s tip has an invalid proof.')
+        if (not isinstance(snapshot['balances'], dict) or
+                not isinstance(snapshot['open_transactions'], list)):
+            raise ValueError('The snapshot\'s state is invalid.')
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError('The snapshot is incomplete.')
+
+
+def read_snapshot(path):
+    """Reads a snapshot file (raises an IOError or ValueError if it can't be
+    read).
+
+    Arguments:
+        :path: The path of the snapshot file.
+    """
+    with open(path, mode='r') as f:
+        return json.loads(f.read())
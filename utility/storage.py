@@ -0,0 +1,536 @@
+"""Provides the on-disk storage engine of a node. """
+
+from array import array
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from block import Block
+from utility import codec
+from utility.addresses import AddressRegistry
+
+
+class BlockStorage:
+    """Persists the blockchain of a node.
+
+    Blocks are kept in an append-only segment file where every record is
+    prefixed with its length and a CRC32 checksum, so persisting a new block
+    only writes that block. An offset index next to the segment allows
+    reading single blocks from a memory map without parsing the whole file,
+    and a hash file holds the (fixed size) hash of every block, so hashes
+    can be looked up without decoding blocks. Block records use the binary
+    codec (see utility.codec) and reference senders and recipients by their
+    ID in an address registry, JSON records of older segments are still
+    read.
+    In pruning mode (hot_blocks), only the records of the last blocks are
+    memory mapped: older records form the archive, which is read from the
+    file on demand, and block hashes are looked up in the hash file instead
+    of an index held in memory.
+    The segment doesn't have to start with the genesis block: a node
+    bootstrapped from a snapshot only stores the blocks from the snapshot's
+    tip on (its base, taken from the first record). Blocks before the base
+    can't be read.
+    The open transactions, the peer nodes, the balance state and the latest
+    snapshot (see utility.snapshot) live in separate files which are
+    replaced atomically.
+
+    Attributes:
+        :block_path: The append-only block segment file.
+        :index_path: The offsets of the records in the block segment.
+        :hashes_path: The binary hashes of the blocks in the block segment.
+        :addresses_path: The addresses referenced by the block records.
+        :transactions_path: The file holding the open transactions.
+        :peers_path: The file holding the peer nodes.
+        :state_path: The file holding the balances at a given height.
+        :snapshot_path: The file holding the latest snapshot.
+        :legacy_path: The single-file snapshot written by older versions.
+        :sync_appends: Whether every append is synced to disk (otherwise the
+        owner calls sync, e.g. after a group of appends).
+        :base: The index of the first stored block.
+        :hot_blocks: The number of blocks at the tip whose records are
+        memory mapped (None maps the whole segment).
+        :closed: Whether writing is stopped (see close).
+        :addresses (private): The address registry of the block records.
+    """
+    # Every record starts with the payload length and its CRC32 checksum
+    RECORD_HEADER = struct.Struct('>II')
+    # The size of a binary SHA-256 block hash
+    HASH_SIZE = 32
+
+    def __init__(self, node_id):
+        self.block_path = 'blockchain-{}.blocks'.format(node_id)
+        self.index_path = 'blockchain-{}.index'.format(node_id)
+        self.hashes_path = 'blockchain-{}.hashes'.format(node_id)
+        self.addresses_path = 'blockchain-{}.addresses'.format(node_id)
+        self.transactions_path = 'blockchain-{}.transactions'.format(node_id)
+        self.peers_path = 'blockchain-{}.peers'.format(node_id)
+        self.state_path = 'blockchain-{}.state'.format(node_id)
+        self.snapshot_path = 'blockchain-{}.snapshot'.format(node_id)
+        self.legacy_path = 'blockchain-{}.txt'.format(node_id)
+        self.sync_appends = True
+        self.base = 0
+        self.hot_blocks = None
+        self.closed = False
+        self.__offsets = array('Q')
+        self.__size = 0
+        self.__map = None
+        # The segment offset the memory map starts at
+        self.__map_offset = 0
+        # Block index by binary hash (built on the first lookup)
+        self.__hash_index = None
+        self.__addresses = AddressRegistry(self.addresses_path)
+
+    def __len__(self):
+        return self.base + len(self.__offsets)
+
+    def open(self):
+        """Loads the offset index and checks it against the block segment.
+
+        Records written after the last indexed one are indexed now. A torn
+        or corrupt record at the end of the segment (e.g. from a crash in the
+        middle of an append) is cut off, so the file ends with the last
+        complete block again.
+        """
+        self.__addresses.load()
+        if not os.path.exists(self.block_path):
+            self.__import_legacy()
+        self.__map = None
+        self.__hash_index = None
+        self.__offsets = array('Q')
+        self.base = 0
+        try:
+            self.__size = os.path.getsize(self.block_path)
+        except OSError:
+            self.__size = 0
+            self.__repair_hashes()
+            return 0
+        try:
+            with open(self.index_path, mode='rb') as f:
+                self.__offsets.frombytes(f.read())
+        except (IOError, ValueError):
+            self.__offsets = array('Q')
+        indexed = len(self.__offsets)
+        # Drop index entries which point beyond the end of the segment
+        while self.__offsets and self.__offsets[-1] >= self.__size:
+            self.__offsets.pop()
+        # Re-check the last indexed record and index the records after it
+        position = self.__offsets.pop() if self.__offsets else 0
+        while position < self.__size:
+            payload = self.__read_record(position)
+            if payload is None:
+                print('Truncating torn block record at offset {}'.format(
+                    position))
+                self.__map = None
+                with open(self.block_path, mode='r+b') as f:
+                    f.truncate(position)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.__size = position
+                break
+            self.__offsets.append(position)
+            position += self.RECORD_HEADER.size + len(payload)
+        if len(self.__offsets) != indexed:
+            self.__write_atomic(self.index_path, [self.__offsets.tobytes()])
+        if self.__offsets:
+            self.base = self.__read_block_at(0)['index']
+        self.__repair_hashes()
+        return len(self)
+
+    def close(self):
+        """Stops writing (e.g. before another instance opens the same files):
+        every later change raises an IOError. Blocks can still be read. """
+        self.closed = True
+
+    def block_hash(self, index):
+        """Returns the stored hash of a block.
+
+        Arguments:
+            :index: The position of the block in the chain.
+        """
+        if index < 0:
+            index += len(self)
+        if not self.base <= index < len(self):
+            raise IndexError('No stored hash for block {}.'.format(index))
+        return self.block_hashes(index, index + 1)[0]
+
+    def block_hashes(self, start, end):
+        """Returns the stored hashes of the blocks in [start, end) (starting
+        at the base at the earliest).
+
+        Arguments:
+            :start: The index of the first block.
+            :end: The index after the last block.
+        """
+        start = max(start, self.base) - self.base
+        end = min(end, len(self)) - self.base
+        if start >= end:
+            return []
+        with open(self.hashes_path, mode='rb') as f:
+            f.seek(start * self.HASH_SIZE)
+            data = f.read((end - start) * self.HASH_SIZE)
+        return [data[position:position + self.HASH_SIZE].hex()
+                for position in range(0, len(data), self.HASH_SIZE)]
+
+    def find_block(self, block_hash):
+        """Returns the index of the block with the given hash or None.
+
+        Arguments:
+            :block_hash: The hash of the block.
+        """
+        try:
+            target = bytes.fromhex(block_hash)
+        except ValueError:
+            return None
+        if self.hot_blocks is not None:
+            return self.__scan_hashes(target)
+        if self.__hash_index is None:
+            with open(self.hashes_path, mode='rb') as f:
+                data = f.read()
+            self.__hash_index = {
+                data[position:position + self.HASH_SIZE]: index
+                for index, position in enumerate(
+                    range(0, len(data), self.HASH_SIZE), self.base)}
+        return self.__hash_index.get(target)
+
+    def read_block(self, index):
+        """Reads and decodes a single block record.
+
+        Arguments:
+            :index: The position of the block in the chain.
+        """
+        if not self.base <= index < len(self):
+            raise IndexError('Block {} is not stored.'.format(index))
+        return self.__read_block_at(index - self.base)
+
+    def __read_block_at(self, position):
+        """Reads the block with the given position in the segment. """
+        payload = self.__read_record(self.__offsets[position])
+        if payload is None:
+            raise IOError('Block record {} is corrupt.'.format(
+                self.base + position))
+        # Segments written by older versions hold JSON records
+        if payload[:1] == b'{':
+            return json.loads(payload.decode('utf8'))
+        return codec.decode_block(payload, self.__addresses)
+
+    def append_block(self, block):
+        """Appends a single block record and syncs it to disk (unless
+        sync_appends is off).
+
+        Arguments:
+            :block: The block as a JSON serializable dictionary.
+        """
+        self.append_blocks([block])
+
+    def append_blocks(self, blocks):
+        """Appends several block records and syncs them to disk at once
+        (unless sync_appends is off).
+
+        Arguments:
+            :blocks: The blocks as JSON serializable dictionaries.
+        """
+        self.__check_open()
+        offsets = array('Q')
+        size = self.__size
+        records = []
+        hashes = []
+        for block in blocks:
+            record = self.__encode_record(block)
+            offsets.append(size)
+            size += len(record)
+            records.append(record)
+            hashes.append(self.__record_hash(block))
+        # The records may reference new addresses, which have to be on disk
+        # before the records
+        self.__addresses.write(self.sync_appends)
+        with open(self.block_path, mode='ab') as f:
+            f.write(b''.join(records))
+            f.flush()
+            if self.sync_appends:
+                os.fsync(f.fileno())
+        start = len(self)
+        self.__offsets.extend(offsets)
+        self.__size = size
+        # The index and the hashes can always be rebuilt from the segment, so
+        # they aren't synced
+        with open(self.index_path, mode='ab') as f:
+            f.write(offsets.tobytes())
+        with open(self.hashes_path, mode='ab') as f:
+            f.write(b''.join(hashes))
+        if self.__hash_index is not None:
+            for index, block_hash in enumerate(hashes, start):
+                self.__hash_index[block_hash] = index
+
+    def sync(self):
+        """Syncs the appended block records (and their addresses) to
+        disk. """
+        self.__addresses.sync()
+        with open(self.block_path, mode='ab') as f:
+            os.fsync(f.fileno())
+
+    def truncate(self, count):
+        """Cuts off all blocks after the given number of blocks (e.g. to
+        replace the blocks after a fork with a peer's blocks).
+
+        Arguments:
+            :count: The number of blocks to keep.
+        """
+        if count >= len(self):
+            return
+        self.__check_open()
+        if count <= self.base:
+            raise ValueError('Blocks before the base can\'t be replaced.')
+        size = self.__offsets[count - self.base]
+        self.__map = None
+        with open(self.block_path, mode='r+b') as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+        del self.__offsets[count - self.base:]
+        self.__size = size
+        self.__write_atomic(self.index_path, [self.__offsets.tobytes()])
+        with open(self.hashes_path, mode='r+b') as f:
+            f.truncate((count - self.base) * self.HASH_SIZE)
+        self.__hash_index = None
+
+    def replace_blocks(self, blocks):
+        """Atomically replaces the whole segment (e.g. after the chain was
+        replaced by a peer's chain). The index of the first block becomes the
+        new base.
+
+        Arguments:
+            :blocks: The blocks as JSON serializable dictionaries (any
+            iterable, the blocks are written one after the other).
+        """
+        offsets = array('Q')
+        hashes = []
+        size = 0
+        base = 0
+
+        def records():
+            nonlocal size, base
+            for block in blocks:
+                if not offsets:
+                    base = block['index']
+                record = self.__encode_record(block)
+                offsets.append(size)
+                hashes.append(self.__record_hash(block))
+                size += len(record)
+                yield record
+            # Written before the new segment replaces the old one
+            self.__addresses.write()
+        self.__write_atomic(self.block_path, records())
+        self.__write_atomic(self.index_path, [offsets.tobytes()])
+        self.__write_atomic(self.hashes_path, hashes)
+        self.__map = None
+        self.__hash_index = None
+        self.__offsets = offsets
+        self.__size = size
+        self.base = base
+
+    def load_open_transactions(self):
+        """Returns the stored open transactions as dictionaries and the chain
+        height they were saved at (None for files of older versions). """
+        stored = self.__load_json(self.transactions_path, [])
+        if isinstance(stored, list):
+            return stored, None
+        return stored['transactions'], stored['height']
+
+    def save_open_transactions(self, transactions, height):
+        """Atomically stores the open transactions.
+
+        Arguments:
+            :transactions: The transactions as JSON serializable dictionaries.
+            :height: The chain height the transactions are open at (blocks
+            after it may include some of them if they're stored first).
+        """
+        stored = {'height': height, 'transactions': transactions}
+        self.__write_atomic(self.transactions_path,
+                            [json.dumps(stored).encode('utf8')])
+
+    def load_peer_nodes(self):
+        """Returns the stored peer nodes. """
+        return self.__load_json(self.peers_path, [])
+
+    def save_peer_nodes(self, peer_nodes):
+        """Atomically stores the peer nodes.
+
+        Arguments:
+            :peer_nodes: The peer nodes which should be stored.
+        """
+        self.__write_atomic(self.peers_path,
+                            [json.dumps(list(peer_nodes)).encode('utf8')])
+
+    def load_state(self):
+        """Returns the stored balance state or None. """
+        return self.__load_json(self.state_path, None)
+
+    def save_state(self, state):
+        """Atomically stores the balance state.
+
+        Arguments:
+            :state: The state as a JSON serializable dictionary.
+        """
+        self.__write_atomic(self.state_path,
+                            [json.dumps(state).encode('utf8')])
+
+    def load_snapshot(self):
+        """Returns the stored snapshot or None. """
+        return self.__load_json(self.snapshot_path, None)
+
+    def save_snapshot(self, snapshot):
+        """Atomically stores a snapshot.
+
+        Arguments:
+            :snapshot: The snapshot as a JSON serializable dictionary.
+        """
+        self.__write_atomic(self.snapshot_path,
+                            [json.dumps(snapshot).encode('utf8')])
+
+    def __repair_hashes(self):
+        """Makes the hash file match the block segment again, dropping hashes
+        of cut off blocks and adding the ones missing after a crash. """
+        try:
+            count = os.path.getsize(self.hashes_path) // self.HASH_SIZE
+        except OSError:
+            count = 0
+        count = min(count, len(self.__offsets))
+        # A crash while the whole chain was replaced can leave the hashes of
+        # the old chain behind, so the last kept hash is checked as well
+        if count and (self.block_hash(self.base + count - 1) !=
+                      self.__record_hash(
+                          self.__read_block_at(count - 1)).hex()):
+            count = 0
+        with open(self.hashes_path, mode='ab') as f:
+            f.truncate(count * self.HASH_SIZE)
+            for position in range(count, len(self.__offsets)):
+                f.write(self.__record_hash(self.__read_block_at(position)))
+
+    def __scan_hashes(self, target):
+        """Returns the index of the block with the given binary hash by
+        reading through the hash file (in pruning mode) or None. """
+        chunk_size = self.HASH_SIZE * 65536
+        position = 0
+        with open(self.hashes_path, mode='rb') as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    return None
+                found = data.find(target)
+                # Only matches at hash boundaries count
+                while found != -1 and found % self.HASH_SIZE:
+                    found = data.find(target, found + 1)
+                if found != -1:
+                    return self.base + (position + found) // self.HASH_SIZE
+                position += len(data)
+
+    @staticmethod
+    def __record_hash(block):
+        """Returns the binary hash of a stored block (records written before
+        hashes were stored get theirs computed). """
+        if 'hash' in block:
+            return bytes.fromhex(block['hash'])
+        return bytes.fromhex(Block.from_dict(block).hash)
+
+    def __encode_record(self, block):
+        payload = codec.encode_block(block, self.__addresses)
+        return self.RECORD_HEADER.pack(
+            len(payload), zlib.crc32(payload)) + payload
+
+    def __read_record(self, position):
+        """Returns the payload of the record at the given position or None if
+        the record is incomplete or its checksum doesn't match. """
+        header_end = position + self.RECORD_HEADER.size
+        if header_end > self.__size:
+            return None
+        if position < self.__archive_end():
+            return self.__read_archived(position)
+        data, offset = self.__mapped(header_end)
+        length, checksum = self.RECORD_HEADER.unpack_from(
+            data, position - offset)
+        if header_end + length > self.__size:
+            return None
+        data, offset = self.__mapped(header_end + length)
+        payload = data[header_end - offset:header_end + length - offset]
+        if zlib.crc32(payload) != checksum:
+            return None
+        return payload
+
+    def __read_archived(self, position):
+        """Reads a record before the memory mapped part of the segment from
+        the file (so it doesn't stay in memory). """
+        with open(self.block_path, mode='rb') as f:
+            f.seek(position)
+            header = f.read(self.RECORD_HEADER.size)
+            length, checksum = self.RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            return None
+        return payload
+
+    def __archive_end(self):
+        """Returns the offset of the first memory mapped record (0 unless in
+        pruning mode). """
+        if (self.hot_blocks is None or
+                len(self.__offsets) <= self.hot_blocks):
+            return 0
+        return self.__offsets[len(self.__offsets) - self.hot_blocks]
+
+    def __mapped(self, end):
+        """Returns a memory map of the segment which covers the given
+        offset and the offset it starts at, remapping the file if it has
+        grown since (in pruning mode, the map then starts at the first hot
+        record). """
+        data = self.__map
+        if data is None or self.__map_offset + len(data) < end:
+            # Maps have to start at a multiple of the allocation granularity
+            offset = (self.__archive_end() // mmap.ALLOCATIONGRANULARITY *
+                      mmap.ALLOCATIONGRANULARITY)
+            with open(self.block_path, mode='rb') as f:
+                data = mmap.mmap(f.fileno(), self.__size - offset,
+                                 access=mmap.ACCESS_READ, offset=offset)
+            self.__map = data
+            self.__map_offset = offset
+        return data, self.__map_offset
+
+    @staticmethod
+    def __load_json(path, default):
+        try:
+            with open(path, mode='r') as f:
+                return json.loads(f.read())
+        except (IOError, ValueError):
+            return default
+
+    def __check_open(self):
+        if self.closed:
+            raise IOError('The block storage is closed.')
+
+    def __write_atomic(self, path, chunks):
+        """Writes a file next to the target, syncs it and renames it over the
+        target, so readers never see a partially written file. """
+        self.__check_open()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode='wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def __import_legacy(self):
+        """Converts the single-file snapshot of older versions (chain, open
+        transactions and peer nodes on three JSON lines) into the new
+        files. """
+        try:
+            with open(self.legacy_path, mode='r') as f:
+                file_content = f.readlines()
+            blockchain = json.loads(file_content[0][:-1])
+            open_transactions = json.loads(file_content[1][:-1])
+            peer_nodes = json.loads(file_content[2])
+        except (IOError, IndexError, ValueError):
+            return
+        self.save_open_transactions(open_transactions, len(blockchain))
+        self.save_peer_nodes(peer_nodes)
+        self.replace_blocks(blockchain)
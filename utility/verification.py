@@ -1,8 +1,38 @@
 """Provides verification's methods. """
 
-from utility.hash_util import hash_string_256, hash_block
+from concurrent.futures import ProcessPoolExecutor
+
+from utility.hash_util import hash_string_256
 from wallet import Wallet
 
+# Chains with fewer blocks to check than this are verified in-process
+CHAIN_POOL_THRESHOLD = 256
+
+_chain_pool = None
+
+
+def _verify_link(previous_block, block):
+    """Checks a block against its predecessor (its stored previous hash and
+    its proof of work). """
+    return (block.previous_hash == previous_block.hash and
+            Verification.valid_proof(block.transactions[:-1],
+                                     block.previous_hash, block.proof))
+
+
+def _is_number(value):
+    """Checks if a value is a number (bools are ints, but not amounts). """
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _valid_transaction_fields(transaction):
+    """Checks the types of a transaction's fields (the fields of a malformed
+    transaction, e.g. a bool amount, can't be booked or encoded). """
+    return (isinstance(transaction.sender, str) and
+            isinstance(transaction.recipient, str) and
+            isinstance(transaction.signature, str) and
+            _is_number(transaction.amount) and
+            _is_number(transaction.fee))
+
 
 class Verification:
     @staticmethod
@@ -12,19 +42,73 @@ class Verification:
         guess_hash = hash_string_256(guess)
         return guess_hash[0:2] == '00'
 
-    @classmethod
-    def verify_chain(cls, blockchain):
-        """Verify if the new block contains the previous block as
-        first element. """
-        for (index, block) in enumerate(blockchain):
-            if index == 0:
-                continue
-            if block.previous_hash != hash_block(blockchain[index - 1]):
-                return False
-            if not cls.valid_proof(block.transactions[:-1],
-                                   block.previous_hash, block.proof):
-                return False
-        return True
+    @staticmethod
+    def verify_chain(blockchain, start=1, previous_block=None):
+        """Verify if every block contains the hash of its previous block and a
+        valid proof of work.
+
+        Every block is checked independently against its predecessor, so
+        long chains are checked across a process pool.
+
+        Arguments:
+            :blockchain: The chain which should be verified.
+            :start: The index of the first block to check (the blocks before
+            are trusted, e.g. because they're shared with the local chain).
+            :previous_block: The trusted block preceding blockchain[start]
+            (defaults to blockchain[start - 1], so the check starts at 1 at
+            the earliest).
+        """
+        global _chain_pool
+        if previous_block is None:
+            start = max(start, 1)
+            if start < len(blockchain):
+                previous_block = blockchain[start - 1]
+        if start >= len(blockchain):
+            return True
+        blocks = blockchain[start:]
+        previous_blocks = [previous_block] + blocks[:-1]
+        if len(blocks) < CHAIN_POOL_THRESHOLD:
+            return all(map(_verify_link, previous_blocks, blocks))
+        if _chain_pool is None:
+            _chain_pool = ProcessPoolExecutor()
+        return all(_chain_pool.map(
+            _verify_link, previous_blocks, blocks,
+            chunksize=CHAIN_POOL_THRESHOLD))
+
+    @staticmethod
+    def valid_fields(block):
+        """Checks the types of a block's fields and of its transactions'
+        fields. A peer's block with e.g. a string timestamp can still have a
+        valid proof of work, but it can't be stored.
+
+        Arguments:
+            :block: The block which should be checked.
+        """
+        return (isinstance(block.index, int) and
+                not isinstance(block.index, bool) and block.index >= 0 and
+                isinstance(block.previous_hash, str) and
+                _is_number(block.timestamp) and _is_number(block.proof) and
+                all(_valid_transaction_fields(tx)
+                    for tx in block.transactions))
+
+    @staticmethod
+    def fork_point(local_chain, blockchain):
+        """Returns the index of the first block of a (longer) chain which
+        differs from the local chain, or 0 if they don't share any block.
+
+        The search starts at the tip, so it only looks at as many local
+        blocks as the fork is long.
+
+        Arguments:
+            :local_chain: The local (trusted) chain.
+            :blockchain: The chain received from a peer.
+        """
+        for index in range(min(len(local_chain), len(blockchain) - 1), 0,
+                           -1):
+            if (blockchain[index].previous_hash ==
+                    local_chain[index - 1].hash):
+                return index
+        return 0
 
     @staticmethod
     def verify_transaction(transaction, get_balance, check_funds=True):
@@ -33,9 +117,14 @@ class Verification:
         Arguments:
             :transaction: The transaction has to be verified
         """
+        if not _valid_transaction_fields(transaction):
+            return False
+        # A negative fee would take coins from the miner
+        if transaction.fee < 0:
+            return False
         if check_funds:
             sender_balance = get_balance(transaction.sender)
-            return (sender_balance >= transaction.amount and
+            return (sender_balance >= transaction.amount + transaction.fee and
                     Wallet.verify_transaction(transaction))
         else:
             return Wallet.verify_transaction(transaction)
@@ -43,5 +132,4 @@ class Verification:
     @classmethod
     def verify_transactions(cls, open_transactions, get_balance):
         """Verifies all transactions. """
-        return all([cls.verify_transaction(tx, get_balance, False)
-                    for tx in open_transactions])
+        return all(Wallet.verify_transactions(open_transactions))
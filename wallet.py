@@ -1,8 +1,71 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from threading import Lock
+
 from Crypto.PublicKey import RSA
 from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
+import json
+
+# The number of parsed public keys (and their verifiers) kept in memory
+KEY_CACHE_SIZE = 1024
+# The number of transactions whose valid signature is remembered
+SIGNATURE_CACHE_SIZE = 100000
+# Batches smaller than this are verified in-process
+BATCH_POOL_THRESHOLD = 64
+# The tag in front of the signed data of transactions with a fee
+SIGNED_DATA_VERSION = 'v2:'
+
+_verified_signatures = OrderedDict()
+_verified_signatures_lock = Lock()
+_batch_pool = None
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _verifier(sender):
+    return PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(sender)))
+
+
+def _signed_data(sender, recipient, amount, fee):
+    """Returns the signed data of a transaction. Without a fee it's the data
+    signed before fees existed, with a fee the fields are encoded as a tagged
+    JSON list, so no other amount and fee give the same data (the plain
+    concatenation can't tell amount 15 from amount 1 with fee 5). """
+    if fee:
+        fields = [sender, recipient, amount, fee]
+        return (SIGNED_DATA_VERSION + json.dumps(
+            fields, separators=(',', ':'))).encode('utf8')
+    return (str(sender) + str(recipient) + str(amount)).encode('utf8')
+
+
+def _verify_signature(sender, recipient, amount, signature, fee=0):
+    try:
+        h = SHA256.new(_signed_data(sender, recipient, amount, fee))
+        return _verifier(sender).verify(h, binascii.unhexlify(signature))
+    except (ValueError, TypeError):
+        # A malformed key or signature (e.g. no valid hex) only rejects this
+        # transaction, not the whole batch it came with
+        return False
+
+
+def _signature_key(transaction):
+    """Returns the key identifying a signed transaction in the cache. """
+    return transaction.id
+
+
+def _signature_args(transaction):
+    return (transaction.sender, transaction.recipient,
+            transaction.amount, transaction.signature, transaction.fee)
+
+
+def _remember_signature(key):
+    with _verified_signatures_lock:
+        _verified_signatures[key] = True
+        if len(_verified_signatures) > SIGNATURE_CACHE_SIZE:
+            _verified_signatures.popitem(last=False)
 
 
 class Wallet:
@@ -52,18 +115,60 @@ class Wallet:
             .hexlify(public_key.exportKey(format='DER'))
             .decode('ascii'))
 
-    def sign_transaction(self, sender, recipient, amount):
+    def sign_transaction(self, sender, recipient, amount, fee=0):
         signer = PKCS1_v1_5.new(RSA.importKey(
             binascii.unhexlify(self.private_key)))
-        h = SHA256.new((str(sender) + str(recipient) + 
-                        str(amount)).encode('utf8'))
+        h = SHA256.new(_signed_data(sender, recipient, amount, fee))
         signature = signer.sign(h)
         return binascii.hexlify(signature).decode('ascii')
 
     @staticmethod
     def verify_transaction(transaction):
-        public_key = RSA.importKey(binascii.unhexlify(transaction.sender))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(transaction.sender) + str(transaction.recipient) + 
-                        str(transaction.amount)).encode('utf8'))
-        return verifier.verify(h, binascii.unhexlify(transaction.signature))
+        """Verifies the signature of a transaction.
+
+        Parsed public keys are cached per sender and valid signatures are
+        remembered, so a transaction checked on admission isn't verified
+        again when it's mined.
+
+        Arguments:
+            :transaction: The transaction which should be verified.
+        """
+        key = _signature_key(transaction)
+        if key in _verified_signatures:
+            return True
+        if not _verify_signature(*_signature_args(transaction)):
+            return False
+        _remember_signature(key)
+        return True
+
+    @staticmethod
+    def verify_transactions(transactions, workers=None):
+        """Verifies the signatures of several transactions and returns the
+        results in the same order. Large batches are spread across a process
+        pool.
+
+        Arguments:
+            :transactions: The transactions which should be verified.
+            :workers: The number of processes of the pool (defaults to the
+            number of CPUs, only used when the pool is started).
+        """
+        global _batch_pool
+        keys = [_signature_key(tx) for tx in transactions]
+        unverified = [(key, _signature_args(tx))
+                      for key, tx in zip(keys, transactions)
+                      if key not in _verified_signatures]
+        if len(unverified) < BATCH_POOL_THRESHOLD:
+            results = [_verify_signature(*args) for _, args in unverified]
+        else:
+            if _batch_pool is None:
+                _batch_pool = ProcessPoolExecutor(workers)
+            results = list(_batch_pool.map(
+                _verify_signature, *zip(*[args for _, args in unverified]),
+                chunksize=BATCH_POOL_THRESHOLD))
+        invalid_keys = set()
+        for (key, _), valid in zip(unverified, results):
+            if valid:
+                _remember_signature(key)
+            else:
+                invalid_keys.add(key)
+        return [key not in invalid_keys for key in keys]